@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: chunked AEAD part encryption throughput and ranged decryption cost.
+
+Reads and seals multipart-sized parts the way the bot does (one ObjectCipher
+per object, parts sealed independently in a thread pool) and compares that with
+just reading the parts, i.e. the CPU the encryption adds per uploaded GB. Also
+times ranged reads to show a seek only opens the chunks it covers. Runs
+offline; needs the optional ``cryptography`` package.
+
+    python benchmarks/bench_encryption.py [--size-mb 256] [--threads 1 4 8]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encryption import ObjectCipher, CIPHERS, ENCRYPTION_CHUNK, available  # noqa: E402
+
+PART_SIZE = 16 * 1024 * 1024  # bot.CHUNK_SIZE
+
+
+def run_parts(path, size, threads, seal=None):
+    """Read every part (sealing it if ``seal``) on ``threads`` workers; returns seconds"""
+    def part(offset):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read(PART_SIZE)
+        return seal(data, offset) if seal else data
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(part, range(0, size, PART_SIZE)))
+    return time.perf_counter() - start
+
+
+def bench_ranges(cipher, sealed, size, count):
+    """Average time to open a random 1MB range (what a player seek costs)"""
+    length = 1024 * 1024
+    elapsed = 0.0
+    for _ in range(count):
+        start = random.randrange(0, max(1, size - length))
+        end = min(size, start + length) - 1
+        cipher_start, cipher_end, first = cipher.ciphertext_range(start, end)
+        began = time.perf_counter()
+        plaintext = b"".join(cipher.decrypt_stream(
+            [sealed[cipher_start:cipher_end + 1]], first, start - first * cipher.chunk_size, end - start + 1
+        ))
+        elapsed += time.perf_counter() - began
+        assert len(plaintext) == end - start + 1
+    return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256, help="object size to seal")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--ranges", type=int, default=50, help="random 1MB range reads to time")
+    args = parser.parse_args()
+
+    if not available():
+        print("cryptography is not installed: pip install cryptography")
+        return 1
+
+    size = args.size_mb * 1024 * 1024
+    data = os.urandom(size)
+    parts = [(data[offset:offset + PART_SIZE], offset) for offset in range(0, size, PART_SIZE)]
+    print(f"{args.size_mb} MB object, {len(parts)} x {PART_SIZE // (1024 * 1024)} MB parts, "
+          f"{ENCRYPTION_CHUNK // 1024} KB cipher chunks, {os.cpu_count()} CPUs")
+
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(data)
+        f.flush()
+        run_parts(f.name, size, 1)  # Warm the page cache
+        for threads in args.threads:
+            baseline = run_parts(f.name, size, threads)
+            print(f"\n  threads={threads:<2} read only        {size / baseline / 1e6:>7.0f} MB/s")
+            for algorithm in CIPHERS:
+                cipher = ObjectCipher.new(algorithm, size)
+                sealed = run_parts(f.name, size, threads, cipher.encrypt_range)
+                added = (sealed - baseline) / (size / 1e9)
+                print(f"  threads={threads:<2} {algorithm:<17}{size / sealed / 1e6:>7.0f} MB/s  "
+                      f"(+{added:.2f}s per GB, {size / sealed * 8 / 1e9:.1f} Gbit/s uplink ceiling)")
+
+    print("\n  Full decrypt and random 1MB range (seek) decrypt:")
+    for algorithm in CIPHERS:
+        cipher = ObjectCipher.new(algorithm, size)
+        sealed = b"".join(cipher.encrypt_range(part, offset) for part, offset in parts)
+        began = time.perf_counter()
+        total = sum(len(chunk) for chunk in cipher.decrypt_stream([sealed[i:i + 256 * 1024]
+                                                                   for i in range(0, len(sealed), 256 * 1024)]))
+        full = time.perf_counter() - began
+        assert total == size
+        seek = bench_ranges(cipher, sealed, size, args.ranges)
+        print(f"  {algorithm:<17} full {size / full / 1e6:>6.0f} MB/s | 1MB range {seek * 1000:6.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: local SigV4 presigner vs boto3 generate_presigned_url.
+
+Runs offline with dummy credentials. Without boto3 installed only the local
+presigner is timed.
+
+    python benchmarks/bench_presign.py [--sizes 10000 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from presigner import SigV4Presigner  # noqa: E402
+
+ACCESS_KEY = "AKIDEXAMPLE"
+SECRET_KEY = "wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY"
+REGION = "us-east-1"
+BUCKET = "bench-bucket"
+EXPIRES = 604800
+
+
+def make_keys(count):
+    return [f"{1700000000 + i}_video file {i:06d}.mp4" for i in range(count)]
+
+
+def boto3_client():
+    try:
+        import boto3
+    except ImportError:
+        return None
+    session = boto3.Session(aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_KEY, region_name=REGION)
+    return session.client(
+        's3',
+        endpoint_url=f'https://s3.{REGION}.wasabisys.com',
+        config=boto3.session.Config(
+            signature_version='s3v4',
+            s3={'addressing_style': 'virtual', 'payload_signing_enabled': False}
+        )
+    )
+
+
+def verify(client, presigner, keys):
+    """Compare GET and upload_part (PUT with partNumber/uploadId) URLs, signing ours with boto3's timestamp"""
+    cases = [
+        ('get_object', {}, "GET", None),
+        ('upload_part', {'PartNumber': 7, 'UploadId': 'u/p+load~ID=1'}, "PUT", {'partNumber': 7, 'uploadId': 'u/p+load~ID=1'}),
+    ]
+    for key in keys:
+        for operation, extra, method, params in cases:
+            expected = client.generate_presigned_url(
+                operation, Params={'Bucket': BUCKET, 'Key': key, **extra}, ExpiresIn=EXPIRES
+            )
+            stamp = parse_qs(urlsplit(expected).query)['X-Amz-Date'][0]
+            now = datetime.datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=datetime.timezone.utc)
+            actual = presigner.presign(key, expires=EXPIRES, method=method, params=params, now=now)
+            if actual != expected:
+                print(f"MISMATCH for {operation} {key!r}\n  boto3: {expected}\n  local: {actual}")
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--boto3-limit", type=int, default=20000,
+                        help="time boto3 on at most this many keys and extrapolate")
+    args = parser.parse_args()
+
+    presigner = SigV4Presigner(ACCESS_KEY, SECRET_KEY, REGION, BUCKET)
+    client = boto3_client()
+
+    if client is not None:
+        sample = make_keys(50) + ["dir/ünïcødé ~x+y=z&.txt"]
+        print(f"URLs identical to boto3: {'yes' if verify(client, presigner, sample) else 'NO'}")
+    else:
+        print("boto3 not installed: timing local presigner only")
+
+    for size in args.sizes:
+        keys = make_keys(size)
+
+        start = time.perf_counter()
+        presigner.presign_many(keys, expires=EXPIRES)
+        local = time.perf_counter() - start
+        line = f"{size:>7} keys | local {local:7.3f}s ({size / local:>10,.0f}/s)"
+
+        if client is not None:
+            timed = keys[:args.boto3_limit]
+            start = time.perf_counter()
+            for key in timed:
+                client.generate_presigned_url('get_object', Params={'Bucket': BUCKET, 'Key': key}, ExpiresIn=EXPIRES)
+            boto = (time.perf_counter() - start) * size / len(timed)
+            estimated = " (extrapolated)" if len(timed) < size else ""
+            line += f" | boto3 {boto:7.3f}s{estimated} | speedup {boto / local:5.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
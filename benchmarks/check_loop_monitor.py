@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Self-check for the loop watchdog's debug mode (what loadtest --fail-on-block-ms relies on).
+
+Runs a loop with a monitor in fail mode, injects a blocking time.sleep and
+checks that monitor.check() fails and names the sleeping line, then checks
+that a loop doing only short non-blocking work passes. Runs offline.
+
+    python benchmarks/check_loop_monitor.py [--fail-ms 100] [--block-ms 300]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# loop_monitor reads the bot's configuration at import time
+for name, value in {"API_ID": "1", "API_HASH": "check", "BOT_TOKEN": "1:check", "ADMIN_ID": "1",
+                    "WASABI_ACCESS_KEY": "check", "WASABI_SECRET_KEY": "check", "WASABI_BUCKET": "check"}.items():
+    os.environ.setdefault(name, value)
+
+from loop_monitor import LoopMonitor, LoopBlockedError  # noqa: E402
+
+
+def blocking_handler(block_ms):
+    time.sleep(block_ms / 1000)  # The injected block
+
+
+async def run(monitor, block_ms):
+    monitor.start(asyncio.get_running_loop())
+    await asyncio.sleep(0.2)
+    if block_ms:
+        blocking_handler(block_ms)
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)  # Let the ticker record the lag
+    monitor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fail-ms", type=int, default=100)
+    parser.add_argument("--block-ms", type=int, default=300)
+    args = parser.parse_args()
+    failed = False
+
+    blocked = LoopMonitor(threshold_ms=args.fail_ms, fail_ms=args.fail_ms)
+    asyncio.run(run(blocked, args.block_ms))
+    try:
+        blocked.check()
+        print(f"FAIL: a {args.block_ms}ms time.sleep passed check()")
+        failed = True
+    except LoopBlockedError as e:
+        print(f"blocked loop: {e}")
+        if "blocking_handler" not in str(e):
+            print("FAIL: the violation does not name blocking_handler")
+            failed = True
+
+    clean = LoopMonitor(threshold_ms=args.fail_ms, fail_ms=args.fail_ms)
+    asyncio.run(run(clean, 0))
+    try:
+        clean.check()
+        print(f"clean loop: passed (max lag {clean.histogram.max:.1f}ms)")
+    except LoopBlockedError as e:
+        print(f"FAIL: clean loop reported {e}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
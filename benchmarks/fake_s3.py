@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Minimal local S3 stand-in for load tests (path-style, no auth, optional latency).
+
+Implements just what the bot uses: HEAD bucket, PUT/GET/HEAD/DELETE object,
+multipart create/upload/complete/abort, upload-part-copy and ListObjectsV2.
+Bodies are discarded by default (only size and ETag are kept) so long runs
+don't hold gigabytes in memory; pass --keep-data to store them.
+
+    python benchmarks/fake_s3.py --port 9000 [--latency-ms 20] [--bandwidth-mbps 200]
+"""
+import re
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+S3_NS = 'xmlns="http://s3.amazonaws.com/doc/2006-03-01/"'
+
+
+class StoredObject:
+    def __init__(self, data, size, etag, headers):
+        self.data = data  # None when bodies are discarded
+        self.size = size
+        self.etag = etag
+        self.headers = headers
+        self.modified = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def body(self, start=0, end=None):
+        end = self.size if end is None else end
+        if self.data is not None:
+            return self.data[start:end]
+        return bytes(end - start)
+
+
+class FakeS3:
+    """In-memory buckets shared by all request threads"""
+
+    def __init__(self, keep_data=False, latency=0.0, bandwidth=0):
+        self.keep_data = keep_data
+        self.latency = latency
+        self.bandwidth = bandwidth  # bytes/s per request, 0 = unlimited
+        self.objects = {}  # (bucket, key) -> StoredObject
+        self.uploads = {}  # upload id -> {"bucket", "key", "headers", "parts": {n: StoredObject}}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def make_object(self, data, headers):
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        return StoredObject(data if self.keep_data else None, len(data), etag, headers)
+
+
+def _decode_aws_chunked(body):
+    """Strip aws-chunked framing (botocore sends trailing checksums this way)"""
+    out = bytearray()
+    pos = 0
+    while True:
+        line_end = body.index(b"\r\n", pos)
+        size = int(body[pos:line_end].split(b";")[0], 16)
+        pos = line_end + 2
+        if size == 0:
+            return bytes(out)
+        out += body[pos:pos + size]
+        pos += size + 2
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeS3/1.0"
+    s3 = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- Plumbing ---
+    def _parse(self):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if "aws-chunked" in self.headers.get("Content-Encoding", "") or \
+                self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            body = _decode_aws_chunked(body)
+        self._throttle(len(body))
+        return body
+
+    def _throttle(self, size):
+        delay = self.s3.latency + (size / self.s3.bandwidth if self.s3.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+
+    def _respond(self, status, body=b"", headers=None, content_type="application/xml"):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if (body or self.command != "HEAD") and "Content-Type" not in (headers or {}):
+            self.send_header("Content-Type", content_type)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status, code, message=""):
+        self._respond(status, f"{XML_HEADER}<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+    def _object_headers(self, headers):
+        keep = ("Content-Type", "Content-Encoding", "Content-Disposition", "Cache-Control")
+        result = {name: headers[name] for name in keep if headers.get(name)}
+        for name, value in headers.items():
+            if name.lower().startswith("x-amz-meta-"):
+                result[name.lower()] = value
+        return result
+
+    # --- Verbs ---
+    def do_HEAD(self):
+        bucket, key, _ = self._parse()
+        self._throttle(0)
+        if not key:
+            return self._respond(200)
+        obj = self.s3.objects.get((bucket, key))
+        if obj is None:
+            return self._respond(404)
+        self._respond(200, headers={**obj.headers, "ETag": obj.etag, "Content-Length": str(obj.size),
+                                    "Accept-Ranges": "bytes"})
+
+    def do_GET(self):
+        bucket, key, query = self._parse()
+        if not key:
+            return self._list_uploads(bucket) if "uploads" in query else self._list(bucket, query)
+        obj = self.s3.objects.get((bucket, key))
+        if obj is None:
+            return self._error(404, "NoSuchKey", key)
+        start, end, status = 0, obj.size, 200
+        headers = {**obj.headers, "ETag": obj.etag, "Accept-Ranges": "bytes"}
+        match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if match and obj.size:
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last) + 1 if last else obj.size, obj.size)
+            else:
+                start = max(0, obj.size - int(last))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{obj.size}"
+        body = obj.body(start, end)
+        self._throttle(len(body))
+        self._respond(status, body, headers, content_type=obj.headers.get("Content-Type", "application/octet-stream"))
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        if not key:
+            self._read_body()
+            return self._respond(200)
+        copy_source = self.headers.get("x-amz-copy-source")
+        if "uploadId" in query:
+            upload = self.s3.uploads.get(query["uploadId"])
+            if upload is None:
+                self._read_body()
+                return self._error(404, "NoSuchUpload")
+            if copy_source:
+                part = self._copy_part(copy_source)
+                if part is None:
+                    return self._error(404, "NoSuchKey", copy_source)
+                upload["parts"][int(query["partNumber"])] = part
+                return self._respond(200, f"{XML_HEADER}<CopyPartResult {S3_NS}><ETag>{escape(part.etag)}</ETag>"
+                                          f"<LastModified>{part.modified}</LastModified></CopyPartResult>")
+            part = self.s3.make_object(self._read_body(), {})
+            upload["parts"][int(query["partNumber"])] = part
+            return self._respond(200, headers={"ETag": part.etag})
+        if copy_source:
+            source = self._source(copy_source)
+            if source is None:
+                return self._error(404, "NoSuchKey", copy_source)
+            headers = source.headers
+            if self.headers.get("x-amz-metadata-directive") == "REPLACE":
+                headers = self._object_headers(self.headers)
+            obj = StoredObject(source.data, source.size, source.etag, headers)
+            self.s3.objects[(bucket, key)] = obj
+            return self._respond(200, f"{XML_HEADER}<CopyObjectResult {S3_NS}><ETag>{escape(obj.etag)}</ETag>"
+                                      f"<LastModified>{obj.modified}</LastModified></CopyObjectResult>")
+        obj = self.s3.make_object(self._read_body(), self._object_headers(self.headers))
+        self.s3.objects[(bucket, key)] = obj
+        self._respond(200, headers={"ETag": obj.etag})
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self.s3.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {},
+                                          "headers": self._object_headers(self.headers),
+                                          "initiated": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())}
+            return self._respond(200, f"{XML_HEADER}<InitiateMultipartUploadResult {S3_NS}><Bucket>{escape(bucket)}"
+                                      f"</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                                      f"</InitiateMultipartUploadResult>")
+        if "uploadId" in query:
+            upload = self.s3.uploads.pop(query["uploadId"], None)
+            if upload is None:
+                return self._error(404, "NoSuchUpload")
+            numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+            parts = [upload["parts"][n] for n in numbers]
+            digest = hashlib.md5(b"".join(bytes.fromhex(p.etag.strip('"')) for p in parts)).hexdigest()
+            data = b"".join(p.data for p in parts) if self.s3.keep_data else None
+            obj = StoredObject(data, sum(p.size for p in parts), f'"{digest}-{len(parts)}"', upload["headers"])
+            self.s3.objects[(bucket, key)] = obj
+            return self._respond(200, f"{XML_HEADER}<CompleteMultipartUploadResult {S3_NS}><Bucket>{escape(bucket)}"
+                                      f"</Bucket><Key>{escape(key)}</Key><ETag>{escape(obj.etag)}</ETag>"
+                                      f"</CompleteMultipartUploadResult>")
+        if "delete" in query:
+            for key in re.findall(rb"<Key>(.*?)</Key>", body):
+                self.s3.objects.pop((bucket, key.decode()), None)
+            return self._respond(200, f"{XML_HEADER}<DeleteResult {S3_NS}></DeleteResult>")
+        self._error(400, "NotImplemented")
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        self._throttle(0)
+        if "uploadId" in query:
+            self.s3.uploads.pop(query["uploadId"], None)
+        else:
+            self.s3.objects.pop((bucket, key), None)
+        self._respond(204)
+
+    # --- Helpers ---
+    def _source(self, copy_source):
+        bucket, _, key = unquote(copy_source.split("?")[0]).lstrip("/").partition("/")
+        return self.s3.objects.get((bucket, key))
+
+    def _copy_part(self, copy_source):
+        source = self._source(copy_source)
+        if source is None:
+            return None
+        start, end = 0, source.size
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("x-amz-copy-source-range", ""))
+        if match:
+            start, end = int(match.group(1)), int(match.group(2)) + 1
+        self._throttle(0)
+        data = source.body(start, end)
+        return self.s3.make_object(data, {}) if self.s3.keep_data else \
+            StoredObject(None, end - start, '"' + hashlib.md5(f"{source.etag}{start}".encode()).hexdigest() + '"', {})
+
+    def _list(self, bucket, query):
+        self._throttle(0)
+        prefix = query.get("prefix", "")
+        after = query.get("continuation-token") or query.get("start-after", "")
+        max_keys = int(query.get("max-keys", 1000))
+        keys = sorted(k for (b, k) in self.s3.objects if b == bucket and k.startswith(prefix) and k > after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = "".join(
+            f"<Contents><Key>{escape(k)}</Key><LastModified>{self.s3.objects[(bucket, k)].modified}</LastModified>"
+            f"<ETag>{escape(self.s3.objects[(bucket, k)].etag)}</ETag><Size>{self.s3.objects[(bucket, k)].size}</Size>"
+            f"<StorageClass>STANDARD</StorageClass></Contents>"
+            for k in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        self._respond(200, f"{XML_HEADER}<ListBucketResult {S3_NS}><Name>{escape(bucket)}</Name>"
+                           f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+                           f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>"
+                           f"{contents}{token}</ListBucketResult>")
+
+    def _list_uploads(self, bucket):
+        """ListMultipartUploads (one page; enough for the sweeps that use it)"""
+        self._throttle(0)
+        uploads = "".join(
+            f"<Upload><Key>{escape(u['key'])}</Key><UploadId>{upload_id}</UploadId>"
+            f"<Initiated>{u['initiated']}</Initiated><StorageClass>STANDARD</StorageClass></Upload>"
+            for upload_id, u in list(self.s3.uploads.items()) if u["bucket"] == bucket
+        )
+        self._respond(200, f"{XML_HEADER}<ListMultipartUploadsResult {S3_NS}><Bucket>{escape(bucket)}</Bucket>"
+                           f"<IsTruncated>false</IsTruncated>{uploads}</ListMultipartUploadsResult>")
+
+
+def serve(port, keep_data=False, latency_ms=0, bandwidth_mbps=0, host="127.0.0.1"):
+    """Start a server in a background thread and return it"""
+    handler = type("BoundHandler", (Handler,), {
+        "s3": FakeS3(keep_data, latency_ms / 1000.0, bandwidth_mbps * 1024 * 1024 / 8)
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="per-request cap, 0 = unlimited")
+    parser.add_argument("--keep-data", action="store_true")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.keep_data, args.latency_ms, args.bandwidth_mbps, args.host)
+    print(f"fake S3 listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""End-to-end load test: scripted Telegram traffic replayed into the real handlers.
+
+Starts local S3 stand-ins (benchmarks/fake_s3.py), swaps the Telegram client for
+a fake that throttles downloads and API calls and answers with FloodWait the
+way Telegram does, then drives bot.file_handler and bot.handle_callback_query
+with synthetic messages and button presses. Reports upload latency
+percentiles, throughput, peak RSS, open file descriptors and event-loop lag,
+and writes a JSON report that can be compared against an earlier run.
+
+    python benchmarks/loadtest.py benchmarks/scenarios/burst_50_users.json \\
+        [--out report.json] [--compare baseline.json] [--fail-on-block-ms 100]
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+TELEGRAM_CHUNK = 1024 * 1024  # stream_media yields 1MB chunks
+SAMPLE_INTERVAL = 0.1
+TEXT_BLOCK = (b"2024-01-01 12:00:00 INFO request handled path=/api/items status=200 took=12ms\n" * 16384)[:MB]
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0, "p90": 0, "p99": 0, "max": 0, "mean": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)], 2)
+    return {"p50": pick(50), "p90": pick(90), "p99": pick(99), "max": round(ordered[-1], 2),
+            "mean": round(sum(ordered) / len(ordered), 2)}
+
+
+# --- Local S3 stand-ins ---
+def start_storage(specs, keep_data=False):
+    """Launch one fake S3 process per target; returns (processes, STORAGE_TARGETS json)"""
+    processes, targets = [], []
+    for index, spec in enumerate(specs):
+        command = [sys.executable, os.path.join(ROOT, "benchmarks", "fake_s3.py"), "--port", "0",
+                   "--latency-ms", str(spec.get("latency_ms", 0)),
+                   "--bandwidth-mbps", str(spec.get("bandwidth_mbps", 0))]
+        if keep_data:
+            command.append("--keep-data")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        endpoint = re.search(r"(http://\S+)", process.stdout.readline()).group(1)
+        processes.append(process)
+        targets.append({
+            "name": spec.get("name", f"local-{index}"),
+            "region": spec.get("region", "us-east-1"),
+            "bucket": spec.get("bucket", "loadtest"),
+            "endpoint": endpoint,
+            "addressing_style": "path",
+        })
+    return processes, json.dumps(targets)
+
+
+# --- Fake Telegram ---
+class FakeTelegram:
+    """Stands in for the Pyrogram client: throttled media download plus rate-limited API calls"""
+
+    def __init__(self, settings, TokenBucket, FloodWait):
+        self.TokenBucket = TokenBucket
+        self.FloodWait = FloodWait
+        self.download_rate = settings.get("download_mbps", 80) * MB / 8  # per file
+        self.total_download = TokenBucket(settings.get("total_download_mbps", 800) * MB / 8,
+                                          settings.get("total_download_mbps", 800) * MB / 8)
+        self.global_calls = TokenBucket(settings.get("requests_per_s", 30), settings.get("requests_per_s", 30))
+        self.chat_rate = settings.get("chat_messages_per_s", 1.0)
+        self.chat_burst = settings.get("chat_burst", 3)
+        self.rtt = settings.get("rtt_ms", 40) / 1000
+        self.sleep_threshold = settings.get("sleep_threshold_s", 10)  # Pyrogram's default
+        self.chat_buckets = {}
+        self.stats = Counter()
+        self.me = SimpleNamespace(id=1, username="loadtest_bot")
+        self.next_message_id = 1000
+        self.messages = {}  # (chat id, message id) -> FakeMessage
+
+    async def call(self, method, chat_id=None):
+        """Simulate one API round trip, sleeping out or raising FloodWait like Pyrogram"""
+        self.stats[method] += 1
+        while True:
+            ok, retry_after = self.global_calls.try_consume()
+            if ok and chat_id is not None:
+                bucket = self.chat_buckets.setdefault(chat_id, self.TokenBucket(self.chat_rate, self.chat_burst))
+                ok, retry_after = bucket.try_consume()
+            if ok:
+                break
+            wait = max(1, math.ceil(retry_after))
+            self.stats["flood_wait"] += 1
+            if wait > self.sleep_threshold:
+                raise self.FloodWait(value=wait)
+            self.stats["flood_wait_slept_s"] += wait
+            await asyncio.sleep(wait)
+        await asyncio.sleep(self.rtt)
+
+    def new_message(self, chat_id, user_id, text="", media=None, kind=None):
+        self.next_message_id += 1
+        message = FakeMessage(self, chat_id, user_id, self.next_message_id, text, media, kind)
+        self.messages[(chat_id, message.id)] = message
+        return message
+
+    async def stream_media(self, message):
+        media = message.document or message.video or message.audio
+        block = TEXT_BLOCK if media.kind == "text" else media.block
+        bucket = self.TokenBucket(self.download_rate, TELEGRAM_CHUNK)
+        sent = 0
+        while sent < media.file_size:
+            size = min(TELEGRAM_CHUNK, media.file_size - sent)
+            await bucket.consume(size)
+            await self.total_download.consume(size)
+            sent += size
+            self.stats["bytes_downloaded"] += size
+            yield block[:size]
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, **kwargs):
+        await self.call("edit_message_text", chat_id)
+        message = self.messages.get((chat_id, message_id))
+        if message is not None:
+            message.text = text
+            if reply_markup is not None:
+                message.reply_markup = reply_markup
+        return message
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await self.call("send_message", chat_id)
+        message = self.new_message(chat_id, self.me.id, text)
+        message.reply_markup = reply_markup
+        return message
+
+
+class FakeMessage:
+    """The parts of pyrogram.types.Message the handlers touch"""
+
+    def __init__(self, client, chat_id, user_id, message_id, text="", media=None, kind=None):
+        self._client = client
+        self.id = message_id
+        self.chat = SimpleNamespace(id=chat_id)
+        self.from_user = SimpleNamespace(id=user_id)
+        self.text = text
+        self.reply_markup = None
+        self.document = media if kind in ("binary", "text") else None
+        self.video = media if kind == "video" else None
+        self.audio = None
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        await self._client.call("send_message", self.chat.id)
+        reply = self._client.new_message(self.chat.id, self._client.me.id, text)
+        reply.reply_markup = reply_markup
+        self.replies.append(reply)
+        return reply
+
+    async def reply_document(self, document, caption=None, **kwargs):
+        await self._client.call("send_document", self.chat.id)
+        return await self.reply_text(caption or "")
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        return await self._client.edit_message_text(self.chat.id, self.id, text, reply_markup=reply_markup)
+
+    async def edit_reply_markup(self, reply_markup=None):
+        await self._client.call("edit_message_reply_markup", self.chat.id)
+        self.reply_markup = reply_markup
+        return self
+
+    async def delete(self):
+        await self._client.call("delete_messages", self.chat.id)
+
+
+class FakeCallbackQuery:
+    def __init__(self, client, user_id, data, message):
+        self._client = client
+        self.from_user = SimpleNamespace(id=user_id)
+        self.data = data
+        self.message = message
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        await self._client.call("answer_callback_query")
+
+
+# --- Scenario runner ---
+class LoadTest:
+    def __init__(self, scenario, bot, telegram):
+        self.scenario = scenario
+        self.bot = bot
+        self.telegram = telegram
+        self.upload_latencies = []
+        self.callback_latencies = []
+        self.failures = Counter()
+        self.bytes_uploaded = 0
+        self.peak_rss = 0
+        self.peak_fds = 0
+
+    def make_media(self, user_index, file_index):
+        kind = self.scenario.get("file_kind", "binary")
+        extension = {"binary": ".bin", "text": ".log", "video": ".mp4"}[kind]
+        return SimpleNamespace(
+            file_name=f"user{user_index}_file{file_index}{extension}",
+            file_size=int(self.scenario.get("file_size_mb", 10) * MB),
+            kind=kind,
+            block=self.random_block,
+        )
+
+    async def run_user(self, user_index, user_id):
+        await asyncio.sleep(self.scenario.get("ramp_up_s", 0) * user_index / max(1, self.scenario["users"]))
+        for file_index in range(self.scenario.get("files_per_user", 1)):
+            media = self.make_media(user_index, file_index)
+            message = self.telegram.new_message(user_id, user_id, media=media, kind=media.kind)
+            started = time.perf_counter()
+            try:
+                await self.bot.file_handler(self.telegram, message)
+            except Exception as e:
+                self.failures[type(e).__name__] += 1
+                continue
+            status = message.replies[-1] if message.replies else None
+            if status is None or status.reply_markup is None or status.text.startswith("❌"):
+                self.failures[(status.text if status else "no reply")[:60]] += 1
+                continue
+            self.upload_latencies.append((time.perf_counter() - started) * 1000)
+            self.bytes_uploaded += media.file_size
+            await self.press_buttons(user_id, status)
+            await asyncio.sleep(self.scenario.get("think_time_s", 0))
+
+    async def press_buttons(self, user_id, status):
+        file_ids = {button.callback_data.split("_", 1)[1]
+                    for row in status.reply_markup.inline_keyboard for button in row
+                    if button.callback_data and "_" in button.callback_data}
+        for file_id in file_ids:
+            for action in self.scenario.get("callbacks_per_file", []):
+                query = FakeCallbackQuery(self.telegram, user_id, f"{action}_{file_id}", status)
+                started = time.perf_counter()
+                await self.bot.handle_callback_query(self.telegram, query)
+                self.callback_latencies.append((time.perf_counter() - started) * 1000)
+
+    async def sample_process(self, stop):
+        import psutil
+        process = psutil.Process()
+        while not stop.is_set():
+            self.peak_rss = max(self.peak_rss, process.memory_info().rss)
+            self.peak_fds = max(self.peak_fds, process.num_fds())
+            try:
+                await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        bot = self.bot
+        self.random_block = os.urandom(TELEGRAM_CHUNK)
+        bot.registry.warm_up(["users", "storage", "s3"])
+        if not await bot.ensure_ready(bot.s3):
+            raise RuntimeError("storage stand-ins are unreachable")
+        await bot.ensure_ready(bot.users)
+        await bot.ensure_ready(bot.storage)
+        bot.loop_monitor.start(asyncio.get_event_loop())
+
+        user_ids = [10_000 + i for i in range(self.scenario["users"])]
+        for user_id in user_ids:
+            bot.ALLOWED_USERS.add(user_id)
+            bot.quota_manager.add_user(user_id)
+
+        stop = asyncio.Event()
+        sampler = asyncio.ensure_future(self.sample_process(stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(self.run_user(i, uid) for i, uid in enumerate(user_ids)))
+        wall = time.perf_counter() - started
+        stop.set()
+        await sampler
+        bot.loop_monitor.stop()
+        return self.report(wall)
+
+    def report(self, wall):
+        lag = self.bot.loop_monitor.snapshot()
+        return {
+            "scenario": self.scenario.get("name"),
+            "revision": _git_revision(),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "wall_s": round(wall, 2),
+            "uploads": {
+                "ok": len(self.upload_latencies),
+                "failed": sum(self.failures.values()),
+                "failures": dict(self.failures),
+                "latency_ms": percentiles(self.upload_latencies),
+                "bytes": self.bytes_uploaded,
+                "throughput_mbps": round(self.bytes_uploaded * 8 / MB / wall, 2) if wall else 0,
+            },
+            "callbacks": {"count": len(self.callback_latencies), "latency_ms": percentiles(self.callback_latencies)},
+            "telegram": {k: v for k, v in self.telegram.stats.items()},
+            "process": {"peak_rss_mb": round(self.peak_rss / MB, 1), "peak_fds": self.peak_fds},
+            "loop_lag": {
+                "p50_ms": lag["p50_ms"],
+                "p99_ms": lag["p99_ms"],
+                "max_ms": lag["lag"]["max_ms"],
+                "blocks": lag["blocks"],
+                "top_sites": lag["top_sites"],
+                "recent": lag["recent"],
+            },
+        }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# --- Output ---
+COMPARED = [
+    ("upload p50 ms", ("uploads", "latency_ms", "p50")),
+    ("upload p99 ms", ("uploads", "latency_ms", "p99")),
+    ("throughput Mbit/s", ("uploads", "throughput_mbps")),
+    ("failed uploads", ("uploads", "failed")),
+    ("callback p99 ms", ("callbacks", "latency_ms", "p99")),
+    ("flood waits", ("telegram", "flood_wait")),
+    ("peak RSS MB", ("process", "peak_rss_mb")),
+    ("peak FDs", ("process", "peak_fds")),
+    ("loop lag p99 ms", ("loop_lag", "p99_ms")),
+    ("loop lag max ms", ("loop_lag", "max_ms")),
+    ("loop blocks", ("loop_lag", "blocks")),
+]
+
+
+def _lookup(report, path):
+    for part in path:
+        report = report.get(part, 0) if isinstance(report, dict) else 0
+    return report or 0
+
+
+def print_report(report, baseline=None):
+    print(f"\nScenario: {report['scenario']} @ {report['revision'] or '?'} ({report['wall_s']}s)")
+    header = f"{'metric':<20}{'value':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'delta':>10}"
+    print(header)
+    for label, path in COMPARED:
+        value = _lookup(report, path)
+        line = f"{label:<20}{value:>12}"
+        if baseline:
+            old = _lookup(baseline, path)
+            delta = f"{(value - old) / old * 100:+.1f}%" if old else "-"
+            line += f"{old:>12}{delta:>10}"
+        print(line)
+    if report["uploads"]["failures"]:
+        print(f"failures: {report['uploads']['failures']}")
+    for site, count in report["loop_lag"]["top_sites"]:
+        print(f"blocking: {site} x{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", help="scenario JSON file (see benchmarks/scenarios/)")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--fail-on-block-ms", type=int, default=0,
+                        help="exit non-zero if any handler blocks the loop longer than this")
+    args = parser.parse_args()
+
+    with open(args.scenario) as f:
+        scenario = json.load(f)
+    out = os.path.abspath(args.out) if args.out else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    processes, storage_targets = start_storage(scenario.get("storage", [{}]), scenario.get("keep_data", False))
+
+    # The bot reads its configuration at import time
+    os.environ.update({
+        "API_ID": "1", "API_HASH": "loadtest", "BOT_TOKEN": "1:loadtest", "ADMIN_ID": "1",
+        "WASABI_ACCESS_KEY": "loadtest", "WASABI_SECRET_KEY": "loadtest", "WASABI_BUCKET": "loadtest",
+        "STORAGE_TARGETS": storage_targets,
+        "AUTO_SHORTEN": "false",
+        "LOG_LEVEL": "WARNING",
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "USERS_FILE": os.path.join(workdir, "users.json"),
+        "OBJECT_INDEX_FILE": os.path.join(workdir, "object_index.json"),
+        "TRACE_FILE": os.path.join(workdir, "traces", "transfers.jsonl"),
+        "LOOP_BLOCK_FAIL_MS": str(args.fail_on_block_ms),
+    })
+    os.environ.update({k: str(v) for k, v in scenario.get("env", {}).items()})
+    os.chdir(workdir)
+
+    import bot
+    from quotas import TokenBucket
+    from pyrogram.errors import FloodWait
+
+    telegram = FakeTelegram(scenario.get("telegram", {}), TokenBucket, FloodWait)
+    bot.app = telegram  # progress_callback edits through the module-level client
+    try:
+        report = asyncio.run(LoadTest(scenario, bot, telegram).run())
+    finally:
+        for process in processes:
+            process.terminate()
+        bot.thread_pool.shutdown(wait=False, cancel_futures=True)
+
+    print_report(report, baseline)
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.fail_on_block_ms:
+        try:
+            bot.loop_monitor.check()
+        except AssertionError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
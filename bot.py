@@ -1,28 +1,45 @@
 import os
 import time
+import shlex
 import math
 import asyncio
 import logging
+import io
+import json
 import base64
-import aiofiles
-import requests
-from functools import wraps
-from urllib.parse import quote
+import mimetypes
+from collections import deque, OrderedDict
+from functools import wraps, partial
+from urllib.parse import quote, urlencode
 from threading import Thread
 from concurrent.futures import ThreadPoolExecutor
-import multiprocessing
 
-import boto3
-from botocore.exceptions import ClientError
-from pyrogram import Client, filters
-from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
-from flask import Flask, render_template, request, jsonify, send_file
+from subsystems import registry, profile
+from tracing import create_tracer, render_waterfall
+from temp_storage import TempStorage, InsufficientSpaceError
+from json_store import JsonStore
+from quotas import QuotaManager
+from compression import ChunkCompressor, choose_codec, crc32_combine
+from encryption import ObjectCipher, load_master_key
+from storage_router import StorageRouter, targets_from_config
+from loop_monitor import monitor as loop_monitor
+from selections import SelectionStore, sign_keys
+from browser_uploads import uploads as browser_uploads, SWEEP_INTERVAL as UPLOAD_SWEEP_INTERVAL
+from key_layout import layout as key_layout, previous_layouts as previous_key_layouts, migrated_key
+from key_migration import migration as key_migration
+from media_meta import (
+    sidecars, sidecar_key, is_sidecar, build_sidecar, best_thumb, find_moov, MOOV_EXTENSIONS
+)
+
+with profile.phase("import:pyrogram"):
+    from pyrogram import Client, filters, idle
+    from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
 
 # Import configuration
 from config import config
 
 # --- Configuration ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=config.LOG_LEVEL, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Use configuration from config module
@@ -41,20 +58,76 @@ GPLINKS_API_URL = "https://gplinks.in/api"
 AUTO_SHORTEN = getattr(config, 'AUTO_SHORTEN', True)  # Enable/disable auto shortening
 
 # Player URL configuration
-RENDER_URL = os.getenv("RENDER_URL", "http://localhost:8000")
+RENDER_URL = config.RENDER_URL
 SUPPORTED_VIDEO_FORMATS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp', '.mpeg', '.mpg'}
 
-# In-memory storage for authorized user IDs
+# Authorized user IDs (loaded from USERS_FILE by the "users" subsystem)
 ALLOWED_USERS = {ADMIN_ID}
 
+# Per-user shaping and rolling quotas, persisted alongside the user list
+quota_manager = QuotaManager(
+    JsonStore(config.USERS_FILE),
+    ADMIN_ID,
+    upload_rate=config.USER_UPLOAD_RATE,
+    ops_per_minute=config.USER_OPS_PER_MINUTE,
+    daily_bytes=config.USER_DAILY_QUOTA,
+    monthly_bytes=config.USER_MONTHLY_QUOTA
+)
+
 # Performance optimization settings
 CHUNK_SIZE = 16 * 1024 * 1024  # 16MB chunks for parallel upload
 MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)  # Optimal thread count
 BUFFER_SIZE = 256 * 1024  # 256KB buffer for file operations
+PART_RETRIES = 3  # Attempts per multipart part before the upload is aborted
+COPY_MULTIPART_THRESHOLD = 256 * 1024 * 1024  # Larger objects are copied as parallel part ranges
+COPY_PART_SIZE = 128 * 1024 * 1024  # Server-side copy parts (no bytes pass through us)
+TELEGRAM_TEXT_LIMIT = 4096  # Characters per message
+COMPRESSION = config.COMPRESSION  # "gzip", "zstd" or "off"
+ENCRYPTION_MASTER_KEY = load_master_key(config.ENCRYPTION_KEY)  # None = /encrypt unavailable
+ENCRYPTION_CIPHER = config.ENCRYPTION_CIPHER
 
-# Thread pool for parallel operations
+# Thread pool for parallel operations (worker threads are spawned on first use)
 thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
+# Per-transfer trace spans, exported to a rotating JSONL file
+tracer = create_tracer(config.TRACE_FILE)
+
+# --- Lazy Subsystems ---
+def _init_shortener():
+    """Pooled HTTP session for the GPLinks API"""
+    requests = profile.timed_import("requests")
+    http = requests.Session()
+    http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+    return http
+
+# Managed temp space for transfers (./downloads plus an optional tmpfs tier)
+temp_storage = TempStorage(
+    config.DOWNLOAD_DIR,
+    tmpfs_root=config.TMPFS_DIR or None,
+    tmpfs_max_file=config.TMPFS_MAX_FILE,
+    tmpfs_max_total=config.TMPFS_MAX_TOTAL,
+    min_free=config.TEMP_MIN_FREE
+)
+
+def _init_storage():
+    """Create temp directories and sweep files orphaned by a killed process"""
+    return temp_storage.setup()
+
+def _init_users():
+    """Authorized users and quota usage from disk"""
+    return quota_manager.load(ALLOWED_USERS)
+
+shortener = registry.register("shortener", _init_shortener)
+storage = registry.register("storage", _init_storage, critical=True)
+users = registry.register("users", _init_users, critical=True)
+
+async def save_users():
+    """Persist users and quota usage without blocking the event loop"""
+    try:
+        await asyncio.get_event_loop().run_in_executor(thread_pool, quota_manager.save)
+    except Exception as e:
+        logger.error(f"Failed to save users: {e}")
+
 # --- GPLinks.in Shortener Functions ---
 async def shorten_url_gplinks(long_url):
     """Shorten URL using GPLinks.in API"""
@@ -65,8 +138,14 @@ async def shorten_url_gplinks(long_url):
         # GPLinks API endpoint
         api_url = f"{GPLINKS_API_URL}?api={GPLINKS_API_KEY}&url={quote(long_url)}"
         
-        # Make API request
-        response = requests.get(api_url, timeout=10)
+        http = shortener.get()
+        if not http:
+            return long_url
+        
+        # Make API request (in a worker thread, requests would block the loop)
+        response = await asyncio.get_event_loop().run_in_executor(
+            thread_pool, lambda: http.get(api_url, timeout=10)
+        )
         
         if response.status_code == 200:
             data = response.json()
@@ -88,8 +167,9 @@ async def shorten_url_gplinks(long_url):
 
 async def shorten_all_urls(direct_url, player_url):
     """Shorten both direct and player URLs"""
-    shortened_direct = await shorten_url_gplinks(direct_url) if direct_url else None
-    shortened_player = await shorten_url_gplinks(player_url) if player_url else None
+    with tracer.span("shorten", enabled=bool(AUTO_SHORTEN and GPLINKS_API_KEY)):
+        shortened_direct = await shorten_url_gplinks(direct_url) if direct_url else None
+        shortened_player = await shorten_url_gplinks(player_url) if player_url else None
     
     return shortened_direct, shortened_player
 
@@ -119,39 +199,100 @@ class CallbackData:
         """Remove mapping when no longer needed"""
         if short_id in self.file_map:
             del self.file_map[short_id]
+    
+    def rename_file(self, old_name, new_name):
+        """Point every short ID for a moved object at its new key"""
+        for short_id, filename in self.file_map.items():
+            if filename == old_name:
+                self.file_map[short_id] = new_name
 
 # Global callback data manager
 callback_data = CallbackData()
 
+# Rename prompts awaiting a reply: prompt message ID -> (object key, message with the file's buttons, expiry).
+# Oldest first; unanswered prompts expire so they don't pin messages (and the reply filter) forever
+RENAME_PROMPT_TTL = 600  # seconds
+MAX_PENDING_RENAMES = 50
+pending_renames = OrderedDict()
+
+def rename_pending(prompt_id):
+    """Drop expired (or excess) rename prompts, then check whether ``prompt_id`` is still awaiting a name"""
+    now = time.time()
+    while pending_renames and (len(pending_renames) > MAX_PENDING_RENAMES
+                               or next(iter(pending_renames.values()))[2] <= now):
+        pending_renames.popitem(last=False)
+    return prompt_id in pending_renames
+
 # --- Bot & Wasabi Client Initialization ---
-app = Client("wasabi_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+with profile.phase("client:create"):
+    app = Client("wasabi_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 
-# Optimized Boto3 S3 client for Wasabi
-try:
+# Optimized Boto3 S3 client per storage target (built on first use or during warm-up)
+def _create_s3_client(target):
+    boto3 = profile.timed_import("boto3")
     session = boto3.Session(
-        aws_access_key_id=WASABI_ACCESS_KEY,
-        aws_secret_access_key=WASABI_SECRET_KEY,
-        region_name=WASABI_REGION
+        aws_access_key_id=target.access_key,
+        aws_secret_access_key=target.secret_key,
+        region_name=target.region
     )
     
-    s3_client = session.client(
+    return session.client(
         's3',
-        endpoint_url=f'https://s3.{WASABI_REGION}.wasabisys.com',
+        endpoint_url=target.endpoint,
         config=boto3.session.Config(
             max_pool_connections=MAX_WORKERS,
+            signature_version='s3v4',  # Matches the local presigner (boto3 would use SigV2 in us-east-1)
             retries={'max_attempts': 5, 'mode': 'adaptive'},
-            s3={'addressing_style': 'virtual', 'payload_signing_enabled': False},
+            s3={'addressing_style': target.addressing_style, 'payload_signing_enabled': False},
             read_timeout=300,
             connect_timeout=30
         )
     )
-    
-    # Test connection with timeout
-    s3_client.head_bucket(Bucket=WASABI_BUCKET)
-    logger.info(f"✅ Successfully connected to Wasabi with {MAX_WORKERS} workers")
-except Exception as e:
-    logger.error(f"❌ Failed to connect to Wasabi: {e}")
-    s3_client = None
+
+def _init_s3():
+    """Connect and probe every storage target (head_bucket doubles as the latency probe)"""
+    router = StorageRouter(
+        targets_from_config(config),
+        _create_s3_client,
+        JsonStore(config.OBJECT_INDEX_FILE),
+        replicate_after=config.REPLICATE_AFTER_DOWNLOADS
+    ).connect()
+    healthy = [t.name for t in router.targets.values() if t.healthy]
+    logger.info(f"✅ Successfully connected to {len(healthy)}/{len(router.targets)} storage targets with {MAX_WORKERS} workers")
+    return router
+
+s3 = registry.register("s3", _init_s3, critical=True)
+
+PRESIGN_EXPIRY = 604800  # 7 days
+
+def get_router():
+    """Return the storage router, initializing it if needed (None if no target is reachable)"""
+    return s3.get()
+
+async def ensure_ready(subsystem):
+    """Return a subsystem's value, initializing it off the event loop if needed"""
+    value = subsystem.peek()
+    if value is not None:
+        return value
+    return await asyncio.get_event_loop().run_in_executor(thread_pool, subsystem.get)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call (boto3, disk, requests) in the worker pool instead of on the loop"""
+    return await asyncio.get_event_loop().run_in_executor(thread_pool, partial(func, *args, **kwargs))
+
+async def get_router_async():
+    """Same as get_router but never blocks the event loop"""
+    return await ensure_ready(s3)
+
+async def save_object_index():
+    """Persist the object placement index without blocking the event loop"""
+    router = s3.peek()
+    if not router:
+        return
+    try:
+        await asyncio.get_event_loop().run_in_executor(thread_pool, router.save)
+    except Exception as e:
+        logger.error(f"Failed to save object index: {e}")
 
 # --- Performance Tracking ---
 class TransferStats:
@@ -204,6 +345,7 @@ def is_authorized(func):
     """Decorator to check if the user is authorized."""
     @wraps(func)
     async def wrapper(client, message):
+        await ensure_ready(users)
         if message.from_user.id in ALLOWED_USERS:
             await func(client, message)
         else:
@@ -286,6 +428,9 @@ async def create_link_buttons(direct_url, player_url, filename):
         InlineKeyboardButton("🗑 Delete File", callback_data=f"del_{file_id}"),
         InlineKeyboardButton("🔄 New Links", callback_data=f"ref_{file_id}")
     ])
+    buttons.append([
+        InlineKeyboardButton("✏️ Rename", callback_data=f"ren_{file_id}")
+    ])
     
     return InlineKeyboardMarkup(buttons)
 
@@ -361,30 +506,56 @@ async def progress_callback(current, total, message, status, operation_type="dow
         logger.debug(f"Progress update skipped: {e}")
 
 # --- Ultra-Fast S3 Operations ---
-async def upload_to_wasabi_parallel(file_path, file_name, status_message):
-    """Ultra-fast parallel multipart upload with instant speeds"""
+async def upload_to_wasabi_parallel(file_path, file_name, status_message, shaper=None, encrypt=False, owner=None):
+    """Ultra-fast parallel multipart upload to the best storage target; returns that target"""
     try:
         file_size = os.path.getsize(file_path)
+        router = await get_router_async()
+        if not router:
+            raise RuntimeError("Storage is not available")
+        target = router.choose(file_size)
+        
+        # Compressible content (never videos) is gzip/zstd encoded on the fly; ciphertext doesn't compress
+        codec = None
+        if COMPRESSION != "off" and not encrypt and not is_video_file(file_name):
+            codec = await asyncio.get_event_loop().run_in_executor(
+                thread_pool, choose_codec, file_path, file_name, SUPPORTED_VIDEO_FORMATS, COMPRESSION
+            )
         
         # Use multipart upload for files larger than 50MB
-        if file_size > 50 * 1024 * 1024:
-            return await upload_multipart(file_path, file_name, file_size, status_message)
-        else:
-            return await upload_single(file_path, file_name, file_size, status_message)
+        started = time.perf_counter()
+        with tracer.span("upload", size=file_size, key=file_name, codec=codec, target=target.name, encrypted=encrypt):
+            if encrypt:
+                await upload_encrypted(target, file_path, file_name, file_size, status_message, shaper)
+            elif codec:
+                await upload_compressed(target, file_path, file_name, file_size, codec, status_message, shaper)
+            elif file_size > 50 * 1024 * 1024:
+                await upload_multipart(target, file_path, file_name, file_size, status_message, shaper)
+            else:
+                await upload_single(target, file_path, file_name, file_size, status_message, shaper)
+        
+        # Feed the measured throughput back into routing and remember the placement
+        router.record_upload(target, file_size, time.perf_counter() - started)
+        router.place(file_name, target, encrypted=encrypt, owner=owner)
+        await save_object_index()
+        return target
             
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise e
 
-async def upload_multipart(file_path, file_name, file_size, status_message):
+async def upload_multipart(target, file_path, file_name, file_size, status_message, shaper=None):
     """Multipart upload for large files - maximum speed"""
+    s3_client = target.client
     try:
         # Create multipart upload
-        mpu = s3_client.create_multipart_upload(
-            Bucket=WASABI_BUCKET,
-            Key=file_name,
-            ContentType='application/octet-stream'
-        )
+        with tracer.span("multipart.create"):
+            mpu = await run_blocking(
+                s3_client.create_multipart_upload,
+                Bucket=target.bucket,
+                Key=file_name,
+                ContentType='application/octet-stream'
+            )
         mpu_id = mpu['UploadId']
         
         # Calculate parts
@@ -402,7 +573,7 @@ async def upload_multipart(file_path, file_name, file_size, status_message):
             end = min(start + part_size, file_size)
             
             task = upload_part(
-                file_path, file_name, mpu_id, part_num, start, end, status_message
+                target, file_path, file_name, mpu_id, part_num, start, end, status_message, shaper
             )
             upload_tasks.append(task)
         
@@ -410,12 +581,14 @@ async def upload_multipart(file_path, file_name, file_size, status_message):
         parts = await asyncio.gather(*upload_tasks)
         
         # Complete multipart upload
-        s3_client.complete_multipart_upload(
-            Bucket=WASABI_BUCKET,
-            Key=file_name,
-            UploadId=mpu_id,
-            MultipartUpload={'Parts': parts}
-        )
+        with tracer.span("multipart.complete", parts=part_count):
+            await run_blocking(
+                s3_client.complete_multipart_upload,
+                Bucket=target.bucket,
+                Key=file_name,
+                UploadId=mpu_id,
+                MultipartUpload={'Parts': parts}
+            )
         
         logger.info("Multipart upload completed successfully")
         return True
@@ -423,8 +596,9 @@ async def upload_multipart(file_path, file_name, file_size, status_message):
     except Exception as e:
         # Abort upload on failure
         try:
-            s3_client.abort_multipart_upload(
-                Bucket=WASABI_BUCKET,
+            await run_blocking(
+                s3_client.abort_multipart_upload,
+                Bucket=target.bucket,
                 Key=file_name,
                 UploadId=mpu_id
             )
@@ -432,30 +606,60 @@ async def upload_multipart(file_path, file_name, file_size, status_message):
             pass
         raise e
 
-async def upload_part(file_path, file_name, mpu_id, part_num, start, end, status_message):
-    """Upload a single part with progress tracking"""
+async def upload_part(target, file_path, file_name, mpu_id, part_num, start, end, status_message, shaper=None, data=None):
+    """Upload a single part with progress tracking (``data`` skips reading the file range)"""
     loop = asyncio.get_event_loop()
+    s3_client = target.client
+    span = tracer.start_span("part", part=part_num, size=end - start)
+    
+    # Per-user bandwidth shaping waits here on the loop, so a throttled user never parks a shared worker
+    if shaper:
+        await shaper.consume(end - start)
+    submitted = time.perf_counter()
     
     def _upload_part():
-        with open(file_path, 'rb') as f:
-            f.seek(start)
-            data = f.read(end - start)
-            
-            response = s3_client.upload_part(
-                Bucket=WASABI_BUCKET,
-                Key=file_name,
-                PartNumber=part_num,
-                UploadId=mpu_id,
-                Body=data
-            )
-            
-            return {'ETag': response['ETag'], 'PartNumber': part_num}
+        if span:
+            span.set(queue_wait_ms=round((time.perf_counter() - submitted) * 1000, 2))
+        body = data
+        if body is None:
+            with open(file_path, 'rb') as f:
+                f.seek(start)
+                body = f.read(end - start)
+        
+        for attempt in range(PART_RETRIES):
+            try:
+                response = s3_client.upload_part(
+                    Bucket=target.bucket,
+                    Key=file_name,
+                    PartNumber=part_num,
+                    UploadId=mpu_id,
+                    Body=body
+                )
+                break
+            except Exception as e:
+                if attempt == PART_RETRIES - 1:
+                    raise
+                logger.warning(f"Part {part_num} failed (attempt {attempt + 1}): {e}")
+                if span:
+                    span.set(retries=attempt + 1)
+                time.sleep(0.5 * 2 ** attempt)
+        
+        return {'ETag': response['ETag'], 'PartNumber': part_num}
     
-    return await loop.run_in_executor(thread_pool, _upload_part)
+    try:
+        result = await loop.run_in_executor(thread_pool, _upload_part)
+    except Exception as e:
+        if span:
+            span.end(error=e)
+        raise
+    if span:
+        span.end()
+    return result
 
-async def upload_single(file_path, file_name, file_size, status_message):
+async def upload_single(target, file_path, file_name, file_size, status_message, shaper=None):
     """Single upload for smaller files"""
     loop = asyncio.get_event_loop()
+    s3_client = target.client
     
     class ProgressTracker:
         def __init__(self):
@@ -477,43 +681,430 @@ async def upload_single(file_path, file_name, file_size, status_message):
     
     progress_tracker = ProgressTracker()
     
-    await loop.run_in_executor(
-        thread_pool,
-        lambda: s3_client.upload_file(
-            file_path,
-            WASABI_BUCKET,
-            file_name,
-            Callback=progress_tracker
+    # Small files are shaped as one debt up front (on the loop, like every other path)
+    if shaper:
+        await shaper.consume(file_size)
+    with tracer.span("upload.single", size=file_size):
+        await loop.run_in_executor(
+            thread_pool,
+            lambda: s3_client.upload_file(
+                file_path,
+                target.bucket,
+                file_name,
+                Callback=progress_tracker
+            )
         )
-    )
     return True
 
+async def upload_compressed(target, file_path, file_name, file_size, codec, status_message, shaper=None):
+    """Compress chunks in worker threads and stream them into the object as they finish"""
+    loop = asyncio.get_event_loop()
+    s3_client = target.client
+    compressor = ChunkCompressor(codec, config.COMPRESSION_LEVEL or None)
+    chunk_count = max(1, math.ceil(file_size / CHUNK_SIZE))
+    extra_args = {
+        'ContentType': mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+        'ContentEncoding': compressor.content_encoding,
+        'Metadata': {'original-size': str(file_size), 'compression': codec}
+    }
+    
+    def _compress_chunk(index):
+        with open(file_path, 'rb') as f:
+            f.seek(index * CHUNK_SIZE)
+            data = f.read(CHUNK_SIZE)
+        compressed, crc = compressor.compress(data, index == chunk_count - 1)
+        return compressed, crc, len(data)
+    
+    async def _compressed_chunks():
+        # Keep up to MAX_WORKERS chunks compressing ahead, yield them in order
+        pending = deque()
+        for index in range(chunk_count):
+            pending.append(loop.run_in_executor(thread_pool, _compress_chunk, index))
+            if len(pending) >= MAX_WORKERS:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    
+    in_flight = asyncio.Semaphore(MAX_WORKERS)
+    
+    async def _send(part_num, body):
+        try:
+            return await upload_part(target, None, file_name, mpu_id, part_num, 0, len(body), status_message, shaper, data=body)
+        finally:
+            in_flight.release()
+    
+    mpu_id = None
+    part_tasks = []
+    buffer = bytearray(compressor.header())
+    crc = 0
+    raw_done = 0
+    compressed_size = len(buffer)
+    
+    try:
+        async for compressed, chunk_crc, raw_len in _compressed_chunks():
+            crc = crc32_combine(crc, chunk_crc, raw_len)
+            raw_done += raw_len
+            compressed_size += len(compressed)
+            buffer += compressed
+            
+            # Every part except the last must be at least 5MB
+            if len(buffer) >= CHUNK_SIZE and raw_done < file_size:
+                if mpu_id is None:
+                    with tracer.span("multipart.create"):
+                        mpu = await run_blocking(
+                            s3_client.create_multipart_upload, Bucket=target.bucket, Key=file_name, **extra_args
+                        )
+                    mpu_id = mpu['UploadId']
+                await in_flight.acquire()
+                part_tasks.append(asyncio.ensure_future(_send(len(part_tasks) + 1, bytes(buffer))))
+                buffer = bytearray()
+            
+            await progress_callback(raw_done, file_size, status_message, "🗜 Compressing & uploading...", "upload")
+        
+        trailer = compressor.trailer(crc, file_size)
+        buffer += trailer
+        compressed_size += len(trailer)
+        
+        if mpu_id is None:
+            # Everything fit in one part, a plain PUT is cheaper
+            body = bytes(buffer)
+            if shaper:
+                await shaper.consume(len(body))
+            with tracer.span("upload.single", size=len(body)):
+                await loop.run_in_executor(
+                    thread_pool,
+                    lambda: s3_client.put_object(Bucket=target.bucket, Key=file_name, Body=body, **extra_args)
+                )
+        else:
+            await in_flight.acquire()
+            part_tasks.append(asyncio.ensure_future(_send(len(part_tasks) + 1, bytes(buffer))))
+            parts = await asyncio.gather(*part_tasks)
+            with tracer.span("multipart.complete", parts=len(parts)):
+                await run_blocking(
+                    s3_client.complete_multipart_upload,
+                    Bucket=target.bucket,
+                    Key=file_name,
+                    UploadId=mpu_id,
+                    MultipartUpload={'Parts': parts}
+                )
+        
+        logger.info(f"🗜 {file_name}: {humanbytes(file_size)} -> {humanbytes(compressed_size)} ({codec})")
+        return True
+    
+    except Exception as e:
+        for task in part_tasks:
+            task.cancel()
+        if mpu_id:
+            try:
+                await run_blocking(s3_client.abort_multipart_upload, Bucket=target.bucket, Key=file_name, UploadId=mpu_id)
+            except Exception:
+                pass
+        raise e
+
+async def upload_encrypted(target, file_path, file_name, file_size, status_message, shaper=None):
+    """Seal each part with a fresh per-object key in worker threads, then upload the parts in parallel"""
+    s3_client = target.client
+    cipher = ObjectCipher.new(ENCRYPTION_CIPHER, file_size)
+    extra_args = {
+        'ContentType': mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+        'Metadata': cipher.metadata(ENCRYPTION_MASTER_KEY)
+    }
+    
+    def _seal(start, end):
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return cipher.encrypt_range(data, start)
+    
+    if file_size <= CHUNK_SIZE:
+        body = await run_blocking(_seal, 0, file_size)
+        if shaper:
+            await shaper.consume(len(body))
+        with tracer.span("upload.single", size=len(body)):
+            await run_blocking(s3_client.put_object, Bucket=target.bucket, Key=file_name, Body=body, **extra_args)
+        return True
+    
+    # Parts start on cipher chunk boundaries (CHUNK_SIZE is a multiple), so each seals on its own
+    with tracer.span("multipart.create"):
+        mpu = await run_blocking(s3_client.create_multipart_upload, Bucket=target.bucket, Key=file_name, **extra_args)
+    mpu_id = mpu['UploadId']
+    part_count = math.ceil(file_size / CHUNK_SIZE)
+    in_flight = asyncio.Semaphore(MAX_WORKERS)  # Bounds sealed parts held in memory
+    uploaded = 0
+    
+    async def _part(part_num):
+        nonlocal uploaded
+        start = (part_num - 1) * CHUNK_SIZE
+        end = min(start + CHUNK_SIZE, file_size)
+        async with in_flight:
+            with tracer.span("encrypt", part=part_num, size=end - start):
+                body = await run_blocking(_seal, start, end)
+            result = await upload_part(target, None, file_name, mpu_id, part_num, 0, len(body), status_message, shaper, data=body)
+        uploaded += end - start
+        await progress_callback(uploaded, file_size, status_message, "🔒 Encrypting & uploading...", "upload")
+        return result
+    
+    try:
+        parts = await asyncio.gather(*(_part(n) for n in range(1, part_count + 1)))
+        with tracer.span("multipart.complete", parts=part_count):
+            await run_blocking(
+                s3_client.complete_multipart_upload,
+                Bucket=target.bucket,
+                Key=file_name,
+                UploadId=mpu_id,
+                MultipartUpload={'Parts': parts}
+            )
+        return True
+    except Exception as e:
+        try:
+            await run_blocking(s3_client.abort_multipart_upload, Bucket=target.bucket, Key=file_name, UploadId=mpu_id)
+        except Exception:
+            pass
+        raise e
+
+def stream_link(presigned_url, key):
+    """Link through the web tier's /stream proxy, signed so the proxy will decrypt this key (and only for us)"""
+    encoded_url = base64.urlsafe_b64encode(presigned_url.encode()).decode().rstrip('=')
+    expires = int(time.time()) + PRESIGN_EXPIRY
+    signature = sign_keys(config.LINK_SIGNING_KEY, [key], expires, scope="stream")
+    return f"{RENDER_URL}/stream/{encoded_url}?expires={expires}&sig={signature}"
+
 async def generate_presigned_url(file_name):
-    """Generate presigned URL with error handling."""
+    """Generate presigned URL (from the fastest replica) with error handling."""
     try:
-        return s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': WASABI_BUCKET, 'Key': file_name},
-            ExpiresIn=604800  # 7 days
-        )
-    except ClientError as e:
+        router = await get_router_async()
+        if not router:
+            return None
+        file_name = key_migration.resolve(file_name)
+        with tracer.span("presign"):
+            url = router.target_for(file_name).presigner.presign(file_name, expires=PRESIGN_EXPIRY)
+        # The bucket only holds ciphertext for encrypted objects
+        return stream_link(url, file_name) if router.is_encrypted(file_name) and RENDER_URL else url
+    except Exception as e:
         logger.error(f"Failed to generate presigned URL: {e}")
         return None
 
+async def record_download(file_name):
+    """Count a link request and replicate the object in the background once it is hot"""
+    router = s3.peek()
+    if not router:
+        return
+    loop = asyncio.get_event_loop()
+    for source, dest in router.record_download(file_name):
+        async def _replicate(source=source, dest=dest):
+            try:
+                await loop.run_in_executor(thread_pool, router.replicate, file_name, source, dest)
+            except Exception as e:
+                logger.error(f"Replication of {file_name} to {dest.name} failed: {e}")
+            await save_object_index()
+        asyncio.ensure_future(_replicate())
+
+async def delete_object(file_name):
+    """Delete an object from every target holding it"""
+    router = await get_router_async()
+    if not router:
+        raise RuntimeError("Storage is not available")
+    for target in router.locate(file_name):
+        await run_blocking(target.client.delete_object, Bucket=target.bucket, Key=file_name)
+    router.forget(file_name)
+    if is_video_file(file_name):
+        await drop_sidecar(file_name)
+    # Originals a key migration left behind for old links go with it
+    key_migration.forget(file_name)
+    for old_key in key_migration.aliases_of(file_name):
+        await delete_object(old_key)
+        key_migration.retired(old_key)
+    await run_blocking(key_migration.save)
+    await save_object_index()
+
+# --- Player Sidecars (poster, duration, dimensions, MP4 moov range) ---
+async def store_sidecar(client, media, file_path, key, file_name, encrypted=False):
+    """Build and upload the player's metadata sidecar; a failure only costs the fast start"""
+    try:
+        router = await get_router_async()
+        if not router:
+            return None
+        # Poster from Telegram's own thumbnail (not for encrypted files: it would sit in the bucket in clear)
+        thumb = None if encrypted else best_thumb(media)
+        poster = moov = None
+        with tracer.span("sidecar", key=key):
+            if thumb:
+                poster = await client.download_media(thumb.file_id, in_memory=True)
+                poster = bytes(poster.getbuffer())
+            if get_file_extension(file_name) in MOOV_EXTENSIONS:
+                moov = await run_blocking(find_moov, file_path)
+            mime_type = getattr(media, 'mime_type', None) or mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+            sidecar = build_sidecar(media, mime_type, media.file_size, moov, poster)
+            body = json.dumps(sidecar, separators=(",", ":")).encode()
+            target = router.choose(len(body))
+            await run_blocking(
+                target.client.put_object, Bucket=target.bucket, Key=sidecar_key(key), Body=body,
+                ContentType='application/json'
+            )
+        router.place(sidecar_key(key), target)
+        sidecars.put(key, sidecar)
+        await save_object_index()
+        return sidecar
+    except Exception as e:
+        logger.warning(f"Sidecar for {key} skipped: {e}")
+        return None
+
+async def carry_sidecar(source_key, dest_key, move):
+    """Follow a copy/move with the object's sidecar (best effort; the player works without one)"""
+    router = await get_router_async()
+    source, dest = sidecar_key(source_key), sidecar_key(dest_key)
+    sidecars.forget(dest_key)
+    for target in router.locate(source):
+        try:
+            await run_blocking(target.client.copy_object, Bucket=target.bucket, Key=dest,
+                               CopySource={'Bucket': target.bucket, 'Key': source})
+            if move:
+                await run_blocking(target.client.delete_object, Bucket=target.bucket, Key=source)
+        except Exception as e:
+            logger.debug(f"No sidecar carried for {source_key} on {target.name}: {e}")
+            return
+    if move:
+        router.rename(source, dest)
+        sidecars.forget(source_key)
+    else:
+        router.copy_entry(source, dest)
+
+async def drop_sidecar(key):
+    router = await get_router_async()
+    sidecars.forget(key)
+    for target in router.locate(sidecar_key(key)):
+        try:
+            await run_blocking(target.client.delete_object, Bucket=target.bucket, Key=sidecar_key(key))
+        except Exception as e:
+            logger.debug(f"Sidecar delete for {key} on {target.name} failed: {e}")
+    router.forget(sidecar_key(key))
+
+# --- Server-Side Copy / Move ---
+async def copy_within_target(target, source_key, dest_key):
+    """Copy an object inside one bucket: copy_object when small, parallel upload_part_copy when large"""
+    head = await run_blocking(target.client.head_object, Bucket=target.bucket, Key=source_key)
+    size = head['ContentLength']
+    source = {'Bucket': target.bucket, 'Key': source_key}
+    
+    if size <= COPY_MULTIPART_THRESHOLD:
+        with tracer.span("copy.single", size=size, target=target.name):
+            await run_blocking(target.client.copy_object, Bucket=target.bucket, Key=dest_key, CopySource=source)
+        return size
+    
+    # Multipart copies don't carry headers over, so set them on the new upload
+    extra_args = {'Metadata': head.get('Metadata', {})}
+    for field in ('ContentType', 'ContentEncoding', 'ContentDisposition', 'CacheControl'):
+        if head.get(field):
+            extra_args[field] = head[field]
+    part_size = max(COPY_PART_SIZE, math.ceil(size / 10000))
+    mpu = await run_blocking(target.client.create_multipart_upload, Bucket=target.bucket, Key=dest_key, **extra_args)
+    mpu_id = mpu['UploadId']
+    
+    async def _copy_part(part_num):
+        start = (part_num - 1) * part_size
+        end = min(start + part_size, size) - 1
+        with tracer.span("copy.part", part=part_num, size=end - start + 1):
+            response = await run_blocking(
+                target.client.upload_part_copy,
+                Bucket=target.bucket, Key=dest_key, UploadId=mpu_id, PartNumber=part_num,
+                CopySource=source, CopySourceRange=f"bytes={start}-{end}"
+            )
+        return {'ETag': response['CopyPartResult']['ETag'], 'PartNumber': part_num}
+    
+    try:
+        with tracer.span("copy.multipart", size=size, target=target.name):
+            parts = await asyncio.gather(*(_copy_part(n) for n in range(1, math.ceil(size / part_size) + 1)))
+            # The new key only appears once the upload completes
+            await run_blocking(
+                target.client.complete_multipart_upload,
+                Bucket=target.bucket, Key=dest_key, UploadId=mpu_id, MultipartUpload={'Parts': parts}
+            )
+    except Exception:
+        try:
+            await run_blocking(target.client.abort_multipart_upload, Bucket=target.bucket, Key=dest_key, UploadId=mpu_id)
+        except Exception:
+            pass
+        raise
+    return size
+
+async def copy_object(source_key, dest_key, move=False):
+    """Server-side copy on every target holding the object; a move deletes the source only after all copies succeed"""
+    router = await get_router_async()
+    if not router:
+        raise RuntimeError("Storage is not available")
+    holders = router.locate(source_key)
+    if await object_exists(holders[0], dest_key):
+        raise FileExistsError(f"{dest_key} already exists")
+    
+    results = await asyncio.gather(
+        *(copy_within_target(t, source_key, dest_key) for t in holders), return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        # All-or-nothing: drop the copies that did land
+        for target, result in zip(holders, results):
+            if not isinstance(result, Exception):
+                await run_blocking(target.client.delete_object, Bucket=target.bucket, Key=dest_key)
+        raise errors[0]
+    
+    if move:
+        router.rename(source_key, dest_key)
+        callback_data.rename_file(source_key, dest_key)
+        key_migration.renamed(source_key, dest_key)
+        for target in holders:
+            try:
+                await run_blocking(target.client.delete_object, Bucket=target.bucket, Key=source_key)
+            except Exception as e:
+                logger.warning(f"Moved {source_key} but could not delete it from {target.name}: {e}")
+    else:
+        router.copy_entry(source_key, dest_key)
+    if is_video_file(source_key):
+        await carry_sidecar(source_key, dest_key, move)
+    if move:
+        await run_blocking(key_migration.save)
+    await save_object_index()
+    return results[0]
+
+async def object_exists(target, key):
+    try:
+        await run_blocking(target.client.head_object, Bucket=target.bucket, Key=key)
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
 # --- Optimized File Download ---
-async def download_file_ultrafast(client, message, file_path, status_message):
-    """Ultra-fast file download from Telegram"""
+async def download_file_ultrafast(client, message, file_path, status_message, shaper=None):
+    """Ultra-fast file download from Telegram into a preallocated temp file"""
     try:
         # Start transfer stats
         transfer_stats.start()
         progress_cache[status_message.id] = 0
         
-        await client.download_media(
-            message=message,
-            file_name=file_path,
-            progress=progress_callback,
-            progress_args=(status_message, "⬇️ Downloading...", "download")
-        )
+        media = message.document or message.video or message.audio
+        total = media.file_size
+        current = 0
+        
+        # Stream into the preallocated file in place (download_media would recreate it).
+        # Writes run in the pool, each overlapping the receive of the next chunk
+        loop = asyncio.get_event_loop()
+        with open(file_path, 'r+b', buffering=BUFFER_SIZE) as f:
+            pending_write = None
+            try:
+                async for chunk in client.stream_media(message):
+                    if pending_write:
+                        await pending_write
+                    pending_write = loop.run_in_executor(thread_pool, f.write, chunk)
+                    current += len(chunk)
+                    if shaper:
+                        await shaper.consume(len(chunk))
+                    await progress_callback(current, total, status_message, "⬇️ Downloading...", "download")
+            finally:
+                # Never close the file under an in-flight write
+                if pending_write:
+                    await pending_write
+            await run_blocking(f.truncate, current)
         
         # Clear progress cache
         if status_message.id in progress_cache:
@@ -532,6 +1123,8 @@ async def handle_callback_query(client, callback_query):
     message = callback_query.message
     
     try:
+        await ensure_ready(users)
+        
         # Parse callback data (format: "action_id")
         if '_' not in data:
             await callback_query.answer("❌ Invalid button data", show_alert=True)
@@ -543,6 +1136,7 @@ async def handle_callback_query(client, callback_query):
         if not filename:
             await callback_query.answer("❌ File data expired", show_alert=True)
             return
+        filename = key_migration.resolve(filename)
         
         logger.info(f"Callback: {action} for file: {filename}")
         
@@ -552,6 +1146,7 @@ async def handle_callback_query(client, callback_query):
                 return
                 
             presigned_url = await generate_presigned_url(filename)
+            await record_download(filename)
             
             if presigned_url:
                 # Shorten URL for copying
@@ -571,6 +1166,7 @@ async def handle_callback_query(client, callback_query):
                 return
                 
             presigned_url = await generate_presigned_url(filename)
+            await record_download(filename)
             player_url = generate_player_url(filename, presigned_url) if presigned_url else None
             
             if player_url:
@@ -590,7 +1186,7 @@ async def handle_callback_query(client, callback_query):
                 return
                 
             try:
-                s3_client.delete_object(Bucket=WASABI_BUCKET, Key=filename)
+                await delete_object(filename)
                 await callback_query.answer("✅ File deleted!", show_alert=True)
                 await message.edit_text(
                     f"🗑 **File Deleted**\n\n`{filename}` has been removed from storage.",
@@ -603,10 +1199,28 @@ async def handle_callback_query(client, callback_query):
             except Exception as e:
                 await callback_query.answer(f"❌ Delete failed", show_alert=True)
                 
+        elif action == "ren":  # Rename (asks for the new name with a forced reply)
+            if user_id != ADMIN_ID:
+                await callback_query.answer("⛔️ Only admin can rename!", show_alert=True)
+                return
+            
+            await callback_query.answer()
+            prompt = await message.reply_text(
+                f"✏️ Reply with a new name for `{filename}`",
+                reply_markup=ForceReply(selective=True)
+            )
+            pending_renames[prompt.id] = (filename, message, time.time() + RENAME_PROMPT_TTL)
+            rename_pending(prompt.id)
+                
         elif action == "ref":  # Refresh
             if user_id not in ALLOWED_USERS:
                 await callback_query.answer("⛔️ You are not authorized!", show_alert=True)
                 return
+            
+            allowed, retry_after = quota_manager.check_operation(user_id)
+            if not allowed:
+                await callback_query.answer(f"⏳ Too many requests, try again in {math.ceil(retry_after)}s", show_alert=True)
+                return
                 
             await callback_query.answer("🔄 Generating fresh links...")
             
@@ -683,6 +1297,7 @@ async def help_handler(client: Client, message: Message):
 • 📋 Copy Links - Get shortened link text
 • 🔄 New Links - Generate fresh URLs
 • 🗑 Delete File - Remove from storage (Admin)
+• ✏️ Rename - Rename without re-uploading (Admin)
 
 **URL Shortening:** {shortener_status}
 
@@ -691,7 +1306,17 @@ async def help_handler(client: Client, message: Message):
 /help - Detailed help
 /stats - Bot statistics (Admin)
 /speedtest - Test upload speed
+/quota - Your remaining quota
 /toggleshorten - Toggle URL shortening (Admin)
+/trace [message_id] - Transfer timing waterfall (Admin)
+/exportlinks [prefix] - Export links for all files (Admin)
+/rename <key> <new name> - Rename a file in place (Admin)
+/move <key> <prefix/> - Move a file to another folder (Admin)
+/copy <key> <new key> - Copy a file server-side (Admin)
+/zip <key> <key> ... - Download several files as one ZIP
+/upload - Upload from your browser (no size limit)
+/encrypt [on|off] - Encrypt your uploads at rest
+/migratekeys [start|stop|cleanup] - Move files to the current key layout (Admin)
 """
     await message.reply_text(help_text, reply_markup=keyboard)
 
@@ -719,6 +1344,8 @@ async def add_user_handler(client: Client, message: Message):
     try:
         user_id_to_add = int(message.text.split(" ", 1)[1])
         ALLOWED_USERS.add(user_id_to_add)
+        quota_manager.add_user(user_id_to_add)
+        await save_users()
         
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("👥 List Users", callback_data="list_users")],
@@ -742,6 +1369,8 @@ async def remove_user_handler(client: Client, message: Message):
             return
         if user_id_to_remove in ALLOWED_USERS:
             ALLOWED_USERS.remove(user_id_to_remove)
+            quota_manager.remove_user(user_id_to_remove)
+            await save_users()
             
             keyboard = InlineKeyboardMarkup([
                 [InlineKeyboardButton("👥 List Users", callback_data="list_users")],
@@ -779,16 +1408,32 @@ async def stats_handler(client: Client, message: Message):
     """Show bot statistics"""
     shortener_status = "✅ Enabled" if AUTO_SHORTEN and GPLINKS_API_KEY else "❌ Disabled"
     
+    router = s3.peek()
+    if router:
+        targets_text = "\n".join(
+            f"  {'✅' if t.healthy else '❌'} {name}: {t.bucket} ({t.region})"
+            f"{f', {transfer_stats.human_speed(t.throughput.value)}' if t.throughput.value else ''}"
+            f"{f', {t.first_byte.value * 1000:.0f}ms' if t.first_byte.value is not None else ''}"
+            for name, t in router.targets.items()
+        )
+    else:
+        targets_text = f"  {WASABI_BUCKET} ({WASABI_REGION})"
+    
+    lag = loop_monitor.snapshot()
+    blocking_sites = "\n".join(f"  `{site}` ×{count}" for site, count in lag["top_sites"]) or "  none"
+    
     stats_text = (
         f"🤖 **Ultra-Fast Bot Statistics**\n"
         f"• Authorized users: {len(ALLOWED_USERS)}\n"
-        f"• Wasabi connected: {'✅' if s3_client else '❌'}\n"
+        f"• Wasabi connected: {'✅' if s3.peek() else '❌'}\n"
         f"• URL Shortening: {shortener_status}\n"
         f"• Thread workers: {MAX_WORKERS}\n"
         f"• Chunk size: {humanbytes(CHUNK_SIZE)}\n"
-        f"• Bucket: {WASABI_BUCKET}\n"
-        f"• Region: {WASABI_REGION}\n"
-        f"• Player URL: {RENDER_URL}"
+        f"• Temp space free: {humanbytes(temp_storage.available_capacity()) if storage.peek() else 'n/a'}\n"
+        f"• Storage targets:\n{targets_text}\n"
+        f"• Player URL: {RENDER_URL}\n"
+        f"• Loop lag: p50 ≤{lag['p50_ms']:.0f}ms, p99 ≤{lag['p99_ms']:.0f}ms, max {lag['lag']['max_ms']:.0f}ms\n"
+        f"• Loop blocks >{lag['threshold_ms']}ms: {lag['blocks']}\n{blocking_sites}"
     )
     
     keyboard = InlineKeyboardMarkup([
@@ -800,25 +1445,463 @@ async def stats_handler(client: Client, message: Message):
     
     await message.reply_text(stats_text, reply_markup=keyboard)
 
+@app.on_message(filters.command("trace"))
+@is_admin
+async def trace_handler(client: Client, message: Message):
+    """Render a text waterfall of the latest transfer (optionally for a message ID)"""
+    parts = message.text.split(" ", 1)
+    key = parts[1].strip() if len(parts) > 1 else None
+    if key is not None and not key.isdigit():
+        await message.reply_text("⚠️ **Usage:** /trace `[message_id]`")
+        return
+    
+    spans = await asyncio.get_event_loop().run_in_executor(thread_pool, tracer.latest, key)
+    if not spans:
+        await message.reply_text("🤷 No trace found for that transfer.")
+        return
+    
+    title = f"🧭 **Transfer Trace**{f' for `{key}`' if key else ''}"
+    waterfall = render_waterfall(spans)
+    if len(waterfall) + len(title) + 10 > TELEGRAM_TEXT_LIMIT:
+        # Still too long for one message (many spans besides parts): send it as a file
+        document = io.BytesIO(waterfall.encode())
+        document.name = f"trace_{key or 'latest'}.txt"
+        await message.reply_document(document, caption=title)
+        return
+    await message.reply_text(f"{title}\n\n```\n{waterfall}\n```")
+
+@app.on_message(filters.command("quota"))
+@is_authorized
+async def quota_handler(client: Client, message: Message):
+    """Show the user's remaining bandwidth and request quota"""
+    quota = quota_manager.remaining(message.from_user.id)
+    
+    def left(value):
+        return "♾ Unlimited" if value is None else humanbytes(value)
+    
+    await message.reply_text(
+        f"📊 **Your Quota**\n\n"
+        f"• Used (24h): {humanbytes(quota['day_used'])}\n"
+        f"• Left today: {left(quota['day_left'])}\n"
+        f"• Used (30 days): {humanbytes(quota['month_used'])}\n"
+        f"• Left this month: {left(quota['month_left'])}\n"
+        f"• Transfer rate: {'♾ Unlimited' if quota['rate'] is None else transfer_stats.human_speed(quota['rate'])}\n"
+        f"• Requests left this minute: {'♾ Unlimited' if quota['ops_left'] is None else quota['ops_left']}"
+    )
+
+@app.on_message(filters.command("encrypt"))
+@is_authorized
+async def encrypt_handler(client: Client, message: Message):
+    """Toggle client-side encryption of your future uploads (/encrypt on|off)"""
+    if ENCRYPTION_MASTER_KEY is None:
+        await message.reply_text("❌ Encryption is not configured on this bot.")
+        return
+    user_id = message.from_user.id
+    parts = message.text.split()
+    if len(parts) > 1 and parts[1].lower() in ("on", "off"):
+        enabled = parts[1].lower() == "on"
+    else:
+        enabled = not quota_manager.encrypts(user_id)
+    quota_manager.set_encryption(user_id, enabled)
+    await save_users()
+    
+    if enabled:
+        await message.reply_text(
+            f"🔒 **Encryption on** ({ENCRYPTION_CIPHER.upper()})\n\n"
+            "New uploads are encrypted before they leave the bot, with a fresh key per file.\n"
+            "The bucket only stores ciphertext; your links decrypt through the web player.\n"
+            "Direct browser uploads (/upload) can't be encrypted and are refused while this is on."
+        )
+    else:
+        await message.reply_text("🔓 **Encryption off.** New uploads are stored as-is.")
+
+def list_objects(router, prefix=""):
+    """Key -> LastModified under a prefix; replicas share keys, so list each healthy target and de-duplicate"""
+    objects = {}
+    for target in router.healthy_targets():
+        paginator = target.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=target.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if not is_sidecar(obj['Key']):
+                    objects.setdefault(obj['Key'], obj.get('LastModified'))
+    return objects
+
+def list_keys(router, prefix=""):
+    """Every key under a prefix, without originals a key migration keeps around for old links"""
+    return [key for key in list_objects(router, prefix) if not key_migration.aliased(key)]
+
+@app.on_message(filters.command("exportlinks"))
+@is_admin
+async def export_links_handler(client: Client, message: Message):
+    """Presign every object (optionally under a prefix) and send the links as a file"""
+    parts = message.text.split(" ", 1)
+    prefix = parts[1].strip() if len(parts) > 1 else ""
+    status_message = await message.reply_text("📤 Listing objects...")
+    
+    router = await get_router_async()
+    if not router:
+        await status_message.edit_text("❌ **Error:** Wasabi client is not initialized.")
+        return
+    
+    def _presign_all(keys):
+        # One batch per serving target keeps the shared-timestamp fast path
+        by_target = {}
+        for key in keys:
+            by_target.setdefault(router.target_for(key).name, []).append(key)
+        urls = {}
+        for name, target_keys in by_target.items():
+            signed = router.targets[name].presigner.presign_many(target_keys, PRESIGN_EXPIRY)
+            urls.update(zip(target_keys, signed))
+        return [stream_link(urls[key], key) if RENDER_URL and router.is_encrypted(key) else urls[key] for key in keys]
+    
+    loop = asyncio.get_event_loop()
+    try:
+        keys = await loop.run_in_executor(thread_pool, list_keys, router, prefix)
+        if not keys:
+            await status_message.edit_text("🤷 No objects found.")
+            return
+        
+        start = time.perf_counter()
+        urls = await loop.run_in_executor(thread_pool, _presign_all, keys)
+        elapsed = time.perf_counter() - start
+        
+        export = io.BytesIO("\n".join(f"{key}\t{url}" for key, url in zip(keys, urls)).encode())
+        export.name = f"links_{int(time.time())}.tsv"
+        await message.reply_document(
+            export,
+            caption=f"🔗 {len(keys)} links (valid 7 days), signed in {elapsed * 1000:.0f}ms"
+        )
+        await status_message.delete()
+    except Exception as e:
+        logger.error(f"Link export failed: {e}")
+        await status_message.edit_text(f"❌ Export failed: {str(e)}")
+
+# --- Multi-file ZIP downloads ---
+ZIP_MAX_FILES = 1000  # Matches the web tier's per-archive cap
+ZIP_SIGNED_URL_MAX = 2000  # Longer signed links don't fit comfortably in a button URL
+selections = SelectionStore(config.SELECTIONS_FILE)
+
+@app.on_message(filters.command("zip"))
+@is_authorized
+async def zip_handler(client: Client, message: Message):
+    """One download link that streams several files as a single ZIP"""
+    args = parse_key_args(message.text, None)
+    if not args:
+        await message.reply_text(
+            '⚠️ **Usage:** /zip `<key>` `<key>` ... or /zip `<prefix/>` (Admin)\n'
+            'Quote keys with spaces.'
+        )
+        return
+    
+    router = await get_router_async()
+    if not router:
+        await message.reply_text("❌ **Error:** Wasabi client is not initialized.")
+        return
+    
+    if len(args) == 1 and args[0].endswith('/'):
+        # A whole folder can be large and span other users' files
+        if message.from_user.id != ADMIN_ID:
+            await message.reply_text("⛔️ Zipping a whole prefix is for the admin only.")
+            return
+        prefix = args[0].lstrip('/')
+        keys = await run_blocking(list_keys, router, prefix)
+        name = prefix.rstrip('/').rsplit('/', 1)[-1] or "files"
+    else:
+        keys = list(dict.fromkeys(key_migration.resolve(key) for key in args))
+        name = None
+        # Keys are guessable: other users may only bundle what they uploaded themselves
+        if message.from_user.id != ADMIN_ID:
+            foreign = [key for key in keys if router.owner(key) != message.from_user.id]
+            if foreign:
+                await message.reply_text(
+                    f"⛔️ You can only zip files you uploaded. Not yours: `{'`, `'.join(foreign[:5])}`"
+                    + (f" and {len(foreign) - 5} more" if len(foreign) > 5 else "")
+                )
+                return
+    
+    if not keys:
+        await message.reply_text("🤷 No objects found.")
+        return
+    if len(keys) > ZIP_MAX_FILES:
+        await message.reply_text(f"⚠️ At most {ZIP_MAX_FILES} files per archive ({len(keys)} selected).")
+        return
+    
+    # Short selections travel in the link itself (signed, nothing stored); long ones are saved
+    expires = int(time.time()) + PRESIGN_EXPIRY
+    query = [('key', key) for key in keys] + ([('name', name)] if name else [])
+    query += [('expires', expires), ('sig', sign_keys(config.LINK_SIGNING_KEY, keys, expires))]
+    zip_url = f"{RENDER_URL}/zip?{urlencode(query)}"
+    if len(zip_url) > ZIP_SIGNED_URL_MAX:
+        token = await run_blocking(selections.create, keys, name, message.from_user.id)
+        zip_url = f"{RENDER_URL}/zip/{token}"
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("📦 Download ZIP", url=zip_url)]])
+    await message.reply_text(
+        f"📦 **{len(keys)} files** ready as one ZIP (valid 7 days).\n"
+        "The archive is streamed straight from storage: no waiting for it to be built.",
+        reply_markup=keyboard
+    )
+
+# --- Rename / Move / Copy (server-side, no re-transfer) ---
+def parse_key_args(text, count=None):
+    """Command arguments, allowing "quoted keys with spaces" (None if malformed; count=None takes any number)"""
+    try:
+        args = shlex.split(text)[1:]
+    except ValueError:
+        return None
+    return args if count is None or len(args) == count else None
+
+def renamed_key(key, new_name):
+    """Same prefix, new last path segment"""
+    prefix, _, _ = key.rpartition('/')
+    return f"{prefix}/{new_name}" if prefix else new_name
+
+async def run_copy(message, source_key, dest_key, move, verb):
+    """Copy/move an object, then reply with fresh links for the new key"""
+    if not dest_key or dest_key == source_key or dest_key.endswith('/'):
+        await message.reply_text("⚠️ The new name must differ from the current one.")
+        return None
+    
+    status_message = await message.reply_text(f"⏳ {verb.capitalize()} `{source_key}`...")
+    try:
+        with tracer.span("copy", source=source_key, dest=dest_key, move=move):
+            size = await copy_object(source_key, dest_key, move=move)
+    except FileExistsError:
+        await status_message.edit_text(f"❌ `{dest_key}` already exists.")
+        return None
+    except Exception as e:
+        logger.error(f"{verb.capitalize()} {source_key} -> {dest_key} failed: {e}")
+        await status_message.edit_text(f"❌ {verb.capitalize()} failed: {str(e)}")
+        return None
+    
+    presigned_url = await generate_presigned_url(dest_key)
+    player_url = generate_player_url(dest_key, presigned_url) if presigned_url and is_video_file(dest_key) else None
+    keyboard = await create_link_buttons(presigned_url, player_url, dest_key) if presigned_url else None
+    await status_message.edit_text(
+        f"✅ **Done** ({humanbytes(size)}, copied server-side)\n\n`{source_key}`\n➡️ `{dest_key}`",
+        reply_markup=keyboard
+    )
+    return keyboard
+
+@app.on_message(filters.command("rename"))
+@is_admin
+async def rename_handler(client: Client, message: Message):
+    """Rename an object in place (same prefix)"""
+    args = parse_key_args(message.text, 2)
+    if not args or '/' in args[1]:
+        await message.reply_text('⚠️ **Usage:** /rename `<key>` `<new name>` (quote names with spaces)')
+        return
+    source_key = key_migration.resolve(args[0])
+    await run_copy(message, source_key, renamed_key(source_key, args[1]), True, "renaming")
+
+@app.on_message(filters.command("move"))
+@is_admin
+async def move_handler(client: Client, message: Message):
+    """Move an object under another prefix"""
+    args = parse_key_args(message.text, 2)
+    if not args:
+        await message.reply_text('⚠️ **Usage:** /move `<key>` `<prefix/>` (use `/` for the top level)')
+        return
+    source_key, prefix = key_migration.resolve(args[0]), args[1]
+    prefix = prefix.strip('/')
+    dest_key = f"{prefix}/{source_key.rsplit('/', 1)[-1]}" if prefix else source_key.rsplit('/', 1)[-1]
+    await run_copy(message, source_key, dest_key, True, "moving")
+
+@app.on_message(filters.command("copy"))
+@is_admin
+async def copy_handler(client: Client, message: Message):
+    """Copy an object to a new key (a trailing / keeps the file name)"""
+    args = parse_key_args(message.text, 2)
+    if not args:
+        await message.reply_text('⚠️ **Usage:** /copy `<key>` `<new key or prefix/>`')
+        return
+    source_key, dest_key = key_migration.resolve(args[0]), args[1]
+    if dest_key.endswith('/'):
+        dest_key = dest_key.lstrip('/') + source_key.rsplit('/', 1)[-1]
+    await run_copy(message, source_key, dest_key, False, "copying")
+
+@app.on_message(
+    filters.text & filters.reply & ~filters.regex(r"^/")
+    & filters.create(lambda _, __, m: rename_pending(m.reply_to_message_id))
+)
+async def rename_reply_handler(client: Client, message: Message):
+    """New name sent in reply to a Rename button prompt"""
+    if message.from_user.id != ADMIN_ID:
+        return
+    source_key, file_message, _ = pending_renames.pop(message.reply_to_message_id)
+    new_name = message.text.strip()
+    if not new_name or '/' in new_name:
+        await message.reply_text("⚠️ Names can't be empty or contain `/`. Press ✏️ Rename to try again.")
+        return
+    keyboard = await run_copy(message, source_key, renamed_key(source_key, new_name), True, "renaming")
+    if keyboard:
+        # The old message's URL buttons point at the old key
+        try:
+            await file_message.edit_reply_markup(reply_markup=keyboard)
+        except Exception as e:
+            logger.debug(f"Could not refresh buttons after rename: {e}")
+
+# --- Key Layout Migration (originals stay until every link to them has expired) ---
+migration_task = None
+migration_stopping = False
+
+async def migrate_key(old_key, new_key):
+    """Server-side copy to the new key, then point callbacks and lookups at it"""
+    try:
+        await copy_object(old_key, new_key)
+    except FileExistsError:
+        # The copy landed before an interruption: keep it if it's complete
+        router = await get_router_async()
+        holder = router.locate(old_key)[0]
+        old_head, new_head = await asyncio.gather(
+            run_blocking(holder.client.head_object, Bucket=holder.bucket, Key=old_key),
+            run_blocking(holder.client.head_object, Bucket=holder.bucket, Key=new_key)
+        )
+        if old_head['ContentLength'] != new_head['ContentLength']:
+            raise
+        router.copy_entry(old_key, new_key)
+        if is_video_file(old_key):
+            await carry_sidecar(old_key, new_key, False)
+    callback_data.rename_file(old_key, new_key)
+    key_migration.mark_moved(old_key, new_key)
+
+def migration_summary(title):
+    status = key_migration.status()
+    return (
+        f"{title}\n\n"
+        f"• Layout: `{key_layout.template}`\n"
+        f"• Moved: {status['moved']}\n"
+        f"• Left: {status['pending']}\n"
+        f"• Failed: {status['failed']}\n"
+        f"• Originals kept for old links: {status['moved'] - status['retired']} "
+        f"({status['due']} ready for /migratekeys cleanup)"
+    )
+
+async def run_key_migration(status_message):
+    """Plan moves from the bucket listing, then copy in parallel batches, saving progress after each"""
+    router = await get_router_async()
+    started = time.time()
+    last_update = started
+    try:
+        objects = await run_blocking(list_objects, router)
+        planned = {}
+        for key, modified in objects.items():
+            new_key = migrated_key(key, modified)
+            if new_key and not key_migration.aliased(key):
+                planned[key] = new_key
+        added = key_migration.plan(planned)
+        await run_blocking(key_migration.save)
+        logger.info(f"🚚 Key migration: {added} objects queued for {key_layout.template}")
+        
+        while not migration_stopping:
+            batch = key_migration.next_batch(config.KEY_MIGRATION_PARALLEL)
+            if not batch:
+                break
+            with tracer.span("migrate.batch", size=len(batch)):
+                results = await asyncio.gather(*(migrate_key(old, new) for old, new in batch), return_exceptions=True)
+            for (old_key, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Key migration of {old_key} failed: {result}")
+                    key_migration.mark_failed(old_key, result)
+            await run_blocking(key_migration.save)
+            if time.time() - last_update > 5:
+                last_update = time.time()
+                try:
+                    await status_message.edit_text(migration_summary("🚚 **Migrating keys...**"))
+                except Exception:
+                    pass
+        
+        title = "⏸ **Key migration paused**" if migration_stopping else "✅ **Key migration complete**"
+        await status_message.edit_text(migration_summary(f"{title} ({time.time() - started:.0f}s)"))
+    except Exception as e:
+        logger.error(f"Key migration stopped: {e}")
+        await run_blocking(key_migration.save)
+        await status_message.edit_text(f"❌ Key migration stopped: {str(e)}\n/migratekeys start resumes it.")
+
+@app.on_message(filters.command("migratekeys"))
+@is_admin
+async def migrate_keys_handler(client: Client, message: Message):
+    """Move objects from previous key layouts to KEY_LAYOUT (/migratekeys start|stop|cleanup)"""
+    global migration_task, migration_stopping
+    parts = message.text.split()
+    action = parts[1].lower() if len(parts) > 1 else "status"
+    running = migration_task is not None and not migration_task.done()
+    
+    if action == "start":
+        if running:
+            await message.reply_text("🚚 A key migration is already running. /migratekeys shows its progress.")
+            return
+        if not previous_key_layouts and not key_migration.status()["pending"]:
+            await message.reply_text(
+                f"🤷 Nothing to migrate: new keys already use `{key_layout.template}`.\n"
+                "Set KEY_LAYOUT (e.g. `{h1}/{h2}/{uuid}/{name}`) to shard new keys, then run this again."
+            )
+            return
+        if not await get_router_async():
+            await message.reply_text("❌ **Error:** Wasabi client is not initialized.")
+            return
+        migration_stopping = False
+        status_message = await message.reply_text("🚚 Listing objects to migrate...")
+        migration_task = asyncio.ensure_future(run_key_migration(status_message))
+    elif action == "stop":
+        if not running:
+            await message.reply_text("🤷 No key migration is running.")
+            return
+        migration_stopping = True
+        await message.reply_text("🛑 Stopping after the current batch. /migratekeys start resumes it.")
+    elif action == "cleanup":
+        if running:
+            await message.reply_text("⏳ Wait for the migration to finish (or /migratekeys stop it) first.")
+            return
+        due = key_migration.due_retirements()
+        deleted = 0
+        for old_key in due:
+            try:
+                await delete_object(old_key)
+                key_migration.retired(old_key)
+                deleted += 1
+            except Exception as e:
+                logger.error(f"Could not retire {old_key}: {e}")
+        await run_blocking(key_migration.save)
+        await message.reply_text(migration_summary(f"🧹 **Removed {deleted}/{len(due)} originals** whose links have expired"))
+    else:
+        title = "🚚 **Key migration running**" if running else "🗂 **Key layout**"
+        await message.reply_text(migration_summary(title))
+
 @app.on_message(filters.command("speedtest"))
 @is_authorized
 async def speed_test_handler(client: Client, message: Message):
     """Test upload speed with a small file"""
+    allowed, retry_after = quota_manager.check_operation(message.from_user.id)
+    if not allowed:
+        await message.reply_text(f"⏳ Too many requests. Try again in {math.ceil(retry_after)}s.")
+        return
+    
     test_message = await message.reply_text("🚀 Starting speed test...")
     
     # Create a test file
     test_size = 10 * 1024 * 1024  # 10MB
-    test_filename = f"speedtest_{int(time.time())}.bin"
-    test_filepath = f"./downloads/{test_filename}"
+    test_filename = key_layout.new_key("speedtest.bin", message.from_user.id)
+    reservation = None
     
     try:
-        # Create test file with random data
-        with open(test_filepath, 'wb') as f:
-            f.write(os.urandom(test_size))
+        if not await get_router_async():
+            raise RuntimeError("Wasabi client is not initialized")
+        
+        # reserve() preallocates with posix_fallocate, which can stall on slow disks
+        reservation = await run_blocking((await ensure_ready(storage)).reserve, test_filename, test_size)
+        test_filepath = reservation.path
+        
+        # Create test file with random data (off the loop, 10MB of urandom takes a while)
+        def _write_test_file():
+            with open(test_filepath, 'r+b') as f:
+                f.write(os.urandom(test_size))
+        await asyncio.get_event_loop().run_in_executor(thread_pool, _write_test_file)
         
         # Upload with timing
         start_time = time.time()
-        await upload_to_wasabi_parallel(test_filepath, test_filename, test_message)
+        target = await upload_to_wasabi_parallel(
+            test_filepath, test_filename, test_message, quota_manager.byte_bucket(message.from_user.id)
+        )
         upload_time = time.time() - start_time
         
         speed = test_size / upload_time
@@ -835,24 +1918,119 @@ async def speed_test_handler(client: Client, message: Message):
             f"• File Size: {humanbytes(test_size)}\n"
             f"• Upload Time: {upload_time:.2f}s\n"
             f"• Average Speed: {speed_human}\n"
+            f"• Target: {target.name} ({target.region})\n"
             f"• Status: ✅ Ultra-Fast Mode Active",
             reply_markup=keyboard
         )
         
         # Cleanup
-        os.remove(test_filepath)
-        s3_client.delete_object(Bucket=WASABI_BUCKET, Key=test_filename)
+        await delete_object(test_filename)
         
     except Exception as e:
         await test_message.edit_text(f"❌ Speed test failed: {str(e)}")
-        if os.path.exists(test_filepath):
-            os.remove(test_filepath)
+    finally:
+        if reservation:
+            reservation.release()
+
+async def upload_result(user_id, file_name, file_size, key):
+    """Final "uploaded" message, role-appropriate link buttons and the direct URL for a stored file"""
+    presigned_url = await generate_presigned_url(key)
+    player_url = generate_player_url(key, presigned_url) if is_video_file(file_name) else None
+    
+    # Buttons based on user role with proper callback data
+    if user_id == ADMIN_ID:
+        keyboard = await create_link_buttons(presigned_url, player_url, key)
+    else:
+        keyboard = await create_simple_buttons(presigned_url, player_url, key)
+    
+    shortener_status = "🔗 URLs Auto-Shortened" if AUTO_SHORTEN and GPLINKS_API_KEY else "🔗 Direct URLs"
+    router = s3.peek()
+    encrypted = f"**Encryption:** 🔒 {ENCRYPTION_CIPHER.upper()}\n" if router and router.is_encrypted(key) else ""
+    final_message = (
+        f"✅ **File Uploaded Successfully!** ⚡\n\n"
+        f"**File:** `{file_name}`\n"
+        f"**Size:** {humanbytes(file_size)}\n"
+        f"**Stored as:** `{key}`\n"
+        f"{encrypted}"
+        f"**URLs:** {shortener_status}\n\n"
+        f"**Links valid for 7 days**"
+    )
+    return final_message, keyboard, presigned_url
+
+# --- Browser-direct uploads (bytes go browser -> storage, never through this host) ---
+def browser_upload_refused(user_id):
+    """Browser parts never pass through the bot, so they can't be encrypted: refuse instead of storing plaintext"""
+    if ENCRYPTION_MASTER_KEY is not None and quota_manager.encrypts(user_id):
+        return "Direct uploads can't be encrypted. Send the file to the bot, or turn encryption off with /encrypt off."
+    return None
+
+def admit_browser_upload(user_id, size):
+    """Quota gate for the web tier (thread-safe); returns a refusal message or None"""
+    if user_id not in ALLOWED_USERS:
+        return "You are no longer authorized to upload."
+    refused = browser_upload_refused(user_id)
+    if refused:
+        return refused
+    allowed, retry_after = quota_manager.check_operation(user_id)
+    if not allowed:
+        return f"Too many requests. Try again in {math.ceil(retry_after)}s."
+    exceeded = quota_manager.check_bytes(user_id, size)
+    if exceeded:
+        return f"This file would exceed your {exceeded} quota. See /quota in the bot."
+    return None
+
+async def announce_browser_upload(session):
+    """Runs on the bot loop once the web tier completed an upload: count it and post the links"""
+    quota_manager.record_bytes(session["user_id"], session["size"])
+    await save_users()
+    final_message, keyboard, presigned_url = await upload_result(
+        session["user_id"], session["file_name"], session["size"], session["key"]
+    )
+    await app.send_message(
+        session["chat_id"], final_message,
+        reply_markup=keyboard, disable_web_page_preview=True
+    )
+    return presigned_url
+
+async def sweep_browser_uploads():
+    """Periodically abort abandoned browser uploads, including ones orphaned by a restart"""
+    while True:
+        router = await get_router_async()
+        if router:
+            try:
+                await run_blocking(browser_uploads.abort_stale, router)
+            except Exception as e:
+                logger.warning(f"Browser upload sweep failed: {e}")
+        await asyncio.sleep(UPLOAD_SWEEP_INTERVAL)
+
+@app.on_message(filters.command("upload"))
+@is_authorized
+async def browser_upload_handler(client: Client, message: Message):
+    """Link to the web upload page: any size, uploaded in parallel parts straight to storage"""
+    if not RENDER_URL:
+        await message.reply_text("❌ **Error:** The web app URL is not configured.")
+        return
+    refused = browser_upload_refused(message.from_user.id)
+    if refused:
+        await message.reply_text(f"🔒 {refused}")
+        return
+    token = await run_blocking(browser_uploads.issue, message.from_user.id, message.chat.id)
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("🌐 Open Upload Page", url=f"{RENDER_URL}/upload/{token}")
+    ]])
+    await message.reply_text(
+        "🌐 **Direct Upload**\n\n"
+        "Files go straight from your browser to storage, so there is no Telegram size limit.\n"
+        "Links for each file will be posted here when it finishes.\n\n"
+        "The page link is personal and valid for 24 hours.",
+        reply_markup=keyboard
+    )
 
 # --- Fixed File Handling with Proper Callback Data ---
 @app.on_message(filters.document | filters.video | filters.audio)
 @is_authorized
 async def file_handler(client: Client, message: Message):
-    if not s3_client:
+    if not await get_router_async():
         await message.reply_text("❌ **Error:** Wasabi client is not initialized.")
         return
 
@@ -862,102 +2040,121 @@ async def file_handler(client: Client, message: Message):
     
     # Telegram's limit for bots is 2GB for download, 4GB for upload with MTProto API
     if file_size > 4 * 1024 * 1024 * 1024:
-        await message.reply_text("❌ **Error:** File is larger than 4GB, which is not supported.")
+        await message.reply_text("❌ **Error:** File is larger than 4GB. Use /upload to send it from your browser instead.")
         return
 
-    status_message = await message.reply_text("🚀 Starting ultra-fast transfer...")
-    
-    # Create unique file path
-    timestamp = int(time.time())
-    safe_filename = f"{timestamp}_{file_name}"
-    file_path = f"./downloads/{safe_filename}"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Per-user operation rate and rolling byte quotas
+    user_id = message.from_user.id
+    allowed, retry_after = quota_manager.check_operation(user_id)
+    if not allowed:
+        await message.reply_text(f"⏳ Too many requests. Try again in {math.ceil(retry_after)}s.")
+        return
+    exceeded = quota_manager.check_bytes(user_id, file_size)
+    if exceeded:
+        await message.reply_text(f"❌ **Error:** This file would exceed your {exceeded} quota. See /quota.")
+        return
+    shaper = quota_manager.byte_bucket(user_id)
 
+    # Admission: reserve temp space up front (collision-free, preallocated path)
+    temp = await ensure_ready(storage)
+    if not temp:
+        await message.reply_text("❌ **Error:** Temporary storage is not available.")
+        return
     try:
-        # 1. Ultra-fast download from Telegram
-        await download_file_ultrafast(client, message, file_path, status_message)
-        await status_message.edit_text("✅ Download complete. Starting instant upload...")
-
-        # 2. Ultra-fast upload to Wasabi
-        await upload_to_wasabi_parallel(file_path, safe_filename, status_message)
-        
-        # Show shortening status if enabled
-        if AUTO_SHORTEN and GPLINKS_API_KEY:
-            await status_message.edit_text("✅ Upload complete! Shortening URLs...")
-        else:
-            await status_message.edit_text("✅ Upload complete! Generating links...")
-        
-        # 3. Generate URLs
-        presigned_url = await generate_presigned_url(safe_filename)
-        player_url = generate_player_url(safe_filename, presigned_url) if is_video_file(file_name) else None
-        
-        # 4. Create buttons based on user role with proper callback data
-        if message.from_user.id == ADMIN_ID:
-            keyboard = await create_link_buttons(presigned_url, player_url, safe_filename)
-        else:
-            keyboard = await create_simple_buttons(presigned_url, player_url, safe_filename)
-        
-        # 5. Prepare final message
-        shortener_status = "🔗 URLs Auto-Shortened" if AUTO_SHORTEN and GPLINKS_API_KEY else "🔗 Direct URLs"
-        
-        final_message = (
-            f"✅ **File Uploaded Successfully!** ⚡\n\n"
-            f"**File:** `{file_name}`\n"
-            f"**Size:** {humanbytes(file_size)}\n"
-            f"**Stored as:** `{safe_filename}`\n"
-            f"**URLs:** {shortener_status}\n\n"
-            f"**Links valid for 7 days**"
+        reservation = await asyncio.get_event_loop().run_in_executor(
+            thread_pool, temp.reserve, file_name, file_size
         )
-        
-        await status_message.edit_text(final_message, reply_markup=keyboard, disable_web_page_preview=True)
+    except InsufficientSpaceError as e:
+        logger.warning(f"Rejected {file_name}: {e}")
+        await message.reply_text(
+            f"❌ **Error:** Not enough temporary space right now "
+            f"({humanbytes(temp.available_capacity())} free). Please try again later."
+        )
+        return
 
-    except Exception as e:
-        logger.error(f"Transfer failed: {e}")
-        await status_message.edit_text(f"❌ **Transfer failed:** {str(e)}")
-    finally:
-        # Cleanup local file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    status_message = await message.reply_text("🚀 Starting ultra-fast transfer...")
+    
+    # Object key (from KEY_LAYOUT) and local path
+    safe_filename = key_layout.new_key(file_name, user_id)
+    file_path = reservation.path
 
-# --- Flask Web Server for Player ---
-web_app = Flask(__name__)
+    # Root span for this transfer, looked up by /trace <message_id>
+    trace = tracer.start_trace(
+        "transfer",
+        keys=(message.id, status_message.id),
+        message_id=message.id,
+        status_message_id=status_message.id,
+        user_id=message.from_user.id,
+        file_name=file_name,
+        size=file_size
+    )
+    with tracer.activate(trace):
+        try:
+            # 1. Ultra-fast download from Telegram
+            with tracer.span("download", size=file_size):
+                await download_file_ultrafast(client, message, file_path, status_message, shaper)
+            await status_message.edit_text("✅ Download complete. Starting instant upload...")
 
-@web_app.route('/')
-def index():
-    return render_template('index.html', render_url=RENDER_URL)
+            # 2. Ultra-fast upload to Wasabi, with the player's sidecar written alongside
+            encrypt = ENCRYPTION_MASTER_KEY is not None and quota_manager.encrypts(user_id)
+            upload = upload_to_wasabi_parallel(
+                file_path, safe_filename, status_message, shaper, encrypt=encrypt, owner=user_id
+            )
+            if is_video_file(file_name):
+                await asyncio.gather(upload, store_sidecar(client, media, file_path, safe_filename, file_name, encrypt))
+            else:
+                await upload
+            quota_manager.record_bytes(user_id, file_size)
+            await save_users()
+        
+            # Show shortening status if enabled
+            if AUTO_SHORTEN and GPLINKS_API_KEY:
+                await status_message.edit_text("✅ Upload complete! Shortening URLs...")
+            else:
+                await status_message.edit_text("✅ Upload complete! Generating links...")
+        
+            # 3. Generate URLs and buttons
+            final_message, keyboard, _ = await upload_result(user_id, file_name, file_size, safe_filename)
+            await status_message.edit_text(final_message, reply_markup=keyboard, disable_web_page_preview=True)
 
-@web_app.route('/player/<file_type>/<encoded_url>')
-def player(file_type, encoded_url):
-    try:
-        # Decode the URL
-        padding = 4 - (len(encoded_url) % 4)
-        encoded_url += '=' * padding
-        video_url = base64.urlsafe_b64decode(encoded_url).decode()
-        
-        return render_template('player.html', 
-                             video_url=video_url, 
-                             file_type=file_type,
-                             render_url=RENDER_URL)
-    except Exception as e:
-        return f"Error: {str(e)}", 400
+        except Exception as e:
+            logger.error(f"Transfer failed: {e}")
+            trace.set(error=str(e))
+            await status_message.edit_text(f"❌ **Transfer failed:** {str(e)}")
+        finally:
+            trace.end()
+            # Cleanup local file and give the reserved space back
+            reservation.release()
 
-@web_app.route('/health')
-def health():
-    return jsonify({"status": "healthy", "service": "wasabi_bot_player"})
+# --- Main Function ---
+async def main():
+    """Start the bot with lazy, concurrently warmed subsystems"""
+    # Users, S3, shortener and local storage come up in the background while we log in
+    registry.warm_up(["users", "storage", "s3", "shortener"])
+    
+    with profile.phase("bot:start"):
+        await app.start()
+    loop_monitor.start(asyncio.get_event_loop())
+    browser_uploads.attach(asyncio.get_event_loop(), admit_browser_upload, announce_browser_upload)
+    asyncio.ensure_future(sweep_browser_uploads())
+    profile.mark_ready()
+    logger.info(profile.summary())
+    
+    await idle()
+    await app.stop()
 
-def run_flask():
-    web_app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
+def run():
+    """Run the bot on Pyrogram's event loop"""
+    app.run(main())
 
-# --- Main Function ---
 if __name__ == "__main__":
-    # Create necessary directories
-    os.makedirs("./downloads", exist_ok=True)
+    from web_server import run_web_server
     
-    # Start Flask server in a separate thread
-    flask_thread = Thread(target=run_flask, daemon=True)
+    # Start web server in a separate thread
+    flask_thread = Thread(target=run_web_server, daemon=True)
     flask_thread.start()
-    logger.info("🚀 Flask server started on port 8000")
+    logger.info(f"🚀 Web server starting on port {config.WEB_PORT}")
     
     # Start the bot
     logger.info("🤖 Starting Ultra-Fast Wasabi Bot...")
-    app.run()
+    run()
@@ -0,0 +1,271 @@
+import time
+import asyncio
+import logging
+import secrets
+import threading
+
+from config import config
+from json_store import JsonStore
+from key_layout import layout
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TOKEN_TTL = 24 * 3600  # An upload page link works for a day, for any number of files
+PART_URL_EXPIRY = 3600  # Part URLs are signed in small batches as the browser needs them
+SESSION_TTL = 24 * 3600  # Unfinished uploads older than this are aborted
+MIN_PART_SIZE = 16 * 1024 * 1024
+MAX_PARTS = 10000  # S3 multipart limit
+MAX_OBJECT_SIZE = 5 * 1024 ** 4  # S3 single-object limit (5 TiB)
+SIGN_BATCH = 64
+SWEEP_INTERVAL = 3600  # How often the bucket itself is checked for abandoned multipart uploads
+ANNOUNCE_TIMEOUT = 30
+
+
+def part_size_for(size):
+    """Smallest whole-MiB part size (>= 16 MiB) that keeps the upload within 10,000 parts"""
+    mib = 1024 * 1024
+    needed = -(-size // MAX_PARTS)
+    return max(MIN_PART_SIZE, -(-needed // mib) * mib)
+
+
+def safe_file_name(name):
+    """Last path segment of a browser-supplied name, without control characters"""
+    name = name.replace("\\", "/").rsplit("/", 1)[-1]
+    return "".join(ch for ch in name if ch.isprintable()).strip()
+
+
+class UploadError(Exception):
+    """Rejected browser upload request (the message is shown to the user)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class BrowserUploads:
+    """Upload links issued by the bot, and the multipart uploads browsers run with them straight to storage.
+
+    The web tier only creates/completes uploads and signs part URLs; the bytes
+    never pass through this host. The bot attaches its event loop plus two
+    hooks: admit (quota check, called in the web thread) and announce (a
+    coroutine run on the bot loop that posts the links into the user's chat).
+
+    Each bucket needs a CORS rule allowing PUT from RENDER_URL's origin and
+    exposing the ETag header, or browsers can't upload parts or report them.
+
+    Tokens and in-flight sessions are persisted together, so uploads survive a
+    restart; anything left unfinished (even unknown to us) is aborted after
+    SESSION_TTL so its parts stop being billed.
+    """
+
+    def __init__(self, path, token_ttl=UPLOAD_TOKEN_TTL):
+        self.store = JsonStore(path)
+        self.token_ttl = token_ttl
+        self.tokens = None  # Loaded on first use
+        self.sessions = None  # upload_id -> in-flight upload
+        self.swept_at = 0
+        self.loop = None
+        self.admit = None
+        self.announce = None
+        self._lock = threading.Lock()
+
+    def attach(self, loop, admit, announce):
+        self.loop = loop
+        self.admit = admit
+        self.announce = announce
+
+    # --- Tokens ---
+    def _load(self):
+        if self.tokens is None:
+            document = self.store.load()
+            if "tokens" in document and "sessions" in document:
+                self.tokens, self.sessions = document["tokens"], document["sessions"]
+            else:  # Files written before sessions were persisted only held tokens
+                self.tokens, self.sessions = document, {}
+
+    def _save(self):
+        self.store.save({"tokens": self.tokens, "sessions": self.sessions})
+
+    def issue(self, user_id, chat_id):
+        """New upload page token for a user (posting results to chat_id)"""
+        token = secrets.token_urlsafe(18)
+        now = time.time()
+        with self._lock:
+            self._load()
+            self.tokens = {t: e for t, e in self.tokens.items() if e["expires"] > now}
+            self.tokens[token] = {"user_id": user_id, "chat_id": chat_id, "expires": now + self.token_ttl}
+            self._save()
+        return token
+
+    def authorize(self, token):
+        """Token entry, or None if unknown/expired"""
+        with self._lock:
+            self._load()
+            entry = self.tokens.get(token)
+        if not entry or entry["expires"] < time.time():
+            return None
+        return entry
+
+    def _session(self, token, upload_id):
+        with self._lock:
+            self._load()
+            session = self.sessions.get(upload_id)
+        if not session or session["token"] != token:
+            raise UploadError("Unknown upload", 404)
+        return session
+
+    # --- Multipart lifecycle (blocking; called from the web tier's threads) ---
+    def start(self, router, token, file_name, size, content_type=None):
+        """Create the multipart upload on the best target and sign the first batch of part URLs"""
+        entry = self.authorize(token)
+        if not entry:
+            raise UploadError("This upload link has expired. Send /upload to the bot for a new one.", 403)
+        file_name = safe_file_name(file_name or "")
+        if not file_name:
+            raise UploadError("Missing file name")
+        if not isinstance(size, int) or size <= 0 or size > MAX_OBJECT_SIZE:
+            raise UploadError("Invalid file size")
+        if self.admit:
+            refused = self.admit(entry["user_id"], size)
+            if refused:
+                raise UploadError(refused, 429)
+
+        self.abort_stale(router)
+        key = layout.new_key(file_name, entry["user_id"])
+        target = router.choose(size)
+        extra = {"ContentType": content_type} if content_type else {}
+        upload_id = target.client.create_multipart_upload(Bucket=target.bucket, Key=key, **extra)["UploadId"]
+        part_size = part_size_for(size)
+        session = {
+            "token": token, "user_id": entry["user_id"], "chat_id": entry["chat_id"],
+            "key": key, "file_name": file_name, "size": size, "target": target.name,
+            "part_size": part_size, "parts": -(-size // part_size), "started": time.time(),
+        }
+        with self._lock:
+            self._load()
+            self.sessions[upload_id] = session
+            self._save()
+        logger.info(f"🌐 Browser upload started: {key} ({size} bytes, {session['parts']} parts) on {target.name}")
+        return {
+            "upload_id": upload_id,
+            "key": key,
+            "part_size": part_size,
+            "parts": session["parts"],
+            "urls": self.sign(router, token, upload_id, range(1, min(session["parts"], SIGN_BATCH) + 1)),
+        }
+
+    def sign(self, router, token, upload_id, part_numbers):
+        """Presigned PUT URLs for the given part numbers of an in-flight upload"""
+        session = self._session(token, upload_id)
+        target = router.targets[session["target"]]
+        part_numbers = list(part_numbers)
+        if len(part_numbers) > SIGN_BATCH:
+            raise UploadError(f"At most {SIGN_BATCH} part URLs per request")
+        urls = {}
+        for number in part_numbers:
+            number = int(number)
+            if not 1 <= number <= session["parts"]:
+                raise UploadError(f"Invalid part number {number}")
+            urls[number] = target.presigner.presign(
+                session["key"], PART_URL_EXPIRY, method="PUT",
+                params={"partNumber": number, "uploadId": upload_id}
+            )
+        return urls
+
+    def complete(self, router, token, upload_id, parts):
+        """Finish the upload from the browser's (part number, ETag) list, index it and announce it"""
+        session = self._session(token, upload_id)
+        target = router.targets[session["target"]]
+        try:
+            parts = sorted(({"PartNumber": int(p["part"]), "ETag": p["etag"]} for p in parts),
+                           key=lambda p: p["PartNumber"])
+        except (KeyError, TypeError, ValueError):
+            raise UploadError("Malformed part list")
+        if [p["PartNumber"] for p in parts] != list(range(1, session["parts"] + 1)):
+            raise UploadError("Some parts are missing")
+
+        target.client.complete_multipart_upload(
+            Bucket=target.bucket, Key=session["key"], UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+        self._drop(upload_id)
+        stored = target.client.head_object(Bucket=target.bucket, Key=session["key"])["ContentLength"]
+        if stored != session["size"]:
+            target.client.delete_object(Bucket=target.bucket, Key=session["key"])
+            raise UploadError(f"Upload incomplete ({stored} of {session['size']} bytes)")
+
+        # Browser throughput is the user's link, not the target's: only record placement.
+        # Parts go straight to storage as plaintext (admit refuses users who have /encrypt on)
+        router.place(session["key"], target, encrypted=False, owner=session["user_id"])
+        router.save()
+        logger.info(f"✅ Browser upload complete: {session['key']} in {time.time() - session['started']:.1f}s")
+        return self._announce(session)
+
+    def abort(self, router, token, upload_id):
+        session = self._session(token, upload_id)
+        self._drop(upload_id)
+        target = router.targets[session["target"]]
+        target.client.abort_multipart_upload(Bucket=target.bucket, Key=session["key"], UploadId=upload_id)
+        logger.info(f"🛑 Browser upload aborted: {session['key']}")
+
+    def _drop(self, upload_id):
+        with self._lock:
+            self._load()
+            if self.sessions.pop(upload_id, None) is not None:
+                self._save()
+
+    def abort_stale(self, router):
+        """Abort uploads the browser walked away from so their parts stop costing storage"""
+        now = time.time()
+        cutoff = now - SESSION_TTL
+        with self._lock:
+            self._load()
+            stale = [(u, s) for u, s in self.sessions.items() if s["started"] < cutoff]
+            for upload_id, _ in stale:
+                del self.sessions[upload_id]
+            if stale:
+                self._save()
+            sweep = now - self.swept_at > SWEEP_INTERVAL
+            if sweep:
+                self.swept_at = now
+        for upload_id, session in stale:
+            target = router.targets.get(session["target"])
+            if not target:
+                continue
+            try:
+                target.client.abort_multipart_upload(Bucket=target.bucket, Key=session["key"], UploadId=upload_id)
+            except Exception as e:
+                logger.warning(f"Could not abort stale upload {session['key']}: {e}")
+        if sweep:
+            self.sweep_bucket(router, cutoff)
+
+    def sweep_bucket(self, router, cutoff):
+        """Abort multipart uploads older than ``cutoff`` that storage still holds (e.g. lost in a crash)"""
+        for target in router.healthy_targets():
+            try:
+                paginator = target.client.get_paginator('list_multipart_uploads')
+                for page in paginator.paginate(Bucket=target.bucket):
+                    for upload in page.get('Uploads', []):
+                        if upload['Initiated'].timestamp() >= cutoff:
+                            continue
+                        target.client.abort_multipart_upload(
+                            Bucket=target.bucket, Key=upload['Key'], UploadId=upload['UploadId']
+                        )
+                        logger.info(f"🧹 Aborted abandoned multipart upload {upload['Key']} on {target.name}")
+            except Exception as e:
+                logger.warning(f"Multipart sweep on {target.name} failed: {e}")
+
+    def _announce(self, session):
+        """Run the bot's announce hook on its loop; returns the download URL (or None)"""
+        result = {"key": session["key"], "url": None}
+        if not (self.loop and self.announce):
+            return result
+        future = asyncio.run_coroutine_threadsafe(self.announce(session), self.loop)
+        try:
+            result["url"] = future.result(ANNOUNCE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Announcing browser upload {session['key']} failed: {e}")
+        return result
+
+
+# Global instance: tokens issued by the bot's /upload, uploads driven through the web tier
+uploads = BrowserUploads(config.UPLOAD_TOKENS_FILE)
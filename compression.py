@@ -0,0 +1,154 @@
+import os
+import time
+import zlib
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Formats that are already compressed; never worth sampling
+COMPRESSED_FORMATS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar', '.lz4', '.br',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp3', '.aac', '.ogg', '.opus', '.flac', '.m4a',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.apk', '.jar', '.epub',
+}
+
+SAMPLE_BLOCK = 64 * 1024
+SAMPLE_BLOCKS = 4
+MIN_SIZE = 4 * 1024  # Below this the gzip framing isn't worth it
+MAX_RATIO = 0.85  # Compress only if the sample shrinks by at least 15%
+
+
+def choose_codec(file_path, file_name, skip_extensions=(), preferred="gzip"):
+    """Pick 'gzip'/'zstd' if the file looks compressible, else None"""
+    if not preferred or preferred == "off":
+        return None
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in skip_extensions or ext in COMPRESSED_FORMATS:
+        return None
+
+    try:
+        with open(file_path, 'rb') as f:
+            sample = f.read(SAMPLE_BLOCK * SAMPLE_BLOCKS)
+    except OSError:
+        return None
+    if len(sample) < MIN_SIZE:
+        return None
+
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if ratio > MAX_RATIO:
+        return None
+    if preferred == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, falling back to gzip")
+        return "gzip"
+    return preferred
+
+
+# --- CRC32 combination (zlib's crc32_combine, which Python doesn't expose) ---
+def _gf2_times(matrix, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= matrix[i]
+        vec >>= 1
+        i += 1
+    return total
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, matrix[n]) for n in range(32)]
+
+
+def crc32_combine(crc1, crc2, len2):
+    """CRC32 of A+B given crc(A), crc(B) and len(B)"""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]  # Operator for one zero bit
+    even = _gf2_square(odd)  # Two zero bits
+    odd = _gf2_square(even)  # Four zero bits
+
+    while True:
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+
+class ChunkCompressor:
+    """Compresses independent chunks that concatenate into one valid gzip/zstd stream.
+
+    gzip: each chunk is a raw deflate segment ended with a sync flush (the last one
+    with a final block), like pigz, so chunks can be compressed in parallel threads.
+    zstd: each chunk is its own frame; concatenated frames are a valid zstd stream.
+    """
+
+    def __init__(self, codec, level=None):
+        self.codec = codec
+        self.level = level if level is not None else (6 if codec == "gzip" else 3)
+
+    @property
+    def content_encoding(self):
+        return self.codec
+
+    def header(self):
+        if self.codec == "gzip":
+            # Magic, deflate, no flags, mtime, max compression, unknown OS
+            return b'\x1f\x8b\x08\x00' + struct.pack('<I', int(time.time())) + b'\x00\xff'
+        return b''
+
+    def compress(self, data, last):
+        """Compress one chunk; returns (compressed, crc32 of raw data)"""
+        if self.codec == "gzip":
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            out = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+            return out, zlib.crc32(data)
+        return zstandard.ZstdCompressor(level=self.level).compress(data), 0
+
+    def trailer(self, crc, size):
+        if self.codec == "gzip":
+            return struct.pack('<II', crc & 0xFFFFFFFF, size & 0xFFFFFFFF)
+        return b''
+
+
+def decompressor(encoding):
+    """Streaming decoder for a stored Content-Encoding (object with .decompress/.flush)"""
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "zstd" and zstandard is not None:
+        return _ZstdStream()
+    return None
+
+
+class _ZstdStream:
+    """zstd decoder that keeps going across concatenated frames"""
+
+    def __init__(self):
+        self._decoder = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        out = []
+        while data:
+            out.append(self._decoder.decompress(data))
+            data = self._decoder.unused_data
+            if data:
+                self._decoder = zstandard.ZstdDecompressor().decompressobj()
+        return b''.join(out)
+
+    def flush(self):
+        return b''
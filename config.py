@@ -1,4 +1,5 @@
 import os
+import hashlib
 from typing import Optional
 
 class Config:
@@ -15,12 +16,72 @@ class Config:
         self.WASABI_SECRET_KEY = self._get_required("WASABI_SECRET_KEY")
         self.WASABI_BUCKET = self._get_required("WASABI_BUCKET")
         self.WASABI_REGION = os.environ.get("WASABI_REGION", "us-east-1")
-        
+
+        # Extra storage targets as a JSON list of {"name", "region", "bucket", "endpoint",
+        # "access_key", "secret_key", "addressing_style", "latency_ms"}; empty = the WASABI_* bucket only
+        self.STORAGE_TARGETS = os.environ.get("STORAGE_TARGETS", "")
+        self.OBJECT_INDEX_FILE = os.environ.get("OBJECT_INDEX_FILE", "object_index.json")
+        self.REPLICATE_AFTER_DOWNLOADS = int(os.environ.get("REPLICATE_AFTER_DOWNLOADS", "0"))  # 0 = never
+
+        # Browser-direct uploads: tokens handed out by /upload for the web upload page
+        self.UPLOAD_TOKENS_FILE = os.environ.get("UPLOAD_TOKENS_FILE", "upload_tokens.json")
+        self.BROWSER_UPLOAD_PARALLEL = int(os.environ.get("BROWSER_UPLOAD_PARALLEL", "4"))  # parts in flight per file
+
+        # Multi-file ZIP links: saved selections and the key for signed key lists
+        self.SELECTIONS_FILE = os.environ.get("SELECTIONS_FILE", "selections.json")
+        self.LINK_SIGNING_KEY = os.environ.get("LINK_SIGNING_KEY") or \
+            hashlib.sha256(f"links:{self.WASABI_SECRET_KEY}".encode()).hexdigest()
+
+        # Optional client-side encryption (per user, see /encrypt): a 32-byte base64/hex key that
+        # wraps each object's random data key; "aes-256-gcm" or "chacha20-poly1305"
+        self.ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY", "")
+        self.ENCRYPTION_CIPHER = os.environ.get("ENCRYPTION_CIPHER", "aes-256-gcm").lower()
+
+        # Object key layout (see key_layout.py). Sharding is opt-in: set e.g. "{h1}/{h2}/{uuid}/{name}"
+        # to spread writes over many prefixes, then /migratekeys moves objects stored under the
+        # comma-separated previous layouts (the default "{ts}_{name}" keys) to it
+        self.KEY_LAYOUT = os.environ.get("KEY_LAYOUT", "{ts}_{name}")
+        self.KEY_LAYOUT_PREVIOUS = os.environ.get("KEY_LAYOUT_PREVIOUS", "{ts}_{name}")
+        self.KEY_MIGRATION_FILE = os.environ.get("KEY_MIGRATION_FILE", "key_migration.json")
+        self.KEY_MIGRATION_PARALLEL = int(os.environ.get("KEY_MIGRATION_PARALLEL", "8"))  # copies in flight
+
         # Admin Configuration
         self.ADMIN_ID = self._get_required_int("ADMIN_ID")
         
+        # Authorized users and per-user quotas (0 = unlimited)
+        self.USERS_FILE = os.environ.get("USERS_FILE", "authorized_users.json")
+        self.USER_UPLOAD_RATE = int(os.environ.get("USER_UPLOAD_RATE", "0"))  # bytes/s
+        self.USER_OPS_PER_MINUTE = int(os.environ.get("USER_OPS_PER_MINUTE", "0"))
+        self.USER_DAILY_QUOTA = int(os.environ.get("USER_DAILY_QUOTA", "0"))  # bytes per rolling 24h
+        self.USER_MONTHLY_QUOTA = int(os.environ.get("USER_MONTHLY_QUOTA", "0"))  # bytes per rolling 30 days
+        
         # Web Server Configuration
         self.WEB_SERVER_URL = os.environ.get("WEB_SERVER_URL", "http://localhost:8000")
+        self.RENDER_URL = os.environ.get("RENDER_URL", "http://localhost:8000")
+        self.WEB_PORT = int(os.environ.get("WEB_PORT", "8000"))
+        
+        # Logging
+        self.LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+        
+        # Temp storage for transfers (optional tmpfs tier for small files)
+        self.DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "./downloads")
+        self.TMPFS_DIR = os.environ.get("TMPFS_DIR", "")
+        self.TMPFS_MAX_FILE = int(os.environ.get("TMPFS_MAX_FILE", str(64 * 1024 * 1024)))
+        self.TMPFS_MAX_TOTAL = int(os.environ.get("TMPFS_MAX_TOTAL", str(512 * 1024 * 1024)))
+        self.TEMP_MIN_FREE = int(os.environ.get("TEMP_MIN_FREE", str(512 * 1024 * 1024)))
+        
+        # Opt-in compression of compressible uploads ("gzip", "zstd" or "off"). Compressed objects are
+        # stored with Content-Encoding, so direct/presigned links lose byte ranges (resume) for them
+        self.COMPRESSION = os.environ.get("COMPRESSION", "off").lower()
+        self.COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", "0"))  # 0 = codec default
+        
+        # Transfer tracing (rotating JSONL file)
+        self.TRACE_FILE = os.environ.get("TRACE_FILE", "./traces/transfers.jsonl")
+
+        # Event-loop watchdog: log and sample stacks above the threshold; debug mode
+        # records every block longer than LOOP_BLOCK_FAIL_MS as a failure (0 = off)
+        self.LOOP_LAG_THRESHOLD_MS = int(os.environ.get("LOOP_LAG_THRESHOLD_MS", "100"))
+        self.LOOP_BLOCK_FAIL_MS = int(os.environ.get("LOOP_BLOCK_FAIL_MS", "0"))
         
         # GPLinks Configuration
         self.GPLINKS_API_KEY = os.environ.get("GPLINKS_API_KEY", "c1332c0b286628ba047359efde6a5bdac1509655")
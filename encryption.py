@@ -0,0 +1,167 @@
+import base64
+import hashlib
+import logging
+import os
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap
+except ImportError:  # Only needed when ENCRYPTION_KEY is set (load_master_key refuses to start without it)
+    AESGCM = ChaCha20Poly1305 = None
+
+logger = logging.getLogger(__name__)
+
+ENCRYPTION_CHUNK = 64 * 1024  # Plaintext bytes per AEAD chunk: the seek granularity
+TAG_SIZE = 16
+CIPHERS = {"aes-256-gcm": AESGCM, "chacha20-poly1305": ChaCha20Poly1305}
+
+
+def available():
+    return AESGCM is not None
+
+
+def load_master_key(value):
+    """32-byte key-encryption key from base64 or hex config (None if unset)"""
+    if not value:
+        return None
+    try:
+        key = bytes.fromhex(value) if len(value) == 64 else base64.b64decode(value, validate=True)
+    except ValueError:
+        raise ValueError("ENCRYPTION_KEY must be 32 bytes, base64 or hex encoded")
+    if len(key) != 32:
+        raise ValueError("ENCRYPTION_KEY must be 32 bytes, base64 or hex encoded")
+    if not available():
+        # Never fall back to storing plaintext for users who asked for encryption
+        raise RuntimeError("ENCRYPTION_KEY is set but the cryptography package is not installed")
+    return key
+
+
+def key_id(master_key):
+    """Short fingerprint stored with each object, so a rotated key fails loudly"""
+    return hashlib.sha256(master_key).hexdigest()[:16]
+
+
+def encrypted_size(size, chunk_size=ENCRYPTION_CHUNK):
+    """Stored length of a ``size``-byte plaintext (an empty object is one empty chunk)"""
+    return size + max(1, -(-size // chunk_size)) * TAG_SIZE
+
+
+def metadata_from_headers(headers):
+    """x-amz-meta-* response headers as a boto3-style Metadata dict"""
+    prefix = "x-amz-meta-"
+    return {name[len(prefix):].lower(): value for name, value in headers.items() if name.lower().startswith(prefix)}
+
+
+class ObjectCipher:
+    """Per-object data key with chunked AEAD: every chunk has its own nonce, so any range decrypts alone.
+
+    Chunk i is sealed with nonce = i (96-bit big endian) and associated data
+    (i, is-last), which stops chunks being reordered or the object truncated.
+    Counter nonces are safe because every object gets a fresh random key.
+    """
+
+    def __init__(self, algorithm, data_key, size, chunk_size=ENCRYPTION_CHUNK):
+        if algorithm not in CIPHERS:
+            raise ValueError(f"Unknown encryption algorithm {algorithm!r}")
+        if CIPHERS[algorithm] is None:
+            raise RuntimeError("cryptography is not installed")
+        self.algorithm = algorithm
+        self.aead = CIPHERS[algorithm](data_key)
+        self.data_key = data_key
+        self.size = size
+        self.chunk_size = chunk_size
+        self.last_index = max(0, -(-size // chunk_size) - 1)
+
+    @classmethod
+    def new(cls, algorithm, size):
+        return cls(algorithm, os.urandom(32), size)
+
+    @classmethod
+    def from_metadata(cls, master_key, metadata):
+        """Unwrap the data key stored in an object's metadata"""
+        if master_key is None:
+            raise RuntimeError("Object is encrypted but ENCRYPTION_KEY is not configured")
+        if metadata.get("key-id") != key_id(master_key):
+            raise RuntimeError("Object was encrypted with a different ENCRYPTION_KEY")
+        data_key = aes_key_unwrap(master_key, base64.b64decode(metadata["wrapped-key"]))
+        return cls(metadata["encryption"], data_key, int(metadata["original-size"]), int(metadata["enc-chunk"]))
+
+    def metadata(self, master_key):
+        """S3 user metadata for the object: algorithm, wrapped data key and layout"""
+        return {
+            "encryption": self.algorithm,
+            "wrapped-key": base64.b64encode(aes_key_wrap(master_key, self.data_key)).decode(),
+            "key-id": key_id(master_key),
+            "enc-chunk": str(self.chunk_size),
+            "original-size": str(self.size),
+        }
+
+    @property
+    def stored_size(self):
+        return encrypted_size(self.size, self.chunk_size)
+
+    def _nonce_aad(self, index):
+        return index.to_bytes(12, "big"), index.to_bytes(8, "big") + (b"\x01" if index == self.last_index else b"\x00")
+
+    # --- Encryption (thread-safe; parts are sealed independently in worker threads) ---
+    def encrypt_range(self, data, start):
+        """Seal plaintext that begins at ``start`` (a chunk boundary) as consecutive chunks"""
+        if start % self.chunk_size:
+            raise ValueError("Encrypted ranges must start on a chunk boundary")
+        index = start // self.chunk_size
+        view = memoryview(data)
+        sealed = []
+        for offset in range(0, max(len(data), 1), self.chunk_size):
+            nonce, aad = self._nonce_aad(index)
+            sealed.append(self.aead.encrypt(nonce, bytes(view[offset:offset + self.chunk_size]), aad))
+            index += 1
+        return b"".join(sealed)
+
+    # --- Decryption ---
+    def ciphertext_range(self, start, end):
+        """Stored byte range (inclusive) covering plaintext bytes start..end, plus its first chunk index"""
+        first = start // self.chunk_size
+        last = end // self.chunk_size
+        sealed = self.chunk_size + TAG_SIZE
+        return first * sealed, min((last + 1) * sealed, self.stored_size) - 1, first
+
+    def decrypt_chunk(self, index, sealed):
+        nonce, aad = self._nonce_aad(index)
+        return self.aead.decrypt(nonce, sealed, aad)
+
+    def decrypt_stream(self, chunks, first_index=0, skip=0, length=None):
+        """Decrypt a stream of stored bytes starting at chunk ``first_index``.
+
+        ``skip`` drops plaintext bytes from the front (a range that starts mid-chunk)
+        and ``length`` stops after that many plaintext bytes.
+        """
+        sealed_size = self.chunk_size + TAG_SIZE
+        index = first_index
+        remaining = self.size - first_index * self.chunk_size if length is None else length
+        buffer = bytearray()
+
+        def emit(plaintext):
+            nonlocal skip, remaining
+            if skip:
+                plaintext, skip = plaintext[skip:], max(0, skip - len(plaintext))
+            plaintext = plaintext[:remaining]
+            remaining -= len(plaintext)
+            return plaintext
+
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= sealed_size and remaining > 0:
+                plaintext = emit(self.decrypt_chunk(index, bytes(buffer[:sealed_size])))
+                del buffer[:sealed_size]
+                index += 1
+                if plaintext:
+                    yield plaintext
+            if remaining <= 0:
+                return
+        if buffer and remaining > 0:
+            # Final (short) chunk
+            plaintext = emit(self.decrypt_chunk(index, bytes(buffer)))
+            if plaintext:
+                yield plaintext
+        if remaining > 0:
+            raise IOError(f"Encrypted object ended early ({remaining} bytes missing)")
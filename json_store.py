@@ -0,0 +1,43 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStore:
+    """Small JSON document on disk with atomic (write + rename) saves"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self, default=None):
+        """Return the stored document, or ``default`` if missing/empty/corrupt"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return default if default is not None else {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable {self.path}: {e}")
+            return default if default is not None else {}
+        return data if data else (default if default is not None else {})
+
+    def save(self, data):
+        """Write the document atomically so a crash never leaves a truncated file"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
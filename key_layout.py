@@ -0,0 +1,115 @@
+import re
+import time
+import uuid
+import string
+import hashlib
+import datetime
+
+from config import config
+
+# Placeholder -> pattern matching what it expands to
+FIELD_PATTERNS = {
+    "name": r"[^/]+",
+    "uuid": r"[0-9a-f]{32}",
+    "ts": r"\d{9,}",
+    "user": r"[^/]+",
+    "yyyy": r"\d{4}",
+    "mm": r"\d{2}",
+    "dd": r"\d{2}",
+    "h1": r"[0-9a-f]{2}",
+    "h2": r"[0-9a-f]{2}",
+    "h3": r"[0-9a-f]{2}",
+}
+
+
+class KeyLayout:
+    """Where objects live: one template expands (and parses back) every object key.
+
+    Placeholders: {name} (required), {uuid}, {ts}, {user}, {yyyy}/{mm}/{dd} and
+    {h1}/{h2}/{h3} (successive hex byte pairs of a hash of the uuid, which spread
+    keys evenly over 256/65536/16M prefixes). Examples:
+    "{h1}/{h2}/{uuid}/{name}", "{user}/{yyyy}/{mm}/{uuid}/{name}", "{ts}_{name}".
+    """
+
+    def __init__(self, template):
+        parsed = list(string.Formatter().parse(template))
+        fields = [field for _, field, _, _ in parsed if field is not None]
+        unknown = [field for field in fields if field not in FIELD_PATTERNS]
+        if unknown:
+            raise ValueError(f"Key layout {template!r} has unknown placeholders: {', '.join(unknown)}")
+        if fields.count("name") != 1 or "{name}" not in template.rsplit("/", 1)[-1]:
+            raise ValueError(f"Key layout {template!r} needs {{name}} exactly once, in its last path segment")
+        self.template = template
+        pattern = ""
+        for literal, field, _, _ in parsed:
+            pattern += re.escape(literal)
+            if field is not None:
+                # Capture the first occurrence of each field; repeats only have to match
+                group = f"(?P<{field}>" if f"(?P<{field}>" not in pattern else "(?:"
+                pattern += f"{group}{FIELD_PATTERNS[field]})"
+        self.pattern = re.compile(f"^{pattern}$")
+
+    def new_key(self, file_name, user_id=None, now=None, object_id=None):
+        """Key for a new object (unique even for same-name uploads in the same second)"""
+        now = time.time() if now is None else now
+        object_id = object_id or uuid.uuid4().hex
+        digest = hashlib.sha1(object_id.encode()).hexdigest()
+        when = datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+        return self.template.format(
+            name=file_name.replace("/", "_").strip() or "file",
+            uuid=object_id,
+            ts=int(now),
+            user=user_id if user_id is not None else "shared",
+            yyyy=f"{when.year:04d}", mm=f"{when.month:02d}", dd=f"{when.day:02d}",
+            h1=digest[0:2], h2=digest[2:4], h3=digest[4:6],
+        )
+
+    def parse(self, key):
+        """Fields of a key in this layout, or None if the key doesn't fit it"""
+        match = self.pattern.match(key)
+        return match.groupdict() if match else None
+
+    def matches(self, key):
+        return self.pattern.match(key) is not None
+
+
+def _created_at(fields, modified=None):
+    """Best creation time for an old key: its timestamp, else its date, else LastModified"""
+    if fields.get("ts"):
+        return int(fields["ts"])
+    if fields.get("yyyy"):
+        when = datetime.datetime(int(fields["yyyy"]), int(fields.get("mm") or 1), int(fields.get("dd") or 1),
+                                 tzinfo=datetime.timezone.utc)
+        return when.timestamp()
+    return modified.timestamp() if modified else None
+
+
+def migrated_key(key, modified=None):
+    """Current-layout key for an object stored under a previous layout (None if it needs no move)
+
+    Keys that fit neither the current nor a previous layout (e.g. files moved into
+    folders by hand) are left where they are.
+    """
+    if layout.matches(key):
+        return None
+    for previous in previous_layouts:
+        fields = previous.parse(key)
+        if fields:
+            # Reuse the object's uuid if it had one, so its hash prefix stays stable
+            return layout.new_key(fields["name"], fields.get("user"), _created_at(fields, modified), fields.get("uuid"))
+    return None
+
+
+def display_name(key):
+    """The file name inside a generated key (for archives and listings); other keys are shown as-is"""
+    for candidate in (layout, *previous_layouts):
+        fields = candidate.parse(key)
+        if fields:
+            return fields["name"]
+    return key
+
+
+# Global layouts: new keys use KEY_LAYOUT, /migratekeys moves keys from KEY_LAYOUT_PREVIOUS
+layout = KeyLayout(config.KEY_LAYOUT)
+previous_layouts = [KeyLayout(t.strip()) for t in config.KEY_LAYOUT_PREVIOUS.split(",")
+                    if t.strip() and t.strip() != config.KEY_LAYOUT]
@@ -0,0 +1,137 @@
+import json
+import time
+import threading
+
+from config import config
+from json_store import JsonStore
+
+RETIRE_AFTER = 7 * 24 * 3600  # Originals outlive every presigned link (7 days) issued before the move
+
+
+class KeyMigration:
+    """Resumable record of objects being moved to the current key layout, shared by the bot and the web tier.
+
+    pending: old key -> new key still to copy (the new key is fixed when planned, so a
+    restart resumes the same moves). moved: old key -> {"key", "retire_at", "retired"};
+    the original stays in the bucket until retire_at so links already handed out keep
+    working, and the alias keeps resolving afterwards. failed: old key -> last error.
+    """
+
+    def __init__(self, path, retire_after=RETIRE_AFTER):
+        self.store = JsonStore(path)
+        self.retire_after = retire_after
+        self.state = None  # Loaded on first use
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.state is None:
+            self.state = self.store.load()
+            for section in ("pending", "moved", "failed"):
+                self.state.setdefault(section, {})
+
+    def save(self):
+        with self._lock:
+            self._load()
+            snapshot = json.loads(json.dumps(self.state))
+        self.store.save(snapshot)
+
+    # --- Planning and progress ---
+    def plan(self, moves):
+        """Queue old -> new moves (keys already queued or moved keep their planned destination)"""
+        added = 0
+        with self._lock:
+            self._load()
+            for old_key, new_key in moves.items():
+                moved = self.state["moved"].get(old_key)
+                if old_key in self.state["pending"] or (moved and not moved["retired"]):
+                    continue
+                self.state["pending"][old_key] = new_key
+                self.state["failed"].pop(old_key, None)
+                added += 1
+        return added
+
+    def next_batch(self, size):
+        with self._lock:
+            self._load()
+            return list(self.state["pending"].items())[:size]
+
+    def mark_moved(self, old_key, new_key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._load()
+            self.state["pending"].pop(old_key, None)
+            self.state["moved"][old_key] = {"key": new_key, "retire_at": now + self.retire_after, "retired": False}
+
+    def mark_failed(self, old_key, error):
+        with self._lock:
+            self._load()
+            self.state["pending"].pop(old_key, None)
+            self.state["failed"][old_key] = str(error)
+
+    def forget(self, key):
+        """Drop a queued move whose source was deleted before we got to it"""
+        with self._lock:
+            self._load()
+            self.state["pending"].pop(key, None)
+
+    def renamed(self, key, new_key):
+        """Keep aliases pointing at an object that was renamed/moved by hand after its migration"""
+        with self._lock:
+            self._load()
+            self.state["pending"].pop(key, None)
+            for entry in self.state["moved"].values():
+                if entry["key"] == key:
+                    entry["key"] = new_key
+
+    # --- Lookups (any thread) ---
+    def resolve(self, key):
+        """Current key for a possibly moved object"""
+        with self._lock:
+            self._load()
+            entry = self.state["moved"].get(key)
+        return entry["key"] if entry else key
+
+    def aliased(self, key):
+        """True if ``key`` is an original left behind by a move (hidden from listings)"""
+        with self._lock:
+            self._load()
+            entry = self.state["moved"].get(key)
+        return bool(entry) and not entry["retired"]
+
+    def aliases_of(self, key):
+        """Originals still in the bucket whose moved copy is ``key``"""
+        with self._lock:
+            self._load()
+            return [old for old, entry in self.state["moved"].items() if entry["key"] == key and not entry["retired"]]
+
+    # --- Retiring originals ---
+    def due_retirements(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._load()
+            return [old for old, entry in self.state["moved"].items()
+                    if not entry["retired"] and entry["retire_at"] <= now]
+
+    def retired(self, old_key):
+        with self._lock:
+            self._load()
+            entry = self.state["moved"].get(old_key)
+            if entry:
+                entry["retired"] = True
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            self._load()
+            moved = self.state["moved"].values()
+            return {
+                "pending": len(self.state["pending"]),
+                "moved": len(self.state["moved"]),
+                "retired": sum(1 for e in moved if e["retired"]),
+                "due": sum(1 for e in moved if not e["retired"] and e["retire_at"] <= now),
+                "failed": len(self.state["failed"]),
+            }
+
+
+# Global instance: written by the bot's /migratekeys, read by every link and archive lookup
+migration = KeyMigration(config.KEY_MIGRATION_FILE)
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopBlockedError(AssertionError):
+    """The event loop was blocked longer than the configured limit"""
+
+
+class LagHistogram:
+    """Cumulative histogram of loop lag samples (Prometheus-style buckets)"""
+
+    def __init__(self, buckets=LAG_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, ms)] += 1
+            self.count += 1
+            self.total += ms
+            self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (max for the +Inf bucket)"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    return float(self.buckets[index]) if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum_ms": round(self.total, 3),
+                "max_ms": round(self.max, 3),
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+            }
+
+    def prometheus(self, name):
+        """Render as Prometheus text exposition (seconds, cumulative buckets)"""
+        with self._lock:
+            lines = [f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound / 1000}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{name}_sum {self.total / 1000}")
+            lines.append(f"{name}_count {self.count}")
+        return "\n".join(lines)
+
+
+class LoopMonitor:
+    """Measures event-loop scheduling lag and names the call site when the loop is blocked.
+
+    A task on the loop sleeps ``interval`` seconds and records how late it wakes up.
+    A helper thread watches the task's heartbeat; once it is more than
+    ``threshold_ms`` overdue the loop thread's stack is sampled, so the blocking
+    frame is captured while it is still running.
+    """
+
+    def __init__(self, interval=0.05, threshold_ms=100, fail_ms=0, keep_events=50):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.fail_ms = fail_ms  # Debug mode: lag above this is a violation (0 = off)
+        self.histogram = LagHistogram()
+        self.events = deque(maxlen=keep_events)  # Recent blocks with their call sites
+        self.sites = Counter()  # call site -> number of blocks
+        self.violations = []
+        self.loop = None
+        self._loop_thread_id = None
+        self._last_tick = None
+        self._pending = None  # Block being sampled by the watchdog, completed by the ticker
+        self._task = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Lifecycle ---
+    def start(self, loop=None):
+        """Start measuring on ``loop`` (call from the loop thread)"""
+        if self._task is not None:
+            return self
+        self.loop = loop or asyncio.get_event_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stop.clear()
+        self._task = self.loop.create_task(self._ticker())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        logger.info(f"🩺 Loop monitor started (threshold {self.threshold_ms}ms)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _ticker(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._last_tick = now
+            self._record((now - expected) * 1000)
+
+    def _record(self, lag_ms):
+        lag_ms = max(lag_ms, 0.0)
+        self.histogram.add(lag_ms)
+        blocked = lag_ms >= self.threshold_ms or (self.fail_ms and lag_ms >= self.fail_ms)
+        with self._lock:
+            event, self._pending = self._pending, None
+        if event is None and not blocked:
+            return
+        if event is None:
+            # Shorter than the watchdog's resolution, no stack was taken
+            event = {"site": "unknown", "stack": [], "at": time.time()}
+            self.sites["unknown"] += 1
+            self.events.append(event)
+        event["lag_ms"] = round(lag_ms, 2)
+        if lag_ms >= self.threshold_ms:
+            logger.warning(f"🐢 Event loop blocked for {lag_ms:.0f}ms at {event['site']}")
+        if self.fail_ms and lag_ms >= self.fail_ms:
+            self.violations.append(event)
+
+    def _watchdog(self):
+        poll = min(self.threshold_ms, self.fail_ms or self.threshold_ms) / 4000
+        while not self._stop.wait(poll):
+            overdue_ms = (time.perf_counter() - self._last_tick - self.interval) * 1000
+            limit = min(self.threshold_ms, self.fail_ms or self.threshold_ms)
+            if overdue_ms < limit or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            event = {"site": _call_site(stack), "stack": [_format_frame(f) for f in stack[-8:]], "at": time.time()}
+            with self._lock:
+                self._pending = event
+            self.sites[event["site"]] += 1
+            self.events.append(event)
+
+    # --- Reporting ---
+    def snapshot(self):
+        return {
+            "lag": self.histogram.snapshot(),
+            "p50_ms": self.histogram.percentile(50),
+            "p99_ms": self.histogram.percentile(99),
+            "threshold_ms": self.threshold_ms,
+            "blocks": sum(self.sites.values()),
+            "top_sites": self.sites.most_common(5),
+            "recent": list(self.events)[-5:],
+        }
+
+    def prometheus(self):
+        lines = [self.histogram.prometheus("event_loop_lag_seconds"), "# TYPE event_loop_blocks_total counter"]
+        for site, count in self.sites.items():
+            lines.append(f'event_loop_blocks_total{{site="{_escape_label(site)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    # --- Debug mode ---
+    def check(self):
+        """Raise LoopBlockedError if anything blocked the loop longer than ``fail_ms``"""
+        if self.violations:
+            details = "; ".join(f"{v['lag_ms']}ms at {v['site']}" for v in self.violations)
+            self.violations = []
+            raise LoopBlockedError(f"Event loop blocked: {details}")
+
+
+def _call_site(stack):
+    """Innermost project frame of the running callback, else the innermost frame overall"""
+    # Frames above asyncio's Handle._run belong to the loop itself (asyncio.run, run_forever...)
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index].name == "_run" and os.path.basename(stack[index].filename) == "events.py":
+            stack = stack[index + 1:]
+            break
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(PROJECT_ROOT) and "site-packages" not in path and path != os.path.abspath(__file__):
+            return _format_frame(frame)
+    return _format_frame(stack[-1]) if stack else "unknown"
+
+
+def _format_frame(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+# Global monitor: started on the bot's loop, read by /stats and the web tier's /metrics
+monitor = LoopMonitor(threshold_ms=config.LOOP_LAG_THRESHOLD_MS, fail_ms=config.LOOP_BLOCK_FAIL_MS)
@@ -0,0 +1,99 @@
+import time
+import base64
+import struct
+import threading
+from collections import OrderedDict
+
+SIDECAR_PREFIX = "_meta/"  # Kept out of the way of user prefixes and listings
+MOOV_EXTENSIONS = {".mp4", ".m4v", ".mov", ".3gp"}
+MAX_POSTER_BYTES = 64 * 1024  # Telegram thumbs are ~5-30KB; anything bigger isn't worth inlining
+CACHE_ENTRIES = 512
+CACHE_MISS_TTL = 60  # Re-check missing sidecars after a minute (upload may still be in flight)
+
+
+def sidecar_key(key):
+    return f"{SIDECAR_PREFIX}{key}.json"
+
+
+def is_sidecar(key):
+    return key.startswith(SIDECAR_PREFIX)
+
+
+def find_moov(path, max_boxes=64):
+    """Byte range (inclusive) of an MP4's top-level moov box, or None"""
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        offset = 0
+        for _ in range(max_boxes):
+            if offset + 8 > file_size:
+                return None
+            f.seek(offset)
+            size, box_type = struct.unpack(">I4s", f.read(8))
+            if size == 1:  # 64-bit "largesize" follows the type
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:  # Box runs to the end of the file
+                size = file_size - offset
+            if size < 8:
+                return None
+            if box_type == b"moov":
+                return [offset, min(offset + size, file_size) - 1]
+            offset += size
+    return None
+
+
+def build_sidecar(media, mime_type, size, moov=None, poster=None):
+    """Player metadata for an upload: Telegram's media fields plus the MP4 moov range and an inline poster"""
+    sidecar = {"mime": mime_type, "size": size}
+    for field in ("duration", "width", "height"):
+        value = getattr(media, field, None)
+        if value:
+            sidecar[field] = value
+    if moov:
+        sidecar["moov"] = moov
+    if poster and len(poster) <= MAX_POSTER_BYTES:
+        sidecar["poster"] = "data:image/jpeg;base64," + base64.b64encode(poster).decode()
+    return sidecar
+
+
+def best_thumb(media):
+    """Largest thumbnail Telegram generated for the media (None if it has none)"""
+    thumbs = getattr(media, "thumbs", None) or []
+    thumbs = [t for t in thumbs if getattr(t, "file_size", 0) and t.file_size <= MAX_POSTER_BYTES]
+    return max(thumbs, key=lambda t: (t.width or 0) * (t.height or 0), default=None)
+
+
+class SidecarCache:
+    """Small LRU of sidecars shared by the bot (writes on upload) and the player route (reads)"""
+
+    def __init__(self, max_entries=CACHE_ENTRIES, miss_ttl=CACHE_MISS_TTL):
+        self.max_entries = max_entries
+        self.miss_ttl = miss_ttl
+        self.entries = OrderedDict()  # key -> (sidecar or None, cached_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Cached sidecar for ``key``, calling loader(key) on a miss (loader returns None if absent)"""
+        with self._lock:
+            cached = self.entries.get(key)
+            if cached and (cached[0] is not None or time.monotonic() - cached[1] < self.miss_ttl):
+                self.entries.move_to_end(key)
+                return cached[0]
+        sidecar = loader(key)
+        self.put(key, sidecar)
+        return sidecar
+
+    def put(self, key, sidecar):
+        with self._lock:
+            self.entries[key] = (sidecar, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+# Global cache: filled by the bot as sidecars are written, read by the web tier's player
+sidecars = SidecarCache()
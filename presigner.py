@@ -0,0 +1,93 @@
+import hmac
+import hashlib
+import datetime
+from functools import lru_cache
+from urllib.parse import quote
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+def _percent_encode(value, safe="-_.~"):
+    return quote(str(value), safe=safe)
+
+
+@lru_cache(maxsize=64)
+def derive_signing_key(secret_key, date, region, service):
+    """SigV4 signing key; only changes once per day per region/service"""
+    key = hmac.new(f"AWS4{secret_key}".encode(), date.encode(), hashlib.sha256).digest()
+    for part in (region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+class SigV4Presigner:
+    """Local S3 SigV4 query-string presigner producing the same URLs as boto3's generate_presigned_url.
+
+    The signing key is cached per date/region/service, and everything that doesn't
+    depend on the key (credential scope, auth query parameters, canonical headers,
+    the keyed HMAC state) is computed once per batch.
+    """
+
+    def __init__(self, access_key, secret_key, region, bucket, endpoint_host=None,
+                 addressing_style="virtual", scheme="https", service="s3"):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.bucket = bucket
+        self.service = service
+        self.scheme = scheme
+        endpoint_host = endpoint_host or f"s3.{region}.wasabisys.com"
+        if addressing_style == "virtual":
+            self.host = f"{bucket}.{endpoint_host}"
+            self.path_prefix = "/"
+        else:
+            self.host = endpoint_host
+            self.path_prefix = f"/{_percent_encode(bucket, safe='')}/"
+
+    def _batch_state(self, expires, method, now, params):
+        """Per-batch constants: query prefix/suffix, canonical request pieces and a keyed HMAC"""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        date = timestamp[:8]
+        scope = f"{date}/{self.region}/{self.service}/aws4_request"
+
+        auth_params = (
+            ("X-Amz-Algorithm", ALGORITHM),
+            ("X-Amz-Credential", f"{self.access_key}/{scope}"),
+            ("X-Amz-Date", timestamp),
+            ("X-Amz-Expires", str(expires)),
+            ("X-Amz-SignedHeaders", "host"),
+        )
+        encoded_params = [(_percent_encode(k), _percent_encode(v)) for k, v in (params or {}).items()]
+        encoded_auth = [(_percent_encode(k), _percent_encode(v)) for k, v in auth_params]
+
+        # URL keeps operation params first, then auth params (boto3's order)
+        query = "&".join(f"{k}={v}" for k, v in encoded_params + encoded_auth)
+        canonical_query = "&".join(f"{k}={v}" for k, v in sorted(encoded_params + encoded_auth))
+
+        cr_prefix = f"{method}\n"
+        cr_suffix = f"\n{canonical_query}\nhost:{self.host}\n\nhost\n{UNSIGNED_PAYLOAD}"
+        sts_prefix = f"{ALGORITHM}\n{timestamp}\n{scope}\n"
+        signer = hmac.new(derive_signing_key(self.secret_key, date, self.region, self.service), digestmod=hashlib.sha256)
+        url_prefix = f"{self.scheme}://{self.host}"
+        return cr_prefix, cr_suffix, sts_prefix, signer, url_prefix, query
+
+    def presign_many(self, keys, expires=604800, method="GET", params=None, now=None):
+        """Presign a batch of keys with one shared timestamp"""
+        cr_prefix, cr_suffix, sts_prefix, signer, url_prefix, query = self._batch_state(expires, method, now, params)
+        sha256 = hashlib.sha256
+        path_prefix = self.path_prefix
+        urls = []
+        append = urls.append
+        for key in keys:
+            path = path_prefix + quote(key, safe="/~")
+            canonical_request = cr_prefix + path + cr_suffix
+            mac = signer.copy()
+            mac.update((sts_prefix + sha256(canonical_request.encode()).hexdigest()).encode())
+            append(f"{url_prefix}{path}?{query}&X-Amz-Signature={mac.hexdigest()}")
+        return urls
+
+    def presign(self, key, expires=604800, method="GET", params=None, now=None):
+        """Presign a single key"""
+        return self.presign_many([key], expires, method, params, now)[0]
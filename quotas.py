@@ -0,0 +1,201 @@
+import time
+import asyncio
+import threading
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class TokenBucket:
+    """Token bucket that lets callers go into debt and wait it off (smooth long-run rate)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take ``amount`` tokens now and return how long the caller must wait"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_consume(self, amount=1):
+        """Take tokens only if available; returns (ok, retry_after_seconds)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True, 0.0
+            return False, (amount - self.tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, self.tokens)
+
+    async def consume(self, amount):
+        """Non-blocking consume for the event loop"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class QuotaManager:
+    """Authorized users plus per-user rate shaping and rolling byte quotas, persisted in one JSON store"""
+
+    def __init__(self, store, admin_id, upload_rate=0, ops_per_minute=0, daily_bytes=0, monthly_bytes=0):
+        self.store = store
+        self.admin_id = admin_id
+        self.upload_rate = upload_rate  # bytes/s per user, 0 = unlimited
+        self.ops_per_minute = ops_per_minute
+        self.daily_bytes = daily_bytes  # rolling 24h, 0 = unlimited
+        self.monthly_bytes = monthly_bytes  # rolling 30 days, 0 = unlimited
+        self.users = {admin_id}
+        self.encrypting = set()  # Users whose uploads are encrypted before they leave this host
+        self.usage = {}  # user_id -> {"hours": {hour_start: bytes}, "days": {day_start: bytes}}
+        self.byte_buckets = {}
+        self.op_buckets = {}
+        self._lock = threading.Lock()
+
+    # --- Persistence ---
+    def load(self, allowed_users):
+        """Load users and usage; ``allowed_users`` is updated in place"""
+        data = self.store.load()
+        with self._lock:
+            self.users = {int(u) for u in data.get("users", [])} | {self.admin_id}
+            self.encrypting = {int(u) for u in data.get("encrypt", [])}
+            self.usage = {
+                int(uid): {
+                    "hours": {int(k): v for k, v in entry.get("hours", {}).items()},
+                    "days": {int(k): v for k, v in entry.get("days", {}).items()},
+                }
+                for uid, entry in data.get("usage", {}).items()
+            }
+        allowed_users.clear()
+        allowed_users.update(self.users)
+        return self
+
+    def save(self):
+        with self._lock:
+            data = {
+                "users": sorted(self.users),
+                "encrypt": sorted(self.encrypting),
+                "usage": {
+                    str(uid): {
+                        "hours": {str(k): v for k, v in entry["hours"].items()},
+                        "days": {str(k): v for k, v in entry["days"].items()},
+                    }
+                    for uid, entry in self.usage.items()
+                },
+            }
+        self.store.save(data)
+
+    # --- Users ---
+    def add_user(self, user_id):
+        with self._lock:
+            self.users.add(user_id)
+
+    def remove_user(self, user_id):
+        with self._lock:
+            self.users.discard(user_id)
+            self.encrypting.discard(user_id)
+            self.usage.pop(user_id, None)
+            self.byte_buckets.pop(user_id, None)
+            self.op_buckets.pop(user_id, None)
+
+    def set_encryption(self, user_id, enabled):
+        with self._lock:
+            if enabled:
+                self.encrypting.add(user_id)
+            else:
+                self.encrypting.discard(user_id)
+
+    def encrypts(self, user_id):
+        return user_id in self.encrypting
+
+    def is_exempt(self, user_id):
+        return user_id == self.admin_id
+
+    # --- Shaping ---
+    def byte_bucket(self, user_id):
+        """Upload/download shaper for a user (None when unlimited)"""
+        if not self.upload_rate or self.is_exempt(user_id):
+            return None
+        with self._lock:
+            bucket = self.byte_buckets.get(user_id)
+            if bucket is None:
+                # One second of burst keeps latency low without exceeding the rate
+                bucket = self.byte_buckets[user_id] = TokenBucket(self.upload_rate)
+            return bucket
+
+    def check_operation(self, user_id):
+        """Count one operation (upload, link refresh, speed test); returns (ok, retry_after)"""
+        if not self.ops_per_minute or self.is_exempt(user_id):
+            return True, 0.0
+        with self._lock:
+            bucket = self.op_buckets.get(user_id)
+            if bucket is None:
+                bucket = self.op_buckets[user_id] = TokenBucket(self.ops_per_minute / 60.0, self.ops_per_minute)
+        return bucket.try_consume(1)
+
+    # --- Rolling byte quotas ---
+    def _prune(self, entry, now):
+        entry["hours"] = {h: b for h, b in entry["hours"].items() if h > now - DAY}
+        entry["days"] = {d: b for d, b in entry["days"].items() if d > now - 30 * DAY}
+
+    def used(self, user_id):
+        """Bytes used in the rolling day and month"""
+        now = int(time.time())
+        with self._lock:
+            entry = self.usage.get(user_id)
+            if not entry:
+                return 0, 0
+            self._prune(entry, now)
+            return sum(entry["hours"].values()), sum(entry["days"].values())
+
+    def check_bytes(self, user_id, size):
+        """Returns None if ``size`` more bytes fit the quotas, else a reason"""
+        if self.is_exempt(user_id):
+            return None
+        day, month = self.used(user_id)
+        if self.daily_bytes and day + size > self.daily_bytes:
+            return "daily"
+        if self.monthly_bytes and month + size > self.monthly_bytes:
+            return "monthly"
+        return None
+
+    def record_bytes(self, user_id, size):
+        now = int(time.time())
+        with self._lock:
+            entry = self.usage.setdefault(user_id, {"hours": {}, "days": {}})
+            hour = now - now % HOUR
+            day = now - now % DAY
+            entry["hours"][hour] = entry["hours"].get(hour, 0) + size
+            entry["days"][day] = entry["days"].get(day, 0) + size
+            self._prune(entry, now)
+
+    def remaining(self, user_id):
+        """Quota summary for /quota"""
+        day, month = self.used(user_id)
+        exempt = self.is_exempt(user_id)
+        ops_left = None
+        if self.ops_per_minute and not exempt:
+            bucket = self.op_buckets.get(user_id)
+            ops_left = int(bucket.available()) if bucket else self.ops_per_minute
+        return {
+            "exempt": exempt,
+            "day_used": day,
+            "day_left": None if exempt or not self.daily_bytes else max(0, self.daily_bytes - day),
+            "month_used": month,
+            "month_left": None if exempt or not self.monthly_bytes else max(0, self.monthly_bytes - month),
+            "rate": None if exempt or not self.upload_rate else self.upload_rate,
+            "ops_left": ops_left,
+        }
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 import threading
-import asyncio
 import logging
 from web_server import run_web_server
-from bot import main as bot_main
+from bot import run as bot_run
 from config import config
 
 logging.basicConfig(level=config.LOG_LEVEL)
@@ -12,7 +11,7 @@ logger = logging.getLogger(__name__)
 def run_bot():
     """Run the Telegram bot"""
     try:
-        asyncio.run(bot_main())
+        bot_run()
     except Exception as e:
         logger.error(f"Bot error: {e}")
 
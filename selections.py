@@ -0,0 +1,72 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+
+from json_store import JsonStore
+
+SELECTION_TTL = 7 * 24 * 3600  # Same lifetime as presigned links
+
+
+class SelectionStore:
+    """Saved multi-file selections (token -> keys), shared by the bot and the web tier through one JSON file"""
+
+    def __init__(self, path, ttl=SELECTION_TTL):
+        self.store = JsonStore(path)
+        self.ttl = ttl
+        self.selections = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        # The other tier may have written since we last looked
+        try:
+            mtime = os.path.getmtime(self.store.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.selections = self.store.load()
+            self._mtime = mtime
+
+    def create(self, keys, name=None, owner=None):
+        """Save a selection and return its token"""
+        token = secrets.token_urlsafe(12)
+        now = time.time()
+        with self._lock:
+            self._refresh()
+            # Drop expired selections while we're rewriting the file anyway
+            self.selections = {t: s for t, s in self.selections.items() if s["expires"] > now}
+            self.selections[token] = {"keys": list(keys), "name": name, "owner": owner, "expires": now + self.ttl}
+            self.store.save(self.selections)
+            self._mtime = os.path.getmtime(self.store.path)
+        return token
+
+    def get(self, token):
+        """Selection dict for a token, or None if unknown/expired"""
+        with self._lock:
+            self._refresh()
+            selection = self.selections.get(token)
+        if not selection or selection["expires"] < time.time():
+            return None
+        return selection
+
+
+# --- Signed key lists (stateless alternative to saved selections, and /stream decryption grants) ---
+def sign_keys(secret, keys, expires, scope="zip"):
+    """HMAC over scope, expiry and keys (the scope keeps a /stream grant from verifying as a ZIP link)"""
+    payload = "\n".join([scope, str(int(expires)), *keys]).encode()
+    digest = hmac.new(secret.encode(), payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def verify_keys(secret, keys, expires, signature, scope="zip"):
+    """True if the signature matches and the link hasn't expired"""
+    try:
+        if int(expires) < time.time():
+            return False
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(sign_keys(secret, keys, expires, scope), signature or "")
@@ -0,0 +1,378 @@
+// Per-video parameters injected into the page as JSON
+const playerConfig = JSON.parse(document.getElementById('player-config').textContent);
+const mediaType = playerConfig.media_type;
+const mediaUrl = playerConfig.media_url;
+// Sidecar written at upload: poster, duration, width/height, mime and (MP4) moov byte range
+const mediaMeta = playerConfig.meta || null;
+
+console.log('Media Type:', mediaType);
+console.log('Media URL:', mediaUrl);
+
+// DOM Elements
+const loadingElement = document.getElementById('loading');
+const errorElement = document.getElementById('error');
+const mediaWrapper = document.getElementById('mediaWrapper');
+const imageContainer = document.getElementById('imageContainer');
+const controls = document.getElementById('controls');
+const fileInfo = document.getElementById('fileInfo');
+
+// Control Elements
+const playPauseBtn = document.getElementById('playPauseBtn');
+const progressBar = document.getElementById('progressBar');
+const progress = document.getElementById('progress');
+const currentTimeElement = document.getElementById('currentTime');
+const durationElement = document.getElementById('duration');
+const muteBtn = document.getElementById('muteBtn');
+const volumeSlider = document.getElementById('volumeSlider');
+const fullscreenBtn = document.getElementById('fullscreenBtn');
+const downloadBtn = document.getElementById('downloadBtn');
+
+// Info Elements
+const infoType = document.getElementById('infoType');
+const infoStatus = document.getElementById('infoStatus');
+const infoPlayer = document.getElementById('infoPlayer');
+
+let mediaElement;
+let isPlaying = false;
+let isSeeking = false;
+
+// Format time in MM:SS
+function formatTime(seconds) {
+    if (isNaN(seconds)) return "00:00";
+    const mins = Math.floor(seconds / 60);
+    const secs = Math.floor(seconds % 60);
+    return `${mins.toString().padStart(2, '0')}:${secs.toString().padStart(2, '0')}`;
+}
+
+// Initialize media player based on type
+function initializeMediaPlayer() {
+    if (!mediaUrl) {
+        showError('No media URL provided');
+        return;
+    }
+
+    infoType.textContent = mediaType.toUpperCase();
+    infoPlayer.textContent = 'HTML5 Player';
+    warmUpMedia();
+
+    switch(mediaType) {
+        case 'video':
+            createVideoPlayer();
+            break;
+        case 'audio':
+            createAudioPlayer();
+            break;
+        case 'image':
+            createImagePlayer();
+            break;
+        default:
+            showError('Unsupported media type: ' + mediaType);
+            return;
+    }
+}
+
+// Open the connection to storage (and fetch the moov box) while the element initializes
+function warmUpMedia() {
+    try {
+        const link = document.createElement('link');
+        link.rel = 'preconnect';
+        link.href = new URL(mediaUrl, window.location.href).origin;
+        document.head.appendChild(link);
+    } catch (e) {
+        console.log('Preconnect skipped:', e);
+    }
+
+    // With moov at the end (no faststart) the element needs a second range request for it;
+    // asking for just those bytes now warms the connection and the edge cache for that request
+    if (mediaMeta && mediaMeta.moov && mediaMeta.moov[0] > 0) {
+        fetch(mediaUrl, {
+            headers: {Range: `bytes=${mediaMeta.moov[0]}-${mediaMeta.moov[1]}`},
+            mode: 'no-cors',
+            credentials: 'omit'
+        }).catch(() => {});
+    }
+}
+
+// Poster, aspect ratio and duration are known before the first media byte arrives
+function applyMediaMeta() {
+    if (!mediaMeta) return;
+    if (mediaMeta.poster) {
+        mediaElement.poster = mediaMeta.poster;
+    }
+    if (mediaMeta.width && mediaMeta.height) {
+        mediaElement.style.aspectRatio = `${mediaMeta.width} / ${mediaMeta.height}`;
+        infoType.textContent = `${mediaType.toUpperCase()} · ${mediaMeta.width}×${mediaMeta.height}`;
+    }
+    if (mediaMeta.duration) {
+        durationElement.textContent = formatTime(mediaMeta.duration);
+    }
+    if (mediaMeta.poster || mediaMeta.width) {
+        hideLoading();
+    }
+}
+
+function createVideoPlayer() {
+    mediaElement = document.createElement('video');
+    mediaElement.id = 'mediaElement';
+    mediaElement.controls = false;
+    mediaElement.preload = 'metadata';
+    mediaElement.style.width = '100%';
+    mediaElement.style.height = 'auto';
+    mediaElement.style.maxHeight = '70vh';
+    applyMediaMeta();
+    
+    mediaWrapper.appendChild(mediaElement);
+    setupMediaElement();
+    showMediaWrapper();
+}
+
+function createAudioPlayer() {
+    mediaElement = document.createElement('audio');
+    mediaElement.id = 'mediaElement';
+    mediaElement.controls = false;
+    mediaElement.preload = 'metadata';
+    
+    mediaWrapper.appendChild(mediaElement);
+    setupMediaElement();
+    showMediaWrapper();
+}
+
+function createImagePlayer() {
+    const imgElement = document.createElement('img');
+    imgElement.id = 'imageElement';
+    imgElement.src = mediaUrl;
+    imgElement.alt = 'Displayed Image';
+    imgElement.onload = () => {
+        hideLoading();
+        imageContainer.style.display = 'flex';
+        fileInfo.style.display = 'block';
+        infoStatus.textContent = 'Loaded';
+    };
+    imgElement.onerror = () => {
+        showError('Failed to load image');
+    };
+    
+    imageContainer.appendChild(imgElement);
+    return;
+}
+
+function setupMediaElement() {
+    if (mediaMeta && mediaMeta.mime) {
+        // A typed <source> lets the browser reject unplayable formats without downloading
+        const source = document.createElement('source');
+        source.src = mediaUrl;
+        source.type = mediaMeta.mime;
+        source.addEventListener('error', onMediaError);
+        mediaElement.appendChild(source);
+    } else {
+        mediaElement.src = mediaUrl;
+    }
+
+    mediaElement.addEventListener('loadedmetadata', () => {
+        console.log('Media metadata loaded');
+        durationElement.textContent = formatTime(mediaElement.duration);
+        hideLoading();
+        controls.style.display = 'block';
+        fileInfo.style.display = 'block';
+        infoStatus.textContent = 'Ready to play';
+    });
+
+    mediaElement.addEventListener('timeupdate', updateProgress);
+    mediaElement.addEventListener('ended', onMediaEnded);
+    mediaElement.addEventListener('error', onMediaError);
+    mediaElement.addEventListener('waiting', onMediaWaiting);
+    mediaElement.addEventListener('canplay', onMediaCanPlay);
+
+    // Set initial volume
+    mediaElement.volume = volumeSlider.value / 100;
+
+    // Auto-play for better UX
+    setTimeout(() => {
+        if (mediaElement) {
+            mediaElement.play().catch(e => {
+                console.log('Auto-play prevented, waiting for user interaction');
+            });
+        }
+    }, 1000);
+}
+
+function showMediaWrapper() {
+    mediaWrapper.style.display = 'block';
+}
+
+function hideLoading() {
+    loadingElement.style.display = 'none';
+}
+
+function showError(message) {
+    loadingElement.style.display = 'none';
+    errorElement.textContent = message;
+    errorElement.style.display = 'block';
+}
+
+// Media event handlers
+function updateProgress() {
+    if (!isSeeking && mediaElement && mediaElement.duration) {
+        const progressPercent = (mediaElement.currentTime / mediaElement.duration) * 100;
+        progress.style.width = `${progressPercent}%`;
+        currentTimeElement.textContent = formatTime(mediaElement.currentTime);
+    }
+}
+
+function onMediaEnded() {
+    isPlaying = false;
+    playPauseBtn.innerHTML = '<i>▶️</i> Play';
+    progress.style.width = '0%';
+    currentTimeElement.textContent = '00:00';
+    infoStatus.textContent = 'Ended';
+}
+
+function onMediaError(e) {
+    console.error('Media error:', e);
+    showError('Error playing media file. The file may be corrupted or unsupported.');
+}
+
+function onMediaWaiting() {
+    infoStatus.textContent = 'Buffering...';
+}
+
+function onMediaCanPlay() {
+    infoStatus.textContent = isPlaying ? 'Playing' : 'Paused';
+}
+
+// Control event handlers
+playPauseBtn.addEventListener('click', () => {
+    if (!mediaElement) return;
+
+    if (isPlaying) {
+        mediaElement.pause();
+        playPauseBtn.innerHTML = '<i>▶️</i> Play';
+    } else {
+        mediaElement.play().then(() => {
+            playPauseBtn.innerHTML = '<i>⏸️</i> Pause';
+            infoStatus.textContent = 'Playing';
+        }).catch(e => {
+            console.error('Play failed:', e);
+            showError('Failed to play media. Please try again.');
+        });
+    }
+    isPlaying = !isPlaying;
+});
+
+progressBar.addEventListener('click', (e) => {
+    if (!mediaElement || !mediaElement.duration) return;
+    
+    const rect = progressBar.getBoundingClientRect();
+    const percent = (e.clientX - rect.left) / rect.width;
+    mediaElement.currentTime = percent * mediaElement.duration;
+});
+
+muteBtn.addEventListener('click', () => {
+    if (!mediaElement) return;
+    mediaElement.muted = !mediaElement.muted;
+    muteBtn.innerHTML = mediaElement.muted ? '<i>🔇</i>' : '<i>🔊</i>';
+    volumeSlider.value = mediaElement.muted ? 0 : mediaElement.volume * 100;
+});
+
+volumeSlider.addEventListener('input', () => {
+    if (!mediaElement) return;
+    mediaElement.volume = volumeSlider.value / 100;
+    mediaElement.muted = volumeSlider.value == 0;
+    muteBtn.innerHTML = volumeSlider.value == 0 ? '<i>🔇</i>' : '<i>🔊</i>';
+});
+
+fullscreenBtn.addEventListener('click', () => {
+    if (!mediaElement) return;
+    
+    if (mediaElement.requestFullscreen) {
+        mediaElement.requestFullscreen();
+    } else if (mediaElement.webkitRequestFullscreen) {
+        mediaElement.webkitRequestFullscreen();
+    } else if (mediaElement.msRequestFullscreen) {
+        mediaElement.msRequestFullscreen();
+    }
+});
+
+downloadBtn.addEventListener('click', () => {
+    const a = document.createElement('a');
+    a.href = mediaUrl;
+    a.download = mediaUrl.split('/').pop() || 'download';
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+});
+
+// Progress bar seeking
+progressBar.addEventListener('mousedown', (e) => {
+    isSeeking = true;
+    handleSeek(e);
+});
+
+document.addEventListener('mousemove', (e) => {
+    if (isSeeking) {
+        handleSeek(e);
+    }
+});
+
+document.addEventListener('mouseup', () => {
+    isSeeking = false;
+});
+
+function handleSeek(e) {
+    if (!mediaElement || !mediaElement.duration) return;
+    const rect = progressBar.getBoundingClientRect();
+    const percent = Math.max(0, Math.min(1, (e.clientX - rect.left) / rect.width));
+    const seekTime = percent * mediaElement.duration;
+    
+    progress.style.width = `${percent * 100}%`;
+    currentTimeElement.textContent = formatTime(seekTime);
+    
+    if (isSeeking) {
+        mediaElement.currentTime = seekTime;
+    }
+}
+
+// Keyboard controls
+document.addEventListener('keydown', (e) => {
+    if (!mediaElement) return;
+
+    switch(e.code) {
+        case 'Space':
+            e.preventDefault();
+            playPauseBtn.click();
+            break;
+        case 'ArrowLeft':
+            e.preventDefault();
+            mediaElement.currentTime = Math.max(0, mediaElement.currentTime - 10);
+            break;
+        case 'ArrowRight':
+            e.preventDefault();
+            mediaElement.currentTime = Math.min(mediaElement.duration, mediaElement.currentTime + 10);
+            break;
+        case 'ArrowUp':
+            e.preventDefault();
+            volumeSlider.value = Math.min(100, parseInt(volumeSlider.value) + 10);
+            volumeSlider.dispatchEvent(new Event('input'));
+            break;
+        case 'ArrowDown':
+            e.preventDefault();
+            volumeSlider.value = Math.max(0, parseInt(volumeSlider.value) - 10);
+            volumeSlider.dispatchEvent(new Event('input'));
+            break;
+        case 'KeyM':
+            e.preventDefault();
+            muteBtn.click();
+            break;
+        case 'KeyF':
+            e.preventDefault();
+            fullscreenBtn.click();
+            break;
+    }
+});
+
+// Initialize player when page loads
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initializeMediaPlayer);
+} else {
+    initializeMediaPlayer();
+}
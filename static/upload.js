@@ -0,0 +1,207 @@
+// Upload token and tuning injected into the page as JSON
+const uploadConfig = JSON.parse(document.getElementById('upload-config').textContent);
+const apiBase = `/upload/${uploadConfig.token}`;
+const parallel = Math.max(1, uploadConfig.parallel || 4);
+const PART_RETRIES = 4;
+const SIGN_BATCH = 64;
+
+// DOM Elements
+const fileInput = document.getElementById('fileInput');
+const uploadBtn = document.getElementById('uploadBtn');
+const cancelBtn = document.getElementById('cancelBtn');
+const errorElement = document.getElementById('error');
+const fileInfo = document.getElementById('fileInfo');
+const fileNameElement = document.getElementById('fileName');
+const progress = document.getElementById('progress');
+const infoProgress = document.getElementById('infoProgress');
+const infoSpeed = document.getElementById('infoSpeed');
+const infoStatus = document.getElementById('infoStatus');
+const doneElement = document.getElementById('done');
+const doneList = document.getElementById('doneList');
+
+let current = null; // In-flight upload: {uploadId, xhrs, cancelled}
+
+function humanBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) {
+        bytes /= 1024;
+        i++;
+    }
+    return `${bytes.toFixed(i ? 2 : 0)} ${units[i]}`;
+}
+
+function showError(message) {
+    errorElement.textContent = message;
+    errorElement.style.display = 'block';
+}
+
+async function api(step, body) {
+    const response = await fetch(`${apiBase}/${step}`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(body)
+    });
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        throw new Error(data.error || `Server error (${response.status})`);
+    }
+    return data;
+}
+
+// PUT one part straight to storage; resolves with its ETag
+function putPart(url, blob, onProgress) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        current.xhrs.add(xhr);
+        xhr.open('PUT', url);
+        xhr.upload.onprogress = (event) => onProgress(event.loaded);
+        xhr.onload = () => {
+            current.xhrs.delete(xhr);
+            const etag = xhr.getResponseHeader('ETag');
+            if (xhr.status >= 200 && xhr.status < 300 && etag) {
+                resolve(etag);
+            } else if (xhr.status >= 200 && xhr.status < 300) {
+                reject(new Error('Storage did not expose the ETag header (check the bucket CORS rules)'));
+            } else {
+                reject(new Error(`Part upload failed (${xhr.status})`));
+            }
+        };
+        xhr.onerror = () => {
+            current.xhrs.delete(xhr);
+            reject(new Error('Network error (or the bucket CORS rules block this page)'));
+        };
+        xhr.onabort = () => {
+            current.xhrs.delete(xhr);
+            reject(new Error('Cancelled'));
+        };
+        xhr.send(blob);
+    });
+}
+
+async function uploadFile(file) {
+    errorElement.style.display = 'none';
+    fileInfo.style.display = 'block';
+    fileNameElement.textContent = `${file.name} (${humanBytes(file.size)})`;
+    progress.style.width = '0%';
+    infoStatus.textContent = 'Starting...';
+
+    const session = await api('create', {name: file.name, size: file.size, type: file.type});
+    current.uploadId = session.upload_id;
+    const urls = session.urls;
+    const partProgress = new Array(session.parts + 1).fill(0);
+    const etags = [];
+    const started = performance.now();
+    let nextPart = 1;
+
+    const updateProgress = () => {
+        const sent = partProgress.reduce((a, b) => a + b, 0);
+        const seconds = (performance.now() - started) / 1000;
+        progress.style.width = `${(sent / file.size * 100).toFixed(1)}%`;
+        infoProgress.textContent = `${humanBytes(sent)} / ${humanBytes(file.size)}`;
+        infoSpeed.textContent = seconds > 0 ? `${humanBytes(sent / seconds)}/s` : '-';
+    };
+
+    // Sign the next batch before the workers run out of URLs
+    let signing = null;
+    const urlFor = async (part) => {
+        while (!urls[part]) {
+            if (!signing) {
+                const batch = [];
+                for (let n = part; n <= Math.min(session.parts, part + SIGN_BATCH - 1); n++) {
+                    if (!urls[n]) batch.push(n);
+                }
+                signing = api('sign', {upload_id: session.upload_id, parts: batch})
+                    .then((data) => Object.assign(urls, data.urls))
+                    .finally(() => { signing = null; });
+            }
+            await signing;
+        }
+        return urls[part];
+    };
+
+    const worker = async () => {
+        while (nextPart <= session.parts && !current.cancelled) {
+            const part = nextPart++;
+            const start = (part - 1) * session.part_size;
+            const blob = file.slice(start, Math.min(start + session.part_size, file.size));
+            for (let attempt = 1; ; attempt++) {
+                try {
+                    const etag = await putPart(await urlFor(part), blob, (loaded) => {
+                        partProgress[part] = loaded;
+                        updateProgress();
+                    });
+                    etags.push({part, etag});
+                    break;
+                } catch (error) {
+                    partProgress[part] = 0;
+                    if (current.cancelled || attempt >= PART_RETRIES) throw error;
+                    // Presigned URLs expire: re-sign before retrying
+                    delete urls[part];
+                    await new Promise((r) => setTimeout(r, 1000 * 2 ** attempt));
+                }
+            }
+        }
+    };
+
+    infoStatus.textContent = `Uploading ${session.parts} part(s), ${Math.min(parallel, session.parts)} at a time`;
+    await Promise.all(Array.from({length: Math.min(parallel, session.parts)}, worker));
+    if (current.cancelled) throw new Error('Cancelled');
+
+    infoStatus.textContent = 'Finishing...';
+    const result = await api('complete', {upload_id: session.upload_id, parts: etags});
+    current.uploadId = null;
+    infoStatus.textContent = 'Done';
+
+    const item = document.createElement('li');
+    if (result.url) {
+        const link = document.createElement('a');
+        link.href = result.url;
+        link.textContent = file.name;
+        item.appendChild(link);
+    } else {
+        item.textContent = file.name;
+    }
+    doneList.appendChild(item);
+    doneElement.style.display = 'block';
+}
+
+async function uploadAll() {
+    const files = Array.from(fileInput.files);
+    if (!files.length) return;
+    uploadBtn.disabled = true;
+    fileInput.disabled = true;
+    cancelBtn.style.display = 'flex';
+    current = {uploadId: null, xhrs: new Set(), cancelled: false};
+    try {
+        for (const file of files) {
+            await uploadFile(file);
+            if (current.cancelled) break;
+        }
+    } catch (error) {
+        console.error('Upload failed:', error);
+        showError(`❌ ${error.message}`);
+        infoStatus.textContent = 'Failed';
+        if (current.uploadId) {
+            api('abort', {upload_id: current.uploadId}).catch(() => {});
+        }
+    } finally {
+        current = null;
+        uploadBtn.disabled = false;
+        fileInput.disabled = false;
+        cancelBtn.style.display = 'none';
+    }
+}
+
+fileInput.addEventListener('change', () => {
+    uploadBtn.disabled = !fileInput.files.length;
+});
+uploadBtn.addEventListener('click', uploadAll);
+cancelBtn.addEventListener('click', () => {
+    if (!current) return;
+    current.cancelled = true;
+    current.xhrs.forEach((xhr) => xhr.abort());
+});
+window.addEventListener('beforeunload', (event) => {
+    if (current) event.preventDefault();
+});
@@ -0,0 +1,279 @@
+import json
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from presigner import SigV4Presigner
+
+logger = logging.getLogger(__name__)
+
+MIN_THROUGHPUT_SAMPLE = 1024 * 1024  # Smaller uploads say more about latency than bandwidth
+
+
+class RollingStat:
+    """Exponentially weighted moving average of a measurement"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+        self.samples = 0
+
+    def add(self, sample):
+        self.value = sample if self.value is None else self.alpha * sample + (1 - self.alpha) * self.value
+        self.samples += 1
+
+
+class StorageTarget:
+    """One region/bucket (or a local S3 stand-in) with its own client, presigner and health stats"""
+
+    def __init__(self, name, region, bucket, access_key, secret_key, endpoint=None,
+                 addressing_style="virtual", latency_ms=0):
+        self.name = name
+        self.region = region
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.endpoint = endpoint or f"https://s3.{region}.wasabisys.com"
+        self.addressing_style = addressing_style
+        self.latency_ms = latency_ms  # Simulated per-request latency for local testing
+        parsed = urlparse(self.endpoint)
+        self.presigner = SigV4Presigner(
+            access_key, secret_key, region, bucket,
+            endpoint_host=parsed.netloc, addressing_style=addressing_style, scheme=parsed.scheme
+        )
+        self.client = None
+        self.healthy = False
+        self.error = None
+        self.throughput = RollingStat()  # bytes/s of uploads
+        self.first_byte = RollingStat()  # seconds until the first response byte
+
+    @property
+    def host(self):
+        return self.presigner.host
+
+    def estimated_seconds(self, size):
+        """Expected time to upload ``size`` bytes here"""
+        first_byte = self.first_byte.value if self.first_byte.value is not None else 0.1
+        throughput = self.throughput.value or 10 * 1024 * 1024
+        return first_byte + size / throughput
+
+    def status(self):
+        return {
+            "region": self.region,
+            "bucket": self.bucket,
+            "healthy": self.healthy,
+            "error": self.error,
+            "throughput": self.throughput.value,
+            "first_byte_ms": round(self.first_byte.value * 1000, 1) if self.first_byte.value is not None else None,
+        }
+
+
+class StorageRouter:
+    """Chooses a target per upload from rolling throughput/latency and replicates hot objects"""
+
+    def __init__(self, targets, client_factory, index_store, replicate_after=0, explore_samples=3):
+        if not targets:
+            raise ValueError("At least one storage target is required")
+        self.targets = {t.name: t for t in targets}
+        self.primary = targets[0]
+        self.client_factory = client_factory
+        self.index_store = index_store
+        self.replicate_after = replicate_after  # Link/download count that triggers replication, 0 = off
+        self.explore_samples = explore_samples
+        self.index = {}  # key -> {"targets": [names], "downloads": n, "encrypted": bool (only when set)}
+        self.replicating = set()
+        self._lock = threading.Lock()
+
+    # --- Setup & probing ---
+    def connect(self):
+        """Build clients and probe all targets concurrently; fails only if none is reachable"""
+        self.index = self.index_store.load()
+        with ThreadPoolExecutor(max_workers=len(self.targets)) as pool:
+            list(pool.map(self._connect_target, self.targets.values()))
+        if not any(t.healthy for t in self.targets.values()):
+            errors = "; ".join(f"{t.name}: {t.error}" for t in self.targets.values())
+            raise ConnectionError(f"No storage target reachable ({errors})")
+        return self
+
+    def _connect_target(self, target):
+        try:
+            if target.client is None:
+                target.client = self.client_factory(target)
+                if target.latency_ms:
+                    _add_latency(target.client, target.latency_ms / 1000.0)
+            self.probe(target)
+        except Exception as e:
+            target.healthy = False
+            target.error = str(e)
+            logger.error(f"❌ Storage target {target.name} unavailable: {e}")
+
+    def probe(self, target=None):
+        """Measure first-byte latency with a HEAD on the bucket"""
+        targets = [target] if target else list(self.targets.values())
+        for t in targets:
+            started = time.perf_counter()
+            try:
+                t.client.head_bucket(Bucket=t.bucket)
+            except Exception as e:
+                t.healthy = False
+                t.error = str(e)
+                continue
+            t.first_byte.add(time.perf_counter() - started)
+            t.healthy = True
+            t.error = None
+
+    # --- Routing ---
+    def healthy_targets(self):
+        healthy = [t for t in self.targets.values() if t.healthy]
+        return healthy or [self.primary]
+
+    def choose(self, size):
+        """Best target for a new upload of ``size`` bytes"""
+        candidates = self.healthy_targets()
+        if len(candidates) == 1:
+            return candidates[0]
+        # Give every target a few real uploads before trusting the estimates
+        unexplored = [t for t in candidates if t.throughput.samples < self.explore_samples]
+        if unexplored:
+            return min(unexplored, key=lambda t: t.throughput.samples)
+        return min(candidates, key=lambda t: t.estimated_seconds(size))
+
+    def record_upload(self, target, size, seconds):
+        if seconds <= 0:
+            return
+        if size >= MIN_THROUGHPUT_SAMPLE:
+            target.throughput.add(size / seconds)
+        else:
+            target.first_byte.add(seconds)
+
+    # --- Object index ---
+    def place(self, key, target, encrypted=False, owner=None):
+        """Remember where a new object was written (and which user uploaded it)"""
+        with self._lock:
+            self.index[key] = {"targets": [target.name], "downloads": 0}
+            if encrypted:
+                self.index[key]["encrypted"] = True
+            if owner is not None:
+                self.index[key]["owner"] = owner
+
+    def owner(self, key):
+        """User ID that uploaded ``key`` (None for objects from before owners were recorded)"""
+        with self._lock:
+            entry = self.index.get(key)
+            return entry.get("owner") if entry else None
+
+    def is_encrypted(self, key):
+        """Whether ``key`` was stored encrypted (links must go through the decrypting web tier)"""
+        with self._lock:
+            entry = self.index.get(key)
+            return bool(entry and entry.get("encrypted"))
+
+    def locate(self, key):
+        """Targets holding ``key``; objects missing from the index live on the primary"""
+        with self._lock:
+            entry = self.index.get(key)
+            names = list(entry["targets"]) if entry else []
+        targets = [self.targets[n] for n in names if n in self.targets]
+        return targets or [self.primary]
+
+    def target_for(self, key):
+        """Fastest healthy holder of ``key`` for reads"""
+        holders = self.locate(key)
+        healthy = [t for t in holders if t.healthy] or holders
+        return min(healthy, key=lambda t: t.first_byte.value if t.first_byte.value is not None else float("inf"))
+
+    def forget(self, key):
+        with self._lock:
+            self.index.pop(key, None)
+
+    def rename(self, old_key, new_key):
+        """Point the index at a moved object (same holders)"""
+        with self._lock:
+            entry = self.index.pop(old_key, None)
+            if entry is not None:
+                self.index[new_key] = entry
+
+    def copy_entry(self, key, new_key):
+        """Index a server-side copy on the same holders as its source"""
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                self.index[new_key] = {"targets": list(entry["targets"]), "downloads": 0}
+                for field in ("encrypted", "owner"):
+                    if field in entry:
+                        self.index[new_key][field] = entry[field]
+
+    def record_download(self, key):
+        """Count a download/link request; returns replication jobs (source, dest) once the key is hot"""
+        with self._lock:
+            entry = self.index.setdefault(key, {"targets": [self.primary.name], "downloads": 0})
+            entry["downloads"] += 1
+            if not self.replicate_after or entry["downloads"] < self.replicate_after or key in self.replicating:
+                return []
+            missing = [t for t in self.targets.values() if t.name not in entry["targets"] and t.healthy]
+            if not missing:
+                return []
+            self.replicating.add(key)
+            source_names = list(entry["targets"])
+        source = min((self.targets[n] for n in source_names if n in self.targets),
+                     key=lambda t: t.first_byte.value or float("inf"), default=self.primary)
+        return [(source, dest) for dest in missing]
+
+    def replicate(self, key, source, dest):
+        """Copy an object between targets (different endpoints, so it streams through this host)"""
+        try:
+            head = source.client.head_object(Bucket=source.bucket, Key=key)
+            extra_args = {"Metadata": head.get("Metadata", {})}
+            for field in ("ContentType", "ContentEncoding"):
+                if head.get(field):
+                    extra_args[field] = head[field]
+            body = source.client.get_object(Bucket=source.bucket, Key=key)["Body"]
+            dest.client.upload_fileobj(body, dest.bucket, key, ExtraArgs=extra_args)
+            with self._lock:
+                entry = self.index.setdefault(key, {"targets": [source.name], "downloads": 0})
+                if dest.name not in entry["targets"]:
+                    entry["targets"].append(dest.name)
+            logger.info(f"🌍 Replicated {key}: {source.name} -> {dest.name}")
+        finally:
+            with self._lock:
+                self.replicating.discard(key)
+
+    def save(self):
+        with self._lock:
+            snapshot = json.loads(json.dumps(self.index))
+        self.index_store.save(snapshot)
+
+    def status(self):
+        return {name: t.status() for name, t in self.targets.items()}
+
+
+def targets_from_config(config):
+    """STORAGE_TARGETS (JSON list) or the single WASABI_* target"""
+    if not config.STORAGE_TARGETS:
+        return [StorageTarget(
+            "primary", config.WASABI_REGION, config.WASABI_BUCKET,
+            config.WASABI_ACCESS_KEY, config.WASABI_SECRET_KEY
+        )]
+    targets = []
+    for index, spec in enumerate(json.loads(config.STORAGE_TARGETS)):
+        region = spec.get("region", config.WASABI_REGION)
+        targets.append(StorageTarget(
+            spec.get("name") or f"{region}-{index}",
+            region,
+            spec.get("bucket", config.WASABI_BUCKET),
+            spec.get("access_key", config.WASABI_ACCESS_KEY),
+            spec.get("secret_key", config.WASABI_SECRET_KEY),
+            endpoint=spec.get("endpoint"),
+            addressing_style=spec.get("addressing_style", "virtual"),
+            latency_ms=spec.get("latency_ms", 0),
+        ))
+    return targets
+
+
+def _add_latency(client, seconds):
+    """Delay every request from ``client`` (simulated distance to a local stand-in)"""
+    def _sleep(**kwargs):
+        time.sleep(seconds)
+    client.meta.events.register("before-send", _sleep)
@@ -0,0 +1,151 @@
+import time
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Subsystem states
+PENDING = "pending"
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+
+class Subsystem:
+    """A lazily initialized dependency (S3 client, shortener session, web app...)"""
+
+    def __init__(self, name, factory, critical=False, retry_after=30.0):
+        self.name = name
+        self.factory = factory
+        self.critical = critical
+        self.retry_after = retry_after
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.init_time = None
+        self.failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the initialized value, building it on first use (None on failure)"""
+        if self.state == READY:
+            return self.value
+
+        with self._lock:
+            if self.state == READY:
+                return self.value
+            # Don't hammer a dependency that just failed
+            if self.state == FAILED and time.monotonic() - self.failed_at < self.retry_after:
+                return None
+
+            self.state = STARTING
+            started = time.perf_counter()
+            try:
+                self.value = self.factory()
+                self.state = READY
+                self.error = None
+            except Exception as e:
+                self.value = None
+                self.state = FAILED
+                self.error = str(e)
+                self.failed_at = time.monotonic()
+                logger.error(f"❌ Subsystem '{self.name}' failed to initialize: {e}")
+            finally:
+                self.init_time = time.perf_counter() - started
+
+        return self.value
+
+    def peek(self):
+        """Return the value only if it is already initialized, never blocks"""
+        return self.value if self.state == READY else None
+
+    def status(self):
+        return {
+            "state": self.state,
+            "critical": self.critical,
+            "init_ms": round(self.init_time * 1000, 2) if self.init_time is not None else None,
+            "error": self.error,
+        }
+
+
+class Registry:
+    """Holds all subsystems and warms them up concurrently"""
+
+    def __init__(self):
+        self.subsystems = {}
+
+    def register(self, name, factory, critical=False, retry_after=30.0):
+        subsystem = Subsystem(name, factory, critical=critical, retry_after=retry_after)
+        self.subsystems[name] = subsystem
+        return subsystem
+
+    def get(self, name):
+        return self.subsystems[name].get()
+
+    def warm_up(self, names=None):
+        """Initialize subsystems in background threads so none blocks startup"""
+        threads = []
+        for name in names or list(self.subsystems):
+            subsystem = self.subsystems[name]
+            if subsystem.state != PENDING:
+                continue
+            thread = threading.Thread(target=subsystem.get, name=f"warmup-{name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def readiness(self):
+        """Per-subsystem state; ready once every critical subsystem is up"""
+        statuses = {name: s.status() for name, s in self.subsystems.items()}
+        ready = all(s.state == READY for s in self.subsystems.values() if s.critical)
+        return {"ready": ready, "subsystems": statuses}
+
+
+class StartupProfile:
+    """Records time spent per startup phase and per heavy import"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.imports = {}
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def timed_import(self, module_name):
+        """Import a module and record its import cost"""
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.imports.setdefault(module_name, time.perf_counter() - started)
+        return module
+
+    def mark_ready(self):
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter() - self.started
+
+    def report(self):
+        return {
+            "total_ms": round((self.ready_at or time.perf_counter() - self.started) * 1000, 2),
+            "ready": self.ready_at is not None,
+            "phases": {name: round(elapsed * 1000, 2) for name, elapsed in self.phases},
+            "imports": {name: round(elapsed * 1000, 2) for name, elapsed in self.imports.items()},
+        }
+
+    def summary(self):
+        report = self.report()
+        phases = ", ".join(f"{name}={ms}ms" for name, ms in report["phases"].items())
+        imports = ", ".join(f"{name}={ms}ms" for name, ms in report["imports"].items())
+        return f"⏱ Startup {report['total_ms']}ms | phases: {phases or '-'} | imports: {imports or '-'}"
+
+
+# Global registry and startup profile
+registry = Registry()
+profile = StartupProfile()
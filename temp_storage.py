@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientSpaceError(Exception):
+    """Raised when a job cannot be admitted because temp space is exhausted"""
+
+
+class Reservation:
+    """Space reserved for one transfer, backed by a (preallocated) file"""
+
+    def __init__(self, manager, path, size, tier):
+        self.manager = manager
+        self.path = path
+        self.size = size
+        self.tier = tier
+        self.allocated = 0
+        self.released = False
+
+    def preallocate(self):
+        """Create the file with its final size so the filesystem allocates contiguous extents"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if self.size > 0:
+                try:
+                    os.posix_fallocate(fd, 0, self.size)
+                except (AttributeError, OSError) as e:
+                    # Filesystems without fallocate support (or non-Linux) fall back to a sparse file
+                    logger.debug(f"fallocate unavailable for {self.path}: {e}")
+                    os.ftruncate(fd, self.size)
+                    return self.path
+            self.manager._allocated(self)
+        finally:
+            os.close(fd)
+        return self.path
+
+    def release(self):
+        """Delete the file and give the reserved space back"""
+        if self.released:
+            return
+        self.released = True
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove temp file {self.path}: {e}")
+        self.manager._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class TempStorage:
+    """Manages ./downloads (and an optional tmpfs tier) with quotas, reservations and preallocation"""
+
+    def __init__(self, root, tmpfs_root=None, tmpfs_max_file=0, tmpfs_max_total=0, min_free=512 * 1024 * 1024):
+        self.root = root
+        self.tmpfs_root = tmpfs_root
+        self.tmpfs_max_file = tmpfs_max_file
+        self.tmpfs_max_total = tmpfs_max_total
+        self.min_free = min_free  # Safety margin left free on each filesystem
+        self.reserved = {"disk": 0, "tmpfs": 0}
+        self.allocated = {"disk": 0, "tmpfs": 0}  # Reserved bytes already taken from the filesystem
+        self._paths = set()  # Paths of live reservations
+        self._lock = threading.Lock()
+
+    def setup(self):
+        """Create the tier directories and sweep files left behind by a killed process"""
+        os.makedirs(self.root, exist_ok=True)
+        if self.tmpfs_root:
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"tmpfs tier disabled ({self.tmpfs_root}): {e}")
+                self.tmpfs_root = None
+        removed = self.sweep_orphans()
+        if removed:
+            logger.info(f"🧹 Removed {removed} orphaned temp files")
+        return self
+
+    def sweep_orphans(self, older_than=None):
+        """Delete unreserved files in the managed directories (all of them by default)"""
+        cutoff = older_than if older_than is not None else time.time()
+        with self._lock:
+            active = set(self._paths)
+        removed = 0
+        for directory in filter(None, [self.root, self.tmpfs_root]):
+            for entry in os.scandir(directory):
+                if not entry.is_file() or entry.path in active:
+                    continue
+                try:
+                    if entry.stat().st_mtime <= cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    # --- Capacity ---
+    def _headroom(self, tier):
+        """Free bytes minus outstanding (not yet preallocated) reservations; call with the lock held"""
+        directory = self.tmpfs_root if tier == "tmpfs" else self.root
+        free = shutil.disk_usage(directory).free
+        available = free - (self.reserved[tier] - self.allocated[tier]) - self.min_free
+        if tier == "tmpfs" and self.tmpfs_max_total:
+            available = min(available, self.tmpfs_max_total - self.reserved["tmpfs"])
+        return available
+
+    def available_capacity(self, tier="disk"):
+        """Bytes a new job can still reserve on ``tier``"""
+        with self._lock:
+            return max(0, self._headroom(tier))
+
+    def can_accept(self, size):
+        return self.available_capacity("disk") >= size or self._tmpfs_fits(size)
+
+    def _tmpfs_fits(self, size):
+        return bool(self.tmpfs_root) and size <= self.tmpfs_max_file and self.available_capacity("tmpfs") >= size
+
+    # --- Reservations ---
+    def reserve(self, name, size, preallocate=True):
+        """Reserve space for ``size`` bytes and return a Reservation with a collision-free path"""
+        tier = "tmpfs" if self._tmpfs_fits(size) else "disk"
+        with self._lock:
+            directory = self.tmpfs_root if tier == "tmpfs" else self.root
+            available = self._headroom(tier)
+            if available < size:
+                raise InsufficientSpaceError(
+                    f"need {size} bytes, only {max(0, available)} available in temp storage"
+                )
+            self.reserved[tier] += size
+            path = os.path.join(directory, f"{uuid.uuid4().hex[:16]}_{self._safe_name(name)}")
+            self._paths.add(path)
+
+        reservation = Reservation(self, path, size, tier)
+        if preallocate:
+            try:
+                reservation.preallocate()
+            except OSError:
+                reservation.release()
+                raise
+        return reservation
+
+    def _allocated(self, reservation):
+        with self._lock:
+            reservation.allocated = reservation.size
+            self.allocated[reservation.tier] += reservation.size
+
+    def _release(self, reservation):
+        with self._lock:
+            self.reserved[reservation.tier] -= reservation.size
+            self.allocated[reservation.tier] -= reservation.allocated
+            self._paths.discard(reservation.path)
+
+    @staticmethod
+    def _safe_name(name):
+        name = re.sub(r"[^\w.\-]+", "_", os.path.basename(name or "file"))
+        return name[-120:] or "file"
+
+    def stats(self):
+        return {
+            "disk_available": self.available_capacity("disk"),
+            "disk_reserved": self.reserved["disk"],
+            "tmpfs_available": self.available_capacity("tmpfs") if self.tmpfs_root else 0,
+            "tmpfs_reserved": self.reserved["tmpfs"],
+        }
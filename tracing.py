@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Span that new spans attach to when no parent is given
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed stage of a transfer with parent/child links and attributes"""
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attrs=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def end(self, error=None):
+        """Close the span and hand it to the exporter (idempotent)"""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._t0
+        if error is not None:
+            self.error = str(error) or error.__class__.__name__
+        self.tracer._finish(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """Collects spans in memory and appends them to a rotating JSONL file from a background thread"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=3, keep_traces=200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.keep_traces = keep_traces
+        self.traces = OrderedDict()  # trace_id -> list of finished span dicts
+        self.keys = OrderedDict()  # lookup key (e.g. message id) -> latest trace_id
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer = None
+
+    # --- Span creation ---
+    def start_trace(self, name, keys=(), **attrs):
+        """Start a root span; ``keys`` are lookup keys for /trace (message ids)"""
+        span = Span(self, name, uuid.uuid4().hex, attrs=attrs)
+        with self._lock:
+            self.traces[span.trace_id] = []
+            for key in keys:
+                self.keys[str(key)] = span.trace_id
+                self.keys.move_to_end(str(key))
+            while len(self.traces) > self.keep_traces:
+                self.traces.popitem(last=False)
+            while len(self.keys) > self.keep_traces * 4:
+                self.keys.popitem(last=False)
+        return span
+
+    def start_span(self, name, parent=None, **attrs):
+        """Start a child span of ``parent`` (defaults to the current span, None if not tracing)"""
+        parent = parent or current_span.get()
+        if parent is None:
+            return None
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    @contextmanager
+    def span(self, name, parent=None, **attrs):
+        """Context manager that makes the new span current for nested stages"""
+        span = self.start_span(name, parent, **attrs)
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end()
+
+    @contextmanager
+    def activate(self, span):
+        """Make an existing span current"""
+        token = current_span.set(span)
+        try:
+            yield span
+        finally:
+            current_span.reset(token)
+
+    # --- Export ---
+    def _finish(self, span):
+        record = span.to_dict()
+        with self._lock:
+            spans = self.traces.get(span.trace_id)
+            if spans is not None:
+                spans.append(record)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+        self._queue.put(record)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is pending to write in one go
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.debug(f"Trace export failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in batch:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{index}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def flush(self, timeout=5.0):
+        """Wait (bounded) until queued spans are on disk"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # --- Lookup & rendering ---
+    def latest(self, key=None):
+        """Spans of the latest trace for ``key`` (or the latest trace overall)"""
+        with self._lock:
+            trace_id = self.keys.get(str(key)) if key is not None else next(reversed(self.traces), None)
+            if trace_id in self.traces:
+                return list(self.traces[trace_id])
+        if key is None:
+            return []
+        return self._load_from_file(str(key))
+
+    def _load_from_file(self, key):
+        """Fall back to the JSONL file for traces that are no longer in memory"""
+        trace_id = None
+        spans = {}
+        for path in [f"{self.path}.{i}" for i in range(self.backups, 0, -1)] + [self.path]:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    spans.setdefault(record["trace_id"], []).append(record)
+                    attrs = record.get("attrs", {})
+                    if record["parent_id"] is None and key in (str(attrs.get("message_id")), str(attrs.get("status_message_id"))):
+                        trace_id = record["trace_id"]
+        return spans.get(trace_id, [])
+
+
+def render_waterfall(spans, width=20, max_parts=6):
+    """Render spans as a text waterfall, children indented under their parent.
+
+    More than ``max_parts`` sibling part spans of one kind (e.g. a 60-part upload)
+    collapse into one summary row, so the waterfall stays message-sized.
+    """
+    if not spans:
+        return "No trace recorded."
+
+    root = next((s for s in spans if s["parent_id"] is None), None) or min(spans, key=lambda s: s["start"])
+    origin = root["start"]
+    total_ms = max((s["start"] - origin) * 1000 + s["duration_ms"] for s in spans) or 1.0
+
+    children = {}
+    for span in sorted(spans, key=lambda s: s["start"]):
+        children.setdefault(span["parent_id"], []).append(span)
+
+    lines = []
+
+    def row(label, offset, duration_ms, extra):
+        lead = int(offset / total_ms * width)
+        bar = max(1, int(duration_ms / total_ms * width))
+        bar = min(bar, width - lead) if lead < width else 1
+        lines.append(
+            f"{label[:24]:<24} {' ' * lead}{'█' * bar}{' ' * (width - lead - bar)} "
+            f"{duration_ms:>9.1f}ms {' '.join(extra)}".rstrip()
+        )
+
+    def summarize(name, parts, depth):
+        # One row spanning the whole group: count, p50/max per part, total bytes
+        first = min(s["start"] for s in parts)
+        last = max(s["start"] * 1000 + s["duration_ms"] for s in parts)
+        durations = sorted(s["duration_ms"] for s in parts)
+        extra = [f"p50={durations[len(durations) // 2]:.1f}ms", f"max={durations[-1]:.1f}ms"]
+        size = sum(s.get("attrs", {}).get("size", 0) for s in parts)
+        if size:
+            extra.append(_human(size))
+        retries = sum(s.get("attrs", {}).get("retries", 0) for s in parts)
+        if retries:
+            extra.append(f"retries={retries}")
+        errors = sum(1 for s in parts if s.get("error"))
+        if errors:
+            extra.append(f"❌x{errors}")
+        row("  " * depth + f"{name} x{len(parts)}", (first - origin) * 1000, last - first * 1000, extra)
+
+    def walk(span, depth):
+        offset = (span["start"] - origin) * 1000
+        attrs = span.get("attrs", {})
+        extra = []
+        if "size" in attrs:
+            extra.append(_human(attrs["size"]))
+        if attrs.get("retries"):
+            extra.append(f"retries={attrs['retries']}")
+        if "queue_wait_ms" in attrs:
+            extra.append(f"queued={attrs['queue_wait_ms']}ms")
+        if span.get("error"):
+            extra.append("❌")
+        name = f"{span['name']}#{attrs['part']}" if "part" in attrs else span["name"]
+        row("  " * depth + name, offset, span["duration_ms"], extra)
+
+        kids = children.get(span["span_id"], [])
+        groups = {}
+        for child in kids:
+            if "part" in child.get("attrs", {}):
+                groups.setdefault(child["name"], []).append(child)
+        for child in kids:
+            group = groups.get(child["name"]) if "part" in child.get("attrs", {}) else None
+            if group and len(group) > max_parts:
+                if child is group[0]:
+                    summarize(child["name"], group, depth + 1)
+                continue
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    # Orphans (parent not finished yet) go at the bottom
+    seen_ids = {s["span_id"] for s in spans}
+    for span in spans:
+        if span is not root and span["parent_id"] not in seen_ids:
+            walk(span, 1)
+    return "\n".join(lines)
+
+
+def _human(size):
+    size = float(size)
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def create_tracer(path):
+    tracer = Tracer(path)
+    atexit.register(tracer.flush)
+    return tracer
@@ -0,0 +1,147 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always served
+    brotli = None
+
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"  # Hashed URLs never change
+PAGE_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+DYNAMIC_MIN_COMPRESS = 1024  # Per-request pages smaller than this go out as-is
+
+CONFIG_SENTINEL = "\x00PLAYER_CONFIG\x00"
+
+
+class Asset:
+    """A response body with its precompressed variants and a strong ETag"""
+
+    def __init__(self, body, content_type, cache_control):
+        self.body = body
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+
+class PageShell:
+    """A page rendered once at startup, with a hole where per-request JSON goes"""
+
+    def __init__(self, rendered):
+        self.prefix, self.suffix = rendered.split(CONFIG_SENTINEL, 1)
+
+    def render(self, config):
+        # Escape "</" so the JSON can't close the <script> tag it lives in
+        payload = json.dumps(config, separators=(",", ":")).replace("</", "<\\/")
+        return f"{self.prefix}{payload}{self.suffix}".encode()
+
+
+class AssetCache:
+    """Precompressed static assets and page shells served with ETag/304 handling"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = {}  # URL path -> Asset
+        self.urls = {}  # file name -> hashed URL path
+
+    def add_static(self, name, content_type):
+        """Load a static file and register it under a content-hashed URL"""
+        with open(os.path.join(self.static_folder, name), "rb") as f:
+            asset = Asset(f.read(), content_type, STATIC_CACHE_CONTROL)
+        stem, ext = os.path.splitext(name)
+        url = f"/static/{stem}.{asset.etag.strip(chr(34))[:12]}{ext}"
+        self.assets[url] = asset
+        self.urls[name] = url
+        return url
+
+    def add_page(self, url, body, content_type="text/html; charset=utf-8"):
+        self.assets[url] = Asset(body, content_type, PAGE_CACHE_CONTROL)
+        return self.assets[url]
+
+    def asset_url(self, name):
+        return self.urls[name]
+
+    # --- Responses (plain WSGI, no framework request/response objects) ---
+    def serve(self, environ, start_response, asset):
+        """Serve a prebuilt asset, negotiating encoding and answering conditional requests"""
+        headers = [("ETag", asset.etag), ("Cache-Control", asset.cache_control), ("Vary", "Accept-Encoding")]
+        if _not_modified(environ, asset.etag):
+            start_response("304 Not Modified", headers)
+            return []
+
+        body = asset.body
+        accepted = _accepted_encodings(environ)
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and encoding in accepted:
+                body = asset.variants[encoding]
+                headers.append(("Content-Encoding", encoding))
+                break
+        return _send(environ, start_response, headers, asset.content_type, body)
+
+    def serve_dynamic(self, environ, start_response, body, cache_control, content_type="text/html; charset=utf-8"):
+        """Serve a small per-request body with an ETag derived from its content"""
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers = [("ETag", etag), ("Cache-Control", cache_control), ("Vary", "Accept-Encoding")]
+        if _not_modified(environ, etag):
+            start_response("304 Not Modified", headers)
+            return []
+
+        if len(body) >= DYNAMIC_MIN_COMPRESS and "gzip" in _accepted_encodings(environ):
+            body = gzip.compress(body, 1, mtime=0)
+            headers.append(("Content-Encoding", "gzip"))
+        return _send(environ, start_response, headers, content_type, body)
+
+
+class AssetMiddleware:
+    """Answers asset and page-shell requests before they reach Flask routing"""
+
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+        self.handlers = []  # (path prefix, handler(environ, start_response, rest))
+
+    def route_prefix(self, prefix, handler):
+        self.handlers.append((prefix, handler))
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            path = environ.get("PATH_INFO", "")
+            asset = self.cache.assets.get(path)
+            if asset is not None:
+                return self.cache.serve(environ, start_response, asset)
+            for prefix, handler in self.handlers:
+                if path.startswith(prefix):
+                    return handler(environ, start_response, path[len(prefix):])
+        return self.app(environ, start_response)
+
+
+def _send(environ, start_response, headers, content_type, body):
+    headers.append(("Content-Type", content_type))
+    headers.append(("Content-Length", str(len(body))))
+    start_response("200 OK", headers)
+    return [] if environ.get("REQUEST_METHOD") == "HEAD" else [body]
+
+
+def _accepted_encodings(environ):
+    accepted = set()
+    for item in environ.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _not_modified(environ, etag):
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH", "")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
@@ -0,0 +1,439 @@
+import os
+import json
+import base64
+import logging
+from urllib.parse import urlparse, quote, unquote
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from subsystems import registry, profile
+from compression import decompressor
+from storage_router import targets_from_config
+from loop_monitor import monitor as loop_monitor
+from selections import SelectionStore, verify_keys
+from browser_uploads import uploads, UploadError
+from encryption import ObjectCipher, load_master_key, metadata_from_headers
+from media_meta import sidecars, sidecar_key
+from key_layout import display_name
+from key_migration import migration
+from zip_stream import ZipEntry, stream_zip, archive_size, entry_names, READ_CHUNK
+from web_assets import AssetCache, AssetMiddleware, PageShell, CONFIG_SENTINEL
+
+logger = logging.getLogger(__name__)
+
+RENDER_URL = config.RENDER_URL
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+PLAYER_CACHE_CONTROL = "public, max-age=3600"
+STREAM_CHUNK_SIZE = 256 * 1024
+# Only presigned URLs for a configured storage target (its exact scheme and host) may be proxied through /stream
+STREAM_TARGET_HOSTS = {(t.presigner.scheme, t.host) for t in targets_from_config(config)}
+ZIP_MAX_ENTRIES = 1000
+ZIP_HEAD_WORKERS = 16
+
+ENCRYPTION_MASTER_KEY = load_master_key(config.ENCRYPTION_KEY)
+
+selections = SelectionStore(config.SELECTIONS_FILE)
+
+
+def decode_url(encoded_url):
+    """Decode a URL-safe base64 URL from a player/stream path"""
+    padding = 4 - (len(encoded_url) % 4)
+    encoded_url += '=' * padding
+    return base64.urlsafe_b64decode(encoded_url).decode()
+
+
+def _init_stream_session():
+    """Pooled HTTP session for proxying objects from Wasabi"""
+    requests = profile.timed_import("requests")
+    http = requests.Session()
+    http.mount("https://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=32))
+    return http
+
+
+stream_session = registry.register("stream", _init_stream_session)
+
+
+def _storage_router():
+    """The bot's storage router (registered by bot.py when both tiers share a process)"""
+    subsystem = registry.subsystems.get("s3")
+    return subsystem.get() if subsystem else None
+
+
+def _object_key(url):
+    """Storage key behind a presigned (or /stream) link to one of our targets, else None"""
+    stream_prefix = f"{RENDER_URL}/stream/"
+    if RENDER_URL and url.startswith(stream_prefix):
+        try:
+            url = decode_url(url[len(stream_prefix):].split('?', 1)[0])
+        except Exception:
+            return None
+    router = _storage_router()
+    if not router:
+        return None
+    parsed = urlparse(url)
+    for target in router.targets.values():
+        prefix = target.presigner.path_prefix
+        if parsed.netloc == target.host and parsed.path.startswith(prefix):
+            return unquote(parsed.path[len(prefix):])
+    return None
+
+
+def _load_sidecar(key):
+    router = _storage_router()
+    if not router:
+        return None
+    target = router.target_for(sidecar_key(key))
+    try:
+        body = target.client.get_object(Bucket=target.bucket, Key=sidecar_key(key))['Body']
+        try:
+            return json.loads(body.read())
+        finally:
+            body.close()
+    except Exception as e:
+        logger.debug(f"No sidecar for {key}: {e}")
+        return None
+
+
+def player_meta(url):
+    """Poster, duration, dimensions, MIME type and moov range for a player link (None if unknown)"""
+    key = _object_key(url)
+    return sidecars.get(key, _load_sidecar) if key else None
+
+
+def _object_chunks(target, key, encoding, cipher=None):
+    """Read an object in chunks, undoing its stored Content-Encoding or encryption"""
+    body = target.client.get_object(Bucket=target.bucket, Key=key)['Body']
+    decoder = decompressor(encoding) if encoding else None
+    try:
+        if cipher:
+            yield from cipher.decrypt_stream(body.iter_chunks(READ_CHUNK))
+            return
+        for chunk in body.iter_chunks(READ_CHUNK):
+            yield decoder.decompress(chunk) if decoder else chunk
+        if decoder:
+            yield decoder.flush()
+    finally:
+        body.close()
+
+
+def _zip_entries(router, keys):
+    """HEAD every object (in parallel) to get archive names, sizes and dates before streaming"""
+    def head(key):
+        target = router.target_for(key)
+        return target, target.client.head_object(Bucket=target.bucket, Key=key)
+
+    with ThreadPoolExecutor(max_workers=min(ZIP_HEAD_WORKERS, len(keys))) as pool:
+        heads = list(pool.map(head, keys))
+
+    entries = []
+    names = entry_names([display_name(key) for key in keys])
+    for key, name, (target, info) in zip(keys, names, heads):
+        encoding = info.get('ContentEncoding')
+        metadata = info.get('Metadata', {})
+        cipher = ObjectCipher.from_metadata(ENCRYPTION_MASTER_KEY, metadata) if metadata.get('encryption') else None
+        if cipher:
+            size = cipher.size
+        elif encoding:
+            # Compressed at upload: the archive holds the original bytes
+            original = info.get('Metadata', {}).get('original-size')
+            size = int(original) if original else None
+        else:
+            size = info['ContentLength']
+        entries.append(ZipEntry(
+            name, size,
+            lambda target=target, key=key, encoding=encoding, cipher=cipher: _object_chunks(target, key, encoding, cipher),
+            info.get('LastModified')
+        ))
+    return entries
+
+
+# --- Flask Web Server for Player ---
+def _parse_range(header, size):
+    """A single "bytes=" range as inclusive (start, end); None if not usable, False if unsatisfiable"""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            return (max(0, size - length), size - 1) if length and size else False
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    return (start, end) if start <= end and start < size else False
+
+
+def create_web_app():
+    """Build the Flask app (Flask is only imported when the web tier starts)"""
+    flask = profile.timed_import("flask")
+    web_app = flask.Flask(__name__, template_folder="templates", static_folder=None)
+
+    # Render and precompress everything static once; only player parameters vary per request
+    with profile.phase("web:assets"):
+        assets = AssetCache(STATIC_DIR)
+        assets.add_static("player.css", "text/css; charset=utf-8")
+        assets.add_static("player.js", "application/javascript; charset=utf-8")
+        templates = web_app.jinja_env
+        assets.add_page("/", templates.get_template('index.html').render(render_url=RENDER_URL).encode())
+        assets.add_page("/about", templates.get_template('about.html').render(render_url=RENDER_URL).encode())
+        player_shell = PageShell(templates.get_template('player.html').render(
+            asset_url=assets.asset_url,
+            player_config=CONFIG_SENTINEL
+        ))
+        assets.add_static("upload.js", "application/javascript; charset=utf-8")
+        upload_shell = PageShell(templates.get_template('upload.html').render(
+            asset_url=assets.asset_url,
+            upload_config=CONFIG_SENTINEL
+        ))
+
+    def player(environ, start_response, rest):
+        """/player/<file_type>/<encoded_url>: cached shell plus per-video JSON"""
+        file_type, _, encoded_url = rest.partition('/')
+        try:
+            # Decode the URL
+            video_url = decode_url(encoded_url)
+        except Exception as e:
+            start_response("400 Bad Request", [("Content-Type", "text/plain; charset=utf-8")])
+            return [f"Error: {str(e)}".encode()]
+
+        body = player_shell.render({"media_type": file_type, "media_url": video_url, "meta": player_meta(video_url)})
+        return assets.serve_dynamic(environ, start_response, body, PLAYER_CACHE_CONTROL)
+
+    def upload_page(environ, start_response, token):
+        """/upload/<token>: cached shell plus the token; the browser talks to storage directly"""
+        if '/' in token or not uploads.authorize(token):
+            start_response("404 Not Found", [("Content-Type", "text/plain; charset=utf-8")])
+            return [b"This upload link is invalid or has expired. Send /upload to the bot for a new one."]
+        body = upload_shell.render({"token": token, "parallel": config.BROWSER_UPLOAD_PARALLEL})
+        return assets.serve_dynamic(environ, start_response, body, "private, no-store")
+
+    # Static assets, pages and the player bypass Flask routing entirely
+    middleware = AssetMiddleware(web_app.wsgi_app, assets)
+    middleware.route_prefix('/player/', player)
+    middleware.route_prefix('/upload/', upload_page)
+    web_app.wsgi_app = middleware
+
+    def decrypted_response(http, url, upstream):
+        """Decrypt an encrypted object on the fly; a range fetches and opens only the cipher chunks it covers"""
+        try:
+            cipher = ObjectCipher.from_metadata(ENCRYPTION_MASTER_KEY, metadata_from_headers(upstream.headers))
+        except Exception as e:
+            upstream.close()
+            logger.error(f"Cannot decrypt streamed object: {e}")
+            return "Error: this file cannot be decrypted", 500
+
+        headers = {
+            name: upstream.headers[name]
+            for name in ('Content-Type', 'ETag', 'Last-Modified', 'Content-Disposition')
+            if name in upstream.headers
+        }
+        headers['Accept-Ranges'] = 'bytes'
+        byte_range = None
+        if flask.request.headers.get('Range'):
+            byte_range = _parse_range(flask.request.headers['Range'], cipher.size)
+        if byte_range is False:
+            upstream.close()
+            return flask.Response(status=416, headers={'Content-Range': f"bytes */{cipher.size}"})
+
+        status = 200
+        start, end, first_chunk = 0, cipher.size - 1, 0
+        if byte_range or upstream.status_code == 206:
+            # The client's range addressed plaintext; fetch the matching ciphertext instead
+            upstream.close()
+            if byte_range:
+                start, end = byte_range
+                status = 206
+                headers['Content-Range'] = f"bytes {start}-{end}/{cipher.size}"
+            cipher_start, cipher_end, first_chunk = cipher.ciphertext_range(start, max(start, end))
+            upstream = http.get(url, headers={'Range': f"bytes={cipher_start}-{cipher_end}"}, stream=True, timeout=30)
+        if upstream.status_code not in (200, 206):
+            upstream.close()
+            return f"Error: storage returned {upstream.status_code}", 502
+        length = end - start + 1
+        headers['Content-Length'] = str(length)
+
+        def generate():
+            try:
+                yield from cipher.decrypt_stream(
+                    upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False),
+                    first_chunk, start - first_chunk * cipher.chunk_size, length
+                )
+            finally:
+                upstream.close()
+
+        return flask.Response(generate(), status=status, headers=headers, direct_passthrough=True)
+
+    @web_app.route('/stream/<encoded_url>')
+    def stream(encoded_url):
+        """Proxy an object, decoding its stored Content-Encoding for clients that can't"""
+        try:
+            url = decode_url(encoded_url)
+        except Exception:
+            return "Error: invalid link", 400
+        parsed = urlparse(url)
+        if (parsed.scheme, parsed.netloc) not in STREAM_TARGET_HOSTS:
+            return "Error: unsupported link", 400
+
+        http = stream_session.get()
+        if not http:
+            return "Error: streaming unavailable", 503
+
+        headers = {}
+        if flask.request.headers.get('Range'):
+            headers['Range'] = flask.request.headers['Range']
+        upstream = http.get(url, headers=headers, stream=True, timeout=30)
+        if upstream.headers.get('x-amz-meta-encryption'):
+            # Only links the bot signed for this key are decrypted; anything else gets the ciphertext as stored
+            args = flask.request.args
+            key = _object_key(url)
+            if key and verify_keys(config.LINK_SIGNING_KEY, [key], args.get('expires'), args.get('sig'), scope="stream"):
+                return decrypted_response(http, url, upstream)
+
+        encoding = upstream.headers.get('Content-Encoding')
+        if encoding and 'Range' in headers:
+            # Ranges address the encoded bytes; retry for the whole object instead
+            upstream.close()
+            upstream = http.get(url, stream=True, timeout=30)
+
+        response_headers = {
+            name: upstream.headers[name]
+            for name in ('Content-Type', 'ETag', 'Last-Modified', 'Content-Disposition', 'Content-Range', 'Accept-Ranges')
+            if name in upstream.headers
+        }
+        decoder = None
+        if encoding:
+            response_headers.pop('Accept-Ranges', None)
+            response_headers.pop('Content-Range', None)
+            if encoding in flask.request.accept_encodings:
+                response_headers['Content-Encoding'] = encoding
+                if 'Content-Length' in upstream.headers:
+                    response_headers['Content-Length'] = upstream.headers['Content-Length']
+            else:
+                decoder = decompressor(encoding)
+                if decoder is None:
+                    upstream.close()
+                    return f"Error: cannot decode {encoding}", 406
+        elif 'Content-Length' in upstream.headers:
+            response_headers['Content-Length'] = upstream.headers['Content-Length']
+
+        def generate():
+            try:
+                for chunk in upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False):
+                    yield decoder.decompress(chunk) if decoder else chunk
+                if decoder:
+                    yield decoder.flush()
+            finally:
+                upstream.close()
+
+        return flask.Response(generate(), status=upstream.status_code, headers=response_headers, direct_passthrough=True)
+
+    @web_app.route('/zip/<token>')
+    @web_app.route('/zip')
+    def zip_download(token=None):
+        """Stream a saved selection (or an HMAC-signed key list) as one ZIP64 archive"""
+        if token:
+            selection = selections.get(token)
+            if not selection:
+                return "Error: link expired or unknown", 404
+            keys, name = selection["keys"], selection.get("name")
+            owner = selection.get("owner")
+        else:
+            args = flask.request.args
+            keys = args.getlist('key')
+            if not keys or not verify_keys(config.LINK_SIGNING_KEY, keys, args.get('expires'), args.get('sig')):
+                return "Error: invalid or expired link", 403
+            name = args.get('name')
+            owner = None  # The bot checked ownership before signing
+        if len(keys) > ZIP_MAX_ENTRIES:
+            return f"Error: at most {ZIP_MAX_ENTRIES} files per archive", 400
+        # Links made before a key migration still name the original keys
+        keys = [migration.resolve(key) for key in keys]
+
+        router = _storage_router()
+        if not router:
+            return "Error: storage unavailable", 503
+        if owner not in (None, config.ADMIN_ID) and any(router.owner(key) != owner for key in keys):
+            return "Error: this selection includes files you didn't upload", 403
+        try:
+            entries = _zip_entries(router, keys)
+        except Exception as e:
+            logger.warning(f"ZIP selection failed: {e}")
+            return "Error: one or more files are missing", 404
+
+        filename = (name or f"files_{len(keys)}") + ".zip"
+        headers = {
+            'Content-Disposition': f"attachment; filename=\"{filename.encode('ascii', 'replace').decode()}\"; "
+                                   f"filename*=UTF-8''{quote(filename)}",
+            'Cache-Control': 'private, no-store',
+        }
+        size = archive_size(entries)
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return flask.Response(stream_zip(entries), mimetype='application/zip', headers=headers, direct_passthrough=True)
+
+    def upload_api(call):
+        """Run a browser-upload step against the storage router, mapping failures to JSON errors"""
+        router = _storage_router()
+        if not router:
+            return flask.jsonify({"error": "Storage is unavailable, try again shortly"}), 503
+        try:
+            return flask.jsonify(call(router, flask.request.get_json(silent=True) or {}))
+        except UploadError as e:
+            return flask.jsonify({"error": str(e)}), e.status
+        except Exception as e:
+            logger.error(f"Browser upload step failed: {e}")
+            return flask.jsonify({"error": "Storage error, please retry"}), 502
+
+    @web_app.route('/upload/<token>/create', methods=['POST'])
+    def upload_create(token):
+        return upload_api(lambda router, body: uploads.start(
+            router, token, body.get('name'), body.get('size'), body.get('type') or None
+        ))
+
+    @web_app.route('/upload/<token>/sign', methods=['POST'])
+    def upload_sign(token):
+        return upload_api(lambda router, body: {
+            "urls": uploads.sign(router, token, body.get('upload_id'), body.get('parts') or [])
+        })
+
+    @web_app.route('/upload/<token>/complete', methods=['POST'])
+    def upload_complete(token):
+        return upload_api(lambda router, body: uploads.complete(
+            router, token, body.get('upload_id'), body.get('parts') or []
+        ))
+
+    @web_app.route('/upload/<token>/abort', methods=['POST'])
+    def upload_abort(token):
+        return upload_api(lambda router, body: uploads.abort(router, token, body.get('upload_id')) or {})
+
+    @web_app.route('/health')
+    def health():
+        return flask.jsonify({"status": "healthy", "service": "wasabi_bot_player"})
+
+    @web_app.route('/metrics')
+    def metrics():
+        """Prometheus text metrics: bot event-loop lag histogram and blocking call sites"""
+        return flask.Response(loop_monitor.prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @web_app.route('/ready')
+    def ready():
+        """Readiness probe with per-subsystem state and the startup profile"""
+        readiness = registry.readiness()
+        readiness["startup"] = profile.report()
+        return flask.jsonify(readiness), 200 if readiness["ready"] else 503
+
+    return web_app
+
+
+web = registry.register("web", create_web_app, critical=True)
+
+
+def run_web_server():
+    """Start the web tier (blocking, run it in a thread)"""
+    web_app = web.get()
+    if not web_app:
+        logger.error("❌ Web server could not be created")
+        return
+    web_app.run(host='0.0.0.0', port=config.WEB_PORT, debug=False, threaded=True)
@@ -0,0 +1,170 @@
+import re
+import zlib
+import queue
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 1024 * 1024
+READ_AHEAD_CHUNKS = 8  # Bounded buffer per archive: memory stays ~8MB whatever the size
+
+ZIP64_VERSION = 45
+FLAGS = 0x0808  # Bit 3: CRC/sizes follow in a data descriptor, bit 11: UTF-8 names
+UNIX_FILE_ATTRS = (0o100644 << 16)
+UPLOAD_PREFIX = re.compile(r"^\d{9,}_")  # "{timestamp}_" added by file_handler
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_ZIP64_LOCAL_EXTRA = struct.Struct("<HHQQ")
+_DATA_DESCRIPTOR = struct.Struct("<IIQQ")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_ZIP64_CENTRAL_EXTRA = struct.Struct("<HHQQQ")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+
+
+class ZipEntry:
+    """One archive member: its name, size (if known up front) and a way to open its bytes"""
+
+    def __init__(self, name, size, opener, modified=None):
+        self.name = name
+        self.size = size  # None if unknown until streamed (no Content-Length then)
+        self.opener = opener  # () -> iterable of byte chunks (called in the read-ahead thread)
+        self.dos_time, self.dos_date = _dos_datetime(modified)
+        self.encoded_name = name.encode("utf-8")
+
+    def local_header(self):
+        return _LOCAL_HEADER.pack(
+            0x04034B50, ZIP64_VERSION, FLAGS, 0, self.dos_time, self.dos_date,
+            0, 0xFFFFFFFF, 0xFFFFFFFF, len(self.encoded_name), _ZIP64_LOCAL_EXTRA.size
+        ) + self.encoded_name + _ZIP64_LOCAL_EXTRA.pack(0x0001, 16, 0, 0)
+
+    def central_header(self, crc, size, offset):
+        return _CENTRAL_HEADER.pack(
+            0x02014B50, (3 << 8) | ZIP64_VERSION, ZIP64_VERSION, FLAGS, 0, self.dos_time, self.dos_date,
+            crc, 0xFFFFFFFF, 0xFFFFFFFF, len(self.encoded_name), _ZIP64_CENTRAL_EXTRA.size, 0, 0, 0,
+            UNIX_FILE_ATTRS, 0xFFFFFFFF
+        ) + self.encoded_name + _ZIP64_CENTRAL_EXTRA.pack(0x0001, 24, size, size, offset)
+
+
+def archive_size(entries):
+    """Exact archive length when every entry size is known, else None"""
+    if any(entry.size is None for entry in entries):
+        return None
+    total = _ZIP64_END.size + _ZIP64_LOCATOR.size + _END.size
+    for entry in entries:
+        name = len(entry.encoded_name)
+        total += _LOCAL_HEADER.size + name + _ZIP64_LOCAL_EXTRA.size + entry.size + _DATA_DESCRIPTOR.size
+        total += _CENTRAL_HEADER.size + name + _ZIP64_CENTRAL_EXTRA.size
+    return total
+
+
+def stream_zip(entries, read_ahead=READ_AHEAD_CHUNKS):
+    """Yield a ZIP64 archive of stored (uncompressed) entries, computing CRCs as data passes through.
+
+    Entry bodies are pulled by a helper thread into a bounded queue, so the
+    next object is already being fetched while the client drains the current one.
+    """
+    chunks = queue.Queue(maxsize=read_ahead)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_entries, args=(entries, chunks, stop), name="zip-read-ahead", daemon=True)
+    reader.start()
+
+    offset = 0
+    central = []
+    try:
+        for index, entry in enumerate(entries):
+            header = entry.local_header()
+            yield header
+            start = offset
+            offset += len(header)
+
+            crc = 0
+            size = 0
+            while True:
+                item = chunks.get()
+                if isinstance(item, BaseException):
+                    raise item
+                if item is None:  # End of this entry
+                    break
+                crc = zlib.crc32(item, crc)
+                size += len(item)
+                yield item
+            if entry.size is not None and size != entry.size:
+                raise IOError(f"{entry.name} changed while streaming ({size} != {entry.size} bytes)")
+
+            descriptor = _DATA_DESCRIPTOR.pack(0x08074B50, crc, size, size)
+            yield descriptor
+            offset += size + len(descriptor)
+            central.append(entry.central_header(crc, size, start))
+
+        central_dir = b"".join(central)
+        yield central_dir
+        zip64_end_offset = offset + len(central_dir)
+        count = len(entries)
+        yield (
+            _ZIP64_END.pack(0x06064B50, _ZIP64_END.size - 12, (3 << 8) | ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                            count, count, len(central_dir), offset)
+            + _ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+            + _END.pack(0x06054B50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+        )
+    finally:
+        # Client went away or an object failed: stop the reader and free its slot
+        stop.set()
+
+
+def _read_entries(entries, chunks, stop):
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for entry in entries:
+            body = entry.opener()
+            try:
+                for chunk in body:
+                    if chunk and not put(chunk):
+                        return
+            finally:
+                close = getattr(body, "close", None)
+                if close:
+                    close()
+            if not put(None):
+                return
+    except Exception as e:
+        logger.error(f"ZIP read-ahead failed: {e}")
+        put(e)
+
+
+def entry_names(keys):
+    """Archive member names: upload timestamps stripped, duplicates numbered"""
+    seen = set()
+    names = []
+    for key in keys:
+        prefix, _, base = key.rpartition("/")
+        base = UPLOAD_PREFIX.sub("", base) or base
+        name = f"{prefix}/{base}" if prefix else base
+        stem, dot, ext = name.rpartition(".")
+        candidate, counter = name, 2
+        while candidate in seen:
+            candidate = f"{stem} ({counter}).{ext}" if dot and stem else f"{name} ({counter})"
+            counter += 1
+        seen.add(candidate)
+        names.append(candidate)
+    return names
+
+
+def _dos_datetime(modified):
+    if modified is None or modified.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return (
+        (modified.hour << 11) | (modified.minute << 5) | (modified.second // 2),
+        ((modified.year - 1980) << 9) | (modified.month << 5) | modified.day,
+    )